@@ -0,0 +1,233 @@
+"""
+Author: Isaac Arroyo
+Notes: Precipitación de los estados y nacional a partir de la de los
+       municipios, con matrices dispersas de agregación, para no extraer
+       el nivel `ent` en Earth Engine (`list_fc = ['mun']`).
+
+Con los pesos de cada municipio (área o población) se crean las matrices
+de promedios ponderados:
+
+* `matriz_ent` (estados x municipios): El peso de cada municipio dividido
+  entre la suma de los pesos de su estado (los 2 primeros caracteres de la
+  `cvegeo`).
+* `matriz_nac` (1 x estados): La suma de los pesos de cada estado dividida
+  entre la suma nacional.
+* `matriz_ent_nac` (1 + estados x municipios): El renglón nacional
+  (`matriz_nac @ matriz_ent`) y los estados, en el orden de
+  `db_mex_pr_ent_nac_*` (`cvegeo` `"00"` al inicio).
+
+Todos los años y meses (o la columna `mean`) de todos los municipios se
+agregan con una sola multiplicación de matrices (`func_agregar_ent_nac`).
+Los municipios sin dato no cuentan: el promedio es
+`(M @ X) / (M @ validos)`, como en **`pesos_chirps.py`**.
+
+A diferencia de **`documentacion_wide2long_chirps.R`**, donde el valor
+nacional es el promedio simple de los 32 estados, el promedio nacional
+pondera cada estado por su área (o su población).
+
+Pesos (`func_matrices_agregacion` necesita el peso de todos los
+municipios; si falta alguno se detiene con "Municipios sin peso"):
+
+* `func_pesos_area_00mun`: Área (km^2) de los 2,475 municipios de
+  `GobiernoMexicano/geometrias/og_geoms/00mun.shp` (Marco Geoestadístico
+  2023 de INEGI), las mismas geometrías del _asset_ `00mun` de Earth
+  Engine. Es la fuente completa de pesos. El repositorio únicamente guarda
+  los archivos `.dbf`, `.shx`, `.prj` y `.cpg`: el `.shp` se descarga de
+  INEGI (ver **`GobiernoMexicano/geometrias/README.py`**) y se lee con
+  `geopandas`.
+* `func_pesos_area`: Área de las geometrías de uno o varios archivos. Los
+  GeoJSON de `GobiernoMexicano/geometrias/mod_geoms/geom_ent_mun_XX.geojson`
+  únicamente cubren 18 estados, por lo que no alcanzan para el nacional.
+* `func_pesos_poblacion`: Columna de población de un CSV (p. ej.
+  proyecciones de CONAPO por municipio, con una fila por municipio).
+
+**Actualización sin `ent`**: Con los pesos de `00mun.shp` ya no hace falta
+extraer el nivel `ent` en Earth Engine:
+
+1. `func_actualizar_chirps(limit_date, list_fc = ('mun',))`
+   (**`incremental_chirps.py`**) o `func_lote_chirps(..., list_fc =
+   ['mun'])` (**`lotes_chirps.py`**)
+2. `func_wide2long_chirps(pesos_mun = func_pesos_area_00mun())`
+   (**`wide2long_chirps.py`**, o `python wide2long_chirps.py
+   [n_procesos] [path_00mun]`)
+
+Sin `pesos_mun`, `func_wide2long_chirps` lee los archivos `ent` y crea
+las mismas bases de datos que la versión en R (nacional como promedio
+simple de los estados), por lo que en ese caso las extracciones `ent`
+siguen siendo necesarias.
+
+Uso (comparación con los archivos `ent` de Earth Engine):
+    python agregacion_chirps.py [path_00mun]
+"""
+
+# = = = Imports = = = #
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from geometrias_chirps import func_leer_geometrias
+
+radio_tierra_m = 6378137.0
+cvegeo_nacional = "00"
+
+path2repo = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))))
+path_00mun_default = os.path.join(path2repo, "GobiernoMexicano", "geometrias",
+                                  "og_geoms", "00mun.shp")
+
+# = = = Pesos = = = #
+
+# = = Área de un anillo sobre la esfera (retorna: float) = = #
+def func_area_anillo(anillo):
+    # Fórmula de Chamberlain y Duquette (la misma de `turf.area`), en m^2
+    if len(anillo) < 3:
+        return 0.0
+    lon, lat = np.radians(np.asarray(anillo, dtype = float)[:, :2]).T
+    lon_sig, lat_sig = np.roll(lon, -1), np.roll(lat, -1)
+    return abs(np.sum((lon_sig - lon) * (2 + np.sin(lat) + np.sin(lat_sig))) *
+               radio_tierra_m ** 2 / 2)
+
+# = = Área de un Polygon o MultiPolygon en km^2 (retorna: float) = = #
+def func_area_geometria(geometria):
+    if geometria['type'] == 'Polygon':
+        poligonos = [geometria['coordinates']]
+    elif geometria['type'] == 'MultiPolygon':
+        poligonos = geometria['coordinates']
+    else:
+        raise ValueError(f"Geometría no soportada: {geometria['type']}")
+
+    # Exterior menos huecos
+    return sum(func_area_anillo(poligono[0]) -
+               sum(func_area_anillo(hueco) for hueco in poligono[1:])
+               for poligono in poligonos) / 1e6
+
+# = = Pesos por área de las geometrías (retorna: pd.Series) = = #
+def func_pesos_area(list_paths_geometrias, col_cvegeo = "cve_geo"):
+    dict_areas = dict()
+    for path_geometrias in list_paths_geometrias:
+        for geometria in func_leer_geometrias(path_geometrias):
+            cvegeo = geometria['propiedades'][col_cvegeo]
+            dict_areas[cvegeo] = (dict_areas.get(cvegeo, 0) +
+                                  func_area_geometria(geometria['geometria']))
+    return pd.Series(dict_areas, name = "area_km2").sort_index()
+
+# = = Pesos por área de los municipios de `00mun` (retorna: pd.Series) = = #
+def func_pesos_area_00mun(path_00mun = path_00mun_default):
+    if not os.path.exists(path_00mun):
+        raise FileNotFoundError(
+            f"No existe {path_00mun}: descargar el Marco Geoestadístico de "
+            "INEGI (ver GobiernoMexicano/geometrias/README.py)")
+    return func_pesos_area([path_00mun], col_cvegeo = "CVEGEO")
+
+# = = Pesos por población de un CSV (retorna: pd.Series) = = #
+def func_pesos_poblacion(path_csv,
+                         col_cvegeo = "cve_geo",
+                         col_poblacion = "poblacion",
+                         col_year = None,
+                         n_year = None):
+    # Con `col_year` y `n_year` se usa la población de un año
+    datframe = pd.read_csv(path_csv, dtype = {col_cvegeo: str})
+    if col_year is not None:
+        datframe = datframe[datframe[col_year] == n_year]
+    return (datframe.groupby(col_cvegeo)[col_poblacion].sum()
+            .rename("poblacion").astype(float))
+
+# = = = Matrices = = = #
+
+# = = Matrices de agregación municipio -> estado -> nacional (retorna: dict) = = #
+def func_matrices_agregacion(list_cvegeo, pesos):
+    # `pesos`: pd.Series con índice `cvegeo` (p. ej. `func_pesos_area`)
+    cvegeo_mun = pd.Index(sorted(list_cvegeo))
+    pesos_mun = pesos.reindex(cvegeo_mun).to_numpy(dtype = np.float64)
+    if np.isnan(pesos_mun).any() or (pesos_mun < 0).any():
+        faltantes = cvegeo_mun[~(pesos_mun >= 0)]
+        raise ValueError(f"Municipios sin peso: {', '.join(faltantes[:10])}"
+                         f"{' ...' if len(faltantes) > 10 else ''}")
+
+    cvegeo_ent, idx_ent = np.unique(cvegeo_mun.str[:2], return_inverse = True)
+    suma_ent = np.bincount(idx_ent, weights = pesos_mun,
+                           minlength = len(cvegeo_ent))
+    if (suma_ent == 0).any():
+        raise ValueError("Estados con suma de pesos igual a 0")
+
+    matriz_ent = sparse.csr_matrix(
+        (pesos_mun / suma_ent[idx_ent], (idx_ent, np.arange(len(cvegeo_mun)))),
+        shape = (len(cvegeo_ent), len(cvegeo_mun)))
+    matriz_nac = sparse.csr_matrix((suma_ent / suma_ent.sum())[None, :])
+
+    return dict(cvegeo_mun = cvegeo_mun,
+                cvegeo_ent = pd.Index(cvegeo_ent),
+                cvegeo_ent_nac = pd.Index([cvegeo_nacional] + list(cvegeo_ent)),
+                matriz_ent = matriz_ent,
+                matriz_nac = matriz_nac,
+                matriz_ent_nac = sparse.vstack([matriz_nac @ matriz_ent,
+                                                matriz_ent]).tocsr())
+
+# = = Promedio ponderado sin datos faltantes (retorna: np.ndarray) = = #
+def func_promedio_matriz(matriz, valores):
+    # `valores`: (municipios x columnas)
+    validos = ~np.isnan(valores)
+    suma = matriz @ np.where(validos, valores, 0.0)
+    suma_pesos = matriz @ validos.astype(np.float64)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        return np.asarray(suma) / np.asarray(suma_pesos)
+
+# = = Estados y nacional a partir de los municipios (retorna: pd.DataFrame) = = #
+def func_agregar_ent_nac(datframe_mun, matrices):
+    # `datframe_mun`: formato de `ee_imports` (`cvegeo`, `n_year` y
+    # columnas de precipitación). Resultado con las mismas columnas, el
+    # nacional (`"00"`) al inicio, como `func_agregar_nacional`
+    cols_valores = datframe_mun.columns.drop(['cvegeo', 'n_year'])
+    idx_mun = matrices['cvegeo_mun'].get_indexer(datframe_mun['cvegeo'])
+    if (idx_mun < 0).any():
+        raise ValueError("Municipios que no están en las matrices de agregación")
+    codigos, years = pd.factorize(datframe_mun['n_year'], sort = True)
+
+    # Una columna por año y columna de precipitación
+    n_cols = len(cols_valores)
+    valores = np.full((len(matrices['cvegeo_mun']), len(years) * n_cols), np.nan)
+    valores[idx_mun[:, None], codigos[:, None] * n_cols + np.arange(n_cols)] = \
+        datframe_mun[cols_valores].to_numpy(dtype = np.float64)
+
+    agregados = func_promedio_matriz(matrices['matriz_ent_nac'], valores)
+    agregados = agregados.reshape(len(matrices['cvegeo_ent_nac']), len(years), n_cols)
+
+    # Nacional (todos los años) y después los estados de cada año
+    cvegeo = np.asarray(matrices['cvegeo_ent_nac'])
+    datframe_nac = pd.DataFrame(agregados[0], columns = cols_valores)
+    datframe_nac.insert(0, 'cvegeo', cvegeo[0])
+    datframe_nac.insert(1, 'n_year', np.asarray(years))
+    datframe_ent = pd.DataFrame(agregados[1:].transpose(1, 0, 2).reshape(-1, n_cols),
+                                columns = cols_valores)
+    datframe_ent.insert(0, 'cvegeo', np.tile(cvegeo[1:], len(years)))
+    datframe_ent.insert(1, 'n_year', np.repeat(np.asarray(years), len(cvegeo) - 1))
+    return pd.concat([datframe_nac, datframe_ent], ignore_index = True)
+
+if __name__ == "__main__":
+    from wide2long_chirps import func_leer_ee_imports
+
+    path_00mun = sys.argv[1] if len(sys.argv) > 1 else path_00mun_default
+    pesos = func_pesos_area_00mun(path_00mun)
+
+    dict_ee = func_leer_ee_imports(list_llaves = [('mun', 'month'),
+                                                  ('ent', 'month')])
+    datframe_mun = dict_ee[('mun', 'month')]
+
+    tiempo_inicio = time.perf_counter()
+    matrices = func_matrices_agregacion(datframe_mun['cvegeo'].unique(), pesos)
+    datframe_ent_nac = func_agregar_ent_nac(datframe_mun, matrices)
+    print(f"Estados y nacional de {len(matrices['cvegeo_mun'])} municipios: "
+          f"{time.perf_counter() - tiempo_inicio:.3f} s")
+
+    # - - Comparación con la extracción `ent` de Earth Engine - - #
+    llave = ['cvegeo', 'n_year']
+    comparacion = pd.merge(datframe_ent_nac, dict_ee[('ent', 'month')],
+                           on = llave, suffixes = ('', '_ee'))
+    diferencia = np.nanmax(np.abs(comparacion['07'] - comparacion['07_ee']) /
+                           comparacion['07_ee'])
+    print(f"Diferencia relativa máxima con `ent` de Earth Engine (julio, "
+          f"{comparacion['cvegeo'].nunique()} estados): {diferencia:.2%}")
@@ -0,0 +1,105 @@
+"""
+Author: Isaac Arroyo
+Notes: Normales, desviaciones estándar y anomalías de cualquier periodo base
+       (p. ej. 1991 - 2020 en lugar de 1981 - 2010) a partir del cubo de
+       precipitación mensual (**`cubo_chirps.py`**), sin volver a recorrer
+       los años del periodo.
+
+Para cada geometría y mes se calculan las sumas acumuladas a lo largo de
+los años (sumas de prefijo) de:
+
+* el número de meses con datos (`n`),
+* la precipitación (`s`) y
+* la precipitación al cuadrado (`s2`).
+
+La suma de un periodo `[inicio, fin]` es la resta de dos sumas de prefijo
+(`s[fin + 1] - s[inicio]`), por lo que el promedio y la desviación estándar
+de cualquier periodo base se obtienen con 2 lecturas por celda.
+
+Para que la suma de cuadrados no pierda precisión (resta de números
+grandes y parecidos), los valores se centran con el promedio de todos los
+años de cada geometría y mes antes de acumularlos.
+"""
+
+# = = = Imports = = = #
+import numpy as np
+import pandas as pd
+
+# = = Sumas de prefijo a lo largo de los años (retorna: dict) = = #
+def func_crear_climatologia(cubo):
+    # `cubo`: resultado de `func_abrir_cubo` (geometría x año x mes)
+    valores = np.asarray(cubo['cubo'], dtype = np.float64)
+    validos = ~np.isnan(valores)
+    with np.errstate(invalid = 'ignore'):
+        centro = np.nanmean(valores, axis = 1, keepdims = True)
+    centro = np.nan_to_num(centro)
+    centrados = np.where(validos, valores - centro, 0)
+
+    # Fila de ceros al inicio: `n[:, k]` es la suma de los primeros k años
+    ceros = np.zeros((valores.shape[0], 1, 12))
+    return dict(cubo = cubo,
+                centro = centro,
+                n = np.concatenate([ceros, np.cumsum(validos, axis = 1)], axis = 1),
+                s = np.concatenate([ceros, np.cumsum(centrados, axis = 1)], axis = 1),
+                s2 = np.concatenate([ceros, np.cumsum(centrados ** 2, axis = 1)],
+                                    axis = 1))
+
+# = = Suma de un periodo de años (retorna: np.ndarray) = = #
+def func_suma_periodo(clima, llave, n_year_inicio, n_year_fin):
+    years = clima['cubo']['years']
+    inicio, fin = n_year_inicio - years[0], n_year_fin - years[0] + 1
+    if inicio < 0 or fin > len(years) or inicio >= fin:
+        raise ValueError(f"Periodo fuera del cubo: {n_year_inicio} - {n_year_fin}")
+    return clima[llave][:, fin] - clima[llave][:, inicio]
+
+# = = Normal y desviación estándar de un periodo base (retorna: dict) = = #
+def func_estadisticas_base(clima, n_year_inicio = 1981, n_year_fin = 2010,
+                           ddof = 1):
+    # Arreglos (geometría x mes). `ddof = 1`: desviación estándar muestral
+    # (como `sd` de R)
+    n = func_suma_periodo(clima, 'n', n_year_inicio, n_year_fin)
+    s = func_suma_periodo(clima, 's', n_year_inicio, n_year_fin)
+    s2 = func_suma_periodo(clima, 's2', n_year_inicio, n_year_fin)
+
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        media_centrada = s / n
+        varianza = (s2 - n * media_centrada ** 2) / (n - ddof)
+    return dict(n = n,
+                normal_pr_mm = media_centrada + clima['centro'][:, 0],
+                std_pr_mm = np.sqrt(np.maximum(varianza, 0)))
+
+# = = Anomalías con un periodo base (retorna: dict) = = #
+def func_anomalias_base(clima, n_year_inicio = 1981, n_year_fin = 2010):
+    # Arreglos (geometría x año x mes)
+    base = func_estadisticas_base(clima, n_year_inicio, n_year_fin)
+    valores = np.asarray(clima['cubo']['cubo'], dtype = np.float64)
+    normal = base['normal_pr_mm'][:, None, :]
+    normal_cumsum = np.cumsum(base['normal_pr_mm'], axis = 1)[:, None, :]
+
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        cumsum_pr_mm = np.cumsum(valores, axis = 2)
+        anomaly_pr_mm = valores - normal
+        cumulative_anomaly_pr_mm = cumsum_pr_mm - normal_cumsum
+        return dict(
+            pr_mm = valores,
+            cumsum_pr_mm = cumsum_pr_mm,
+            anomaly_pr_mm = anomaly_pr_mm,
+            anomaly_pr_prop = anomaly_pr_mm / normal,
+            zscore_pr = anomaly_pr_mm / base['std_pr_mm'][:, None, :],
+            cumulative_anomaly_pr_mm = cumulative_anomaly_pr_mm,
+            cumulative_anomaly_pr_prop = cumulative_anomaly_pr_mm / normal_cumsum)
+
+# = = Tabla de anomalías en formato long (retorna: pd.DataFrame) = = #
+def func_tabla_anomalias(clima, n_year_inicio = 1981, n_year_fin = 2010):
+    # Columnas como `db_mex_pr_mun_month` (`cvegeo`, `n_year`, `n_month`,
+    # precipitación y anomalías), con el periodo base indicado
+    dict_anomalias = func_anomalias_base(clima, n_year_inicio, n_year_fin)
+    n_cvegeo, n_years, _ = dict_anomalias['pr_mm'].shape
+
+    datframe = pd.DataFrame({
+        'cvegeo': np.repeat(clima['cubo']['cvegeo'], n_years * 12),
+        'n_year': np.tile(np.repeat(clima['cubo']['years'], 12), n_cvegeo),
+        'n_month': np.tile(np.arange(1, 13), n_cvegeo * n_years)})
+    for col, valores in dict_anomalias.items():
+        datframe[col] = valores.ravel()
+    return datframe
@@ -0,0 +1,210 @@
+"""
+Author: Isaac Arroyo
+Notes: Cubo de precipitación mensual (geometría x año x mes) guardado como
+       arreglo `float32` en disco y leído con `np.memmap`, para no volver a
+       leer los CSV de `data/ee_imports` cada vez que se necesita la serie de
+       un municipio o estado.
+
+* **Cubo**: Arreglo `(n_cvegeo, n_years, 12)` en un archivo `.npy`, con las
+  geometrías ordenadas por `cvegeo` y los años en orden. Los meses sin
+  datos (año en curso) son `NaN`.
+* **Índice**: Archivo `.json` con las claves (`cvegeo`), los años y la
+  llave de los archivos de `ee_imports` con los que se creó el cubo.
+* **Caché**: Los archivos se guardan en
+  `~/.cache/datos_facil_acceso/cubo_chirps` (o la carpeta indicada en la
+  variable de ambiente `DATOS_FACIL_ACCESO_CACHE`). Si cambian los archivos
+  de `ee_imports` (nombre, tamaño o fecha de modificación), el cubo se
+  vuelve a crear.
+
+El cubo se abre en modo lectura (`mmap_mode = "r"`): únicamente se leen
+del disco las páginas que se consultan, y varios procesos que abren el
+mismo archivo comparten esas páginas en memoria.
+
+Consultas:
+
+* `func_serie_cubo`: Serie de una geometría (años x meses, o los 12 meses
+  de un año). Es una vista del cubo (sin copia).
+* `func_rebanada_cubo`: Rango de años y meses de una o varias geometrías.
+  Es una vista si las geometrías son consecutivas (o todas).
+* `func_agregado_cubo`: Suma anual, promedio por mes (normal) u otra
+  función sobre un eje.
+
+Uso:
+    python cubo_chirps.py [ent|mun]
+"""
+
+# = = = Imports = = = #
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from wide2long_chirps import func_leer_ee_imports, list_meses, path2chirpsdata
+
+path_cache_default = os.path.join(
+    os.environ.get(
+        "DATOS_FACIL_ACCESO_CACHE",
+        os.path.join(os.path.expanduser("~"), ".cache", "datos_facil_acceso")),
+    "cubo_chirps")
+path_ee_imports_default = os.path.join(path2chirpsdata, "ee_imports")
+
+# Cambiar si cambia la forma de crear el cubo
+version_cubo = "1"
+
+# = = Llave de los archivos de `ee_imports` (retorna: str) = = #
+def func_llave_cubo(fc_interes, path_ee_imports):
+    hash_cubo = hashlib.sha256()
+    for archivo in sorted(os.listdir(path_ee_imports)):
+        if archivo.startswith(f"mex_chirps_pr_mm_{fc_interes}_month_"):
+            estado = os.stat(os.path.join(path_ee_imports, archivo))
+            hash_cubo.update(
+                f"{archivo}|{estado.st_size}|{estado.st_mtime_ns}".encode("utf-8"))
+    hash_cubo.update(f"{fc_interes}|{version_cubo}".encode("utf-8"))
+    return hash_cubo.hexdigest()[:32]
+
+# = = Rutas del cubo y del índice (retorna: tupla) = = #
+def func_paths_cubo(fc_interes, path_cache):
+    return (os.path.join(path_cache, f"cubo_chirps_pr_mm_{fc_interes}.npy"),
+            os.path.join(path_cache, f"cubo_chirps_pr_mm_{fc_interes}.json"))
+
+# = = Crear cubo a partir de `ee_imports` (retorna: dict) = = #
+def func_crear_cubo(fc_interes = "mun",
+                    path_ee_imports = path_ee_imports_default,
+                    path_cache = path_cache_default,
+                    n_procesos = None):
+    datframe = func_leer_ee_imports(path_ee_imports = path_ee_imports,
+                                    n_procesos = n_procesos,
+                                    list_llaves = [(fc_interes, 'month')])
+    datframe = datframe[(fc_interes, 'month')]
+
+    list_cvegeo = sorted(datframe['cvegeo'].unique())
+    list_years = sorted(int(n_year) for n_year in datframe['n_year'].unique())
+    idx_cvegeo = np.searchsorted(list_cvegeo, datframe['cvegeo'].to_numpy())
+    idx_year = datframe['n_year'].astype(int).to_numpy() - list_years[0]
+
+    os.makedirs(path_cache, exist_ok = True)
+    path_cubo, path_indice = func_paths_cubo(fc_interes, path_cache)
+
+    # Se escribe en archivos temporales para no dejar cubos incompletos
+    path_temporal = f"{path_cubo}.tmp.npy"
+    cubo = np.lib.format.open_memmap(
+        path_temporal, mode = "w+", dtype = np.float32,
+        shape = (len(list_cvegeo), list_years[-1] - list_years[0] + 1, 12))
+    cubo[:] = np.nan
+    for i, mes in enumerate(list_meses):
+        if mes in datframe:
+            cubo[idx_cvegeo, idx_year, i] = datframe[mes].to_numpy()
+    cubo.flush()
+    del cubo
+
+    indice = dict(cvegeo = list_cvegeo,
+                  years = list(range(list_years[0], list_years[-1] + 1)),
+                  llave = func_llave_cubo(fc_interes, path_ee_imports))
+    with open(f"{path_indice}.tmp", "w", encoding = "utf-8") as archivo:
+        json.dump(indice, archivo)
+    os.replace(path_temporal, path_cubo)
+    os.replace(f"{path_indice}.tmp", path_indice)
+    print(f"Archivo: {path_cubo}")
+    return indice
+
+# = = Abrir cubo (lo crea si no existe o cambió `ee_imports`) (retorna: dict) = = #
+def func_abrir_cubo(fc_interes = "mun",
+                    path_ee_imports = path_ee_imports_default,
+                    path_cache = path_cache_default,
+                    n_procesos = None):
+    path_cubo, path_indice = func_paths_cubo(fc_interes, path_cache)
+
+    indice = None
+    if os.path.exists(path_cubo) and os.path.exists(path_indice):
+        with open(path_indice, encoding = "utf-8") as archivo:
+            indice = json.load(archivo)
+        if indice['llave'] != func_llave_cubo(fc_interes, path_ee_imports):
+            indice = None
+    if indice is None:
+        indice = func_crear_cubo(fc_interes, path_ee_imports, path_cache,
+                                 n_procesos)
+
+    return dict(cubo = np.load(path_cubo, mmap_mode = "r"),
+                idx_cvegeo = {cvegeo: i for i, cvegeo
+                              in enumerate(indice['cvegeo'])},
+                cvegeo = indice['cvegeo'],
+                years = np.array(indice['years']))
+
+# = = Índice de un año (retorna: int) = = #
+def func_idx_year(cubo, n_year):
+    idx_year = int(n_year) - int(cubo['years'][0])
+    if not 0 <= idx_year < len(cubo['years']):
+        raise KeyError(f"Año fuera del cubo: {n_year}")
+    return idx_year
+
+# = = Serie de una geometría (retorna: np.ndarray) = = #
+def func_serie_cubo(cubo, cvegeo, n_year = None):
+    # (n_years, 12), o (12,) si se indica el año
+    serie = cubo['cubo'][cubo['idx_cvegeo'][cvegeo]]
+    if n_year is not None:
+        serie = serie[func_idx_year(cubo, n_year)]
+    return serie
+
+# = = Rebanada de años, meses y geometrías (retorna: np.ndarray) = = #
+def func_rebanada_cubo(cubo,
+                       list_cvegeo = None,
+                       n_year_inicio = None,
+                       n_year_fin = None,
+                       mes_inicio = 1,
+                       mes_fin = 12):
+    # Años y meses inclusivos. Con `list_cvegeo = None` (todas) o con claves
+    # consecutivas en el cubo el resultado es una vista; con otras claves
+    # es una copia
+    rango_years = slice(
+        func_idx_year(cubo, n_year_inicio) if n_year_inicio else 0,
+        func_idx_year(cubo, n_year_fin) + 1 if n_year_fin else None)
+    rango_meses = slice(mes_inicio - 1, mes_fin)
+
+    if list_cvegeo is None:
+        idx_cvegeo = slice(None)
+    else:
+        idx = np.array([cubo['idx_cvegeo'][cvegeo] for cvegeo in list_cvegeo])
+        consecutivas = len(idx) > 0 and (np.diff(idx) == 1).all()
+        idx_cvegeo = slice(idx[0], idx[-1] + 1) if consecutivas else idx
+
+    return cubo['cubo'][idx_cvegeo, rango_years, rango_meses]
+
+# = = Agregado sobre un eje del cubo (retorna: np.ndarray) = = #
+def func_agregado_cubo(cubo,
+                       eje = "month",
+                       func = np.nansum,
+                       **kwargs_rebanada):
+    # `eje = "month"`: una cifra por geometría y año (p. ej. total anual)
+    # `eje = "year"`: una cifra por geometría y mes (p. ej. normal mensual
+    # con `func = np.nanmean`)
+    # `eje = "cvegeo"`: una cifra por año y mes (p. ej. promedio nacional)
+    # Se calcula en `float64`
+    rebanada = func_rebanada_cubo(cubo, **kwargs_rebanada)
+    axis = dict(cvegeo = 0, year = 1, month = 2)[eje]
+    return func(rebanada, axis = axis, dtype = np.float64)
+
+if __name__ == "__main__":
+    fc_interes = sys.argv[1] if len(sys.argv) > 1 else "mun"
+
+    tiempo_inicio = time.perf_counter()
+    cubo = func_abrir_cubo(fc_interes)
+    print(f"Abrir (o crear) cubo: {time.perf_counter() - tiempo_inicio:.2f} s "
+          f"{cubo['cubo'].shape}")
+
+    # - - Tiempo de consulta de series - - #
+    aleatorio = np.random.default_rng(0)
+    list_cvegeo = aleatorio.choice(cubo['cvegeo'], size = 10_000)
+    tiempo_inicio = time.perf_counter()
+    for cvegeo in list_cvegeo:
+        serie = func_serie_cubo(cubo, cvegeo)
+    print(f"Serie de una geometría: "
+          f"{(time.perf_counter() - tiempo_inicio) / len(list_cvegeo) * 1e6:.1f} µs")
+
+    tiempo_inicio = time.perf_counter()
+    normal = func_agregado_cubo(cubo, eje = "year", func = np.nanmean,
+                                n_year_inicio = 1981, n_year_fin = 2010)
+    print(f"Normal mensual 1981 - 2010 {normal.shape}: "
+          f"{time.perf_counter() - tiempo_inicio:.3f} s")
@@ -0,0 +1,230 @@
+"""
+Author: Isaac Arroyo
+Notes: Índices anuales de lluvia extrema (ETCCDI) a partir de la
+       precipitación diaria por geometría (`get_chirps_metrics(..., diario =
+       True)` en **`raster2csv_chirps.py`**).
+
+Índices (día con lluvia: 1 mm o más):
+
+* `cdd`: Máximo de días secos consecutivos (< 1 mm)
+* `cwd`: Máximo de días con lluvia consecutivos (>= 1 mm)
+* `r20mm`: Número de días con 20 mm o más
+* `r95p`: Precipitación total de los días con lluvia mayores al
+  percentil 95 de los días con lluvia del periodo base (1981 - 2010)
+* `rx1day`: Máxima precipitación en un día
+* `rx5day`: Máxima precipitación en 5 días consecutivos
+* `prcptot`: Precipitación total de los días con lluvia
+
+Los archivos se leen **año por año** (`func_iter_diario`), como una matriz
+(geometría x día), y los índices se calculan para todas las geometrías al
+mismo tiempo:
+
+* **Rachas** (`cdd`, `cwd`): La longitud de la racha en cada día es la
+  distancia al último día que no cumple la condición
+  (`np.maximum.accumulate`). La racha del último día del año pasa al año
+  siguiente, por lo que las rachas que cruzan de un año a otro se cuentan
+  completas en el año en el que terminan.
+* **Ventanas** (`rx5day`): Suma móvil con resta de sumas acumuladas; los
+  últimos 4 días del año pasan al año siguiente.
+* **Percentil** (`r95p`): Una primera lectura de los años del periodo base
+  guarda únicamente los días con lluvia para calcular el percentil 95 de
+  cada geometría.
+
+En memoria únicamente hay un año de datos diarios (y los días con lluvia
+del periodo base), nunca los 45 años.
+
+Uso:
+    python extremos_chirps.py [ent|mun] [path_diario]
+"""
+
+# = = = Imports = = = #
+import os
+import re
+import sys
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+path2chirps = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+path_diario_default = os.path.join(path2chirps, "data", "diario")
+
+umbral_lluvia = 1.0
+umbral_r20mm = 20.0
+percentil_r95p = 95
+n_dias_rx5day = 5
+
+patron_diario = re.compile(
+    r"mex_chirps_pr_mm_(ent|mun)_day_(\d{4})(?:_(\d{2}))?\.csv$")
+
+# = = = Lectura = = = #
+
+# = = Archivos diarios por año (retorna: dict) = = #
+def func_paths_diario(fc_interes, path_diario = path_diario_default):
+    # Un archivo por año (extracción local) o uno por mes (Earth Engine)
+    dict_paths = dict()
+    for archivo in sorted(os.listdir(path_diario)):
+        coincidencia = patron_diario.match(archivo)
+        if coincidencia and coincidencia.group(1) == fc_interes:
+            dict_paths.setdefault(int(coincidencia.group(2)), list()).append(
+                os.path.join(path_diario, archivo))
+    return dict(sorted(dict_paths.items()))
+
+# = = Matriz (geometría x día) de un año (retorna: tupla) = = #
+def func_leer_diario_year(n_year, list_paths):
+    datframe = None
+    for path_csv in list_paths:
+        datframe_mes = pd.read_csv(
+            filepath_or_buffer = path_csv,
+            usecols = lambda col: col == 'CVEGEO' or (col.isdigit() and
+                                                      len(col) == 4),
+            dtype = {'CVEGEO': str},
+            encoding = "latin-1").set_index('CVEGEO')
+        datframe = (datframe_mes if datframe is None
+                    else datframe.join(datframe_mes, how = 'outer'))
+
+    datframe = datframe.sort_index()
+    datframe = datframe[sorted(datframe.columns)]
+    fechas = [date(n_year, int(col[:2]), int(col[2:])) for col in datframe.columns]
+    return (datframe.index.to_numpy(), fechas,
+            datframe.to_numpy(dtype = np.float64))
+
+# = = Años de datos diarios, uno por uno (retorna: generador de tuplas) = = #
+def func_iter_diario(fc_interes, path_diario = path_diario_default,
+                     list_years = None):
+    for n_year, list_paths in func_paths_diario(fc_interes, path_diario).items():
+        if list_years is None or n_year in list_years:
+            yield (n_year,) + func_leer_diario_year(n_year, list_paths)
+
+# = = = Kernels = = = #
+
+# = = Racha máxima de días que cumplen una condición (retorna: tupla) = = #
+def func_racha_maxima(mask, racha_previa):
+    # `mask`: (geometría x día); `racha_previa`: racha al final del año
+    # anterior. Regresa la racha máxima del año y la racha al final del año
+    n_dias = mask.shape[1]
+    if n_dias == 0:
+        return racha_previa.copy(), racha_previa.copy()
+
+    posiciones = np.arange(1, n_dias + 1)
+    ultimo_no = np.maximum.accumulate(np.where(mask, 0, posiciones), axis = 1)
+    racha = posiciones - ultimo_no
+    # Antes del primer día que no cumple, la racha continúa la del año anterior
+    racha = np.where(ultimo_no == 0, racha + racha_previa[:, None], racha)
+    return racha.max(axis = 1), racha[:, -1]
+
+# = = Máximo de la suma móvil de k días (retorna: np.ndarray) = = #
+def func_maximo_ventana(valores, k, dias_previos):
+    # `dias_previos`: últimos k - 1 días del año anterior (o NaN). Las
+    # ventanas con días sin datos no cuentan
+    serie = np.concatenate([dias_previos, valores], axis = 1)
+    validos = ~np.isnan(serie)
+    ceros = np.zeros((serie.shape[0], 1))
+    suma = np.concatenate([ceros, np.cumsum(np.where(validos, serie, 0), axis = 1)],
+                          axis = 1)
+    n_validos = np.concatenate([ceros, np.cumsum(validos, axis = 1)], axis = 1)
+
+    ventanas = suma[:, k:] - suma[:, :-k]
+    completas = (n_validos[:, k:] - n_validos[:, :-k]) == k
+    ventanas = np.where(completas, ventanas, -np.inf).max(axis = 1)
+    return np.where(np.isfinite(ventanas), ventanas, np.nan)
+
+# = = Percentil de los días con lluvia del periodo base (retorna: pd.Series) = = #
+def func_umbral_percentil(fc_interes, path_diario = path_diario_default,
+                          n_year_inicio = 1981, n_year_fin = 2010,
+                          percentil = percentil_r95p):
+    list_lluvia = list()
+    cvegeo_base = None
+    for _, cvegeo, _, valores in func_iter_diario(
+            fc_interes, path_diario, range(n_year_inicio, n_year_fin + 1)):
+        if cvegeo_base is None:
+            cvegeo_base = cvegeo
+        elif not np.array_equal(cvegeo, cvegeo_base):
+            raise ValueError("Las geometrías cambian entre años")
+        # Únicamente los días con lluvia (geometría, valor)
+        fila, _ = np.nonzero(valores >= umbral_lluvia)
+        list_lluvia.append((fila, valores[valores >= umbral_lluvia]))
+
+    if cvegeo_base is None:
+        raise ValueError(f"No hay datos diarios de {n_year_inicio} - {n_year_fin}")
+
+    filas = np.concatenate([fila for fila, _ in list_lluvia])
+    lluvia = np.concatenate([valores for _, valores in list_lluvia])
+    # Orden por geometría y valor; el percentil (interpolación lineal, como
+    # `np.percentile`) se toma de la posición dentro de cada geometría
+    orden = np.lexsort((lluvia, filas))
+    filas, lluvia = filas[orden], lluvia[orden]
+    n_por_geom = np.bincount(filas, minlength = len(cvegeo_base))
+    inicio = np.cumsum(n_por_geom) - n_por_geom
+
+    posicion = (n_por_geom - 1) * percentil / 100
+    abajo = np.floor(posicion).astype(np.int64)
+    arriba = np.minimum(abajo + 1, n_por_geom - 1)
+    fraccion = posicion - abajo
+
+    umbral = np.full(len(cvegeo_base), np.nan)
+    con_lluvia = n_por_geom > 0
+    valor_abajo = lluvia[(inicio + abajo)[con_lluvia]]
+    valor_arriba = lluvia[(inicio + arriba)[con_lluvia]]
+    umbral[con_lluvia] = (valor_abajo + (valor_arriba - valor_abajo) *
+                          fraccion[con_lluvia])
+    return pd.Series(umbral, index = cvegeo_base)
+
+# = = = Índices = = = #
+
+# = = Índices anuales de lluvia extrema (retorna: pd.DataFrame) = = #
+def func_extremos_chirps(fc_interes,
+                         path_diario = path_diario_default,
+                         n_year_inicio = 1981,
+                         n_year_fin = 2010,
+                         rachas_entre_years = True):
+    umbral_r95 = func_umbral_percentil(fc_interes, path_diario,
+                                       n_year_inicio, n_year_fin)
+
+    list_datframes = list()
+    racha_seca = racha_lluvia = dias_previos = None
+    for n_year, cvegeo, fechas, valores in func_iter_diario(fc_interes,
+                                                            path_diario):
+        if racha_seca is None or not rachas_entre_years:
+            racha_seca = np.zeros(len(cvegeo), dtype = np.int64)
+            racha_lluvia = np.zeros(len(cvegeo), dtype = np.int64)
+            dias_previos = np.full((len(cvegeo), n_dias_rx5day - 1), np.nan)
+
+        # Días sin datos cortan las dos rachas
+        validos = ~np.isnan(valores)
+        lluvia = validos & (valores >= umbral_lluvia)
+        cdd, racha_seca = func_racha_maxima(validos & ~lluvia, racha_seca)
+        cwd, racha_lluvia = func_racha_maxima(lluvia, racha_lluvia)
+
+        umbral = umbral_r95.reindex(cvegeo).to_numpy()[:, None]
+        valores_lluvia = np.where(lluvia, valores, 0)
+        with np.errstate(invalid = 'ignore'):
+            list_datframes.append(pd.DataFrame(dict(
+                cvegeo = cvegeo,
+                n_year = n_year,
+                n_dias = validos.sum(axis = 1),
+                cdd = cdd,
+                cwd = cwd,
+                r20mm = (validos & (valores >= umbral_r20mm)).sum(axis = 1),
+                r95p = np.where(valores_lluvia > umbral, valores_lluvia, 0).sum(axis = 1),
+                rx1day = np.nanmax(np.where(validos, valores, -np.inf), axis = 1),
+                rx5day = func_maximo_ventana(valores, n_dias_rx5day, dias_previos),
+                prcptot = valores_lluvia.sum(axis = 1))))
+
+        dias_previos = np.concatenate([dias_previos, valores],
+                                      axis = 1)[:, -(n_dias_rx5day - 1):]
+
+    datframe = pd.concat(list_datframes, ignore_index = True)
+    datframe['rx1day'] = datframe['rx1day'].where(datframe['n_dias'] > 0)
+    return datframe
+
+if __name__ == "__main__":
+    fc_interes = sys.argv[1] if len(sys.argv) > 1 else "mun"
+    path_diario = sys.argv[2] if len(sys.argv) > 2 else path_diario_default
+
+    datframe = func_extremos_chirps(fc_interes, path_diario)
+    path_csv = os.path.join(path2chirps, "data", "extremos",
+                            f"db_mex_pr_extremos_{fc_interes}_year.csv")
+    os.makedirs(os.path.dirname(path_csv), exist_ok = True)
+    datframe.to_csv(path_csv, index = False)
+    print(f"Archivo: {path_csv}")
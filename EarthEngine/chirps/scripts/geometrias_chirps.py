@@ -0,0 +1,149 @@
+"""
+Author: Isaac Arroyo
+Notes: Geometrías (estados y municipios) y malla de los rasters de CHIRPS.
+       Son usadas por **`zonal_chirps.py`** y **`pesos_chirps.py`**.
+
+* La malla de un raster se describe con la esquina del primer pixel, el
+  tamaño del pixel y el número de columnas y renglones (`func_grid`).
+* Las geometrías se leen de GeoJSON (o de otros formatos con `geopandas`)
+  como una lista de `dict` con `geometria` y `propiedades`.
+* Los pixeles de una geometría son aquellos cuyo centro está dentro de
+  ella (regla par-impar, calculada por bloques de renglones del raster).
+  Las geometrías más pequeñas que un pixel toman el pixel en el que se
+  encuentra su centroide (`func_pixeles_geometria`).
+
+Únicamente usa NumPy, por lo que se puede probar con geometrías y mallas
+sintéticas.
+"""
+
+# = = = Imports = = = #
+import json
+
+import numpy as np
+
+# Número máximo de celdas (renglones x aristas) por bloque al buscar los
+# pixeles de una geometría
+n_celdas_bloque = 4_000_000
+
+# = = Definición de la malla del raster (retorna: dict) = = #
+def func_grid(x0, y0, dx, dy, n_cols, n_rows):
+    # (x0, y0) es la esquina del pixel [0, 0]. `dy` es negativo cuando el
+    # primer renglón es el de más al norte (GeoTIFF) y positivo cuando es el
+    # de más al sur (NetCDF de CHIRPS)
+    return dict(x0 = float(x0), y0 = float(y0),
+                dx = float(dx), dy = float(dy),
+                n_cols = int(n_cols), n_rows = int(n_rows))
+
+# = = Centros de los pixeles (retorna: tupla de np.ndarray) = = #
+def func_centros_pixeles(grid):
+    xs = grid['x0'] + (np.arange(grid['n_cols']) + 0.5) * grid['dx']
+    ys = grid['y0'] + (np.arange(grid['n_rows']) + 0.5) * grid['dy']
+    return xs, ys
+
+# = = = Geometrías = = = #
+
+# = = Leer geometrías (retorna: list de dict) = = #
+def func_leer_geometrias(path_geometrias):
+    # GeoJSON con `json`. Otros formatos (shapefile, GeoPackage) con
+    # `geopandas`, si está instalado
+    if path_geometrias.lower().endswith((".geojson", ".json")):
+        with open(path_geometrias, encoding = "utf-8") as archivo:
+            features = json.load(archivo)['features']
+    else:
+        import geopandas
+        features = (geopandas.read_file(path_geometrias)
+                    .to_crs(epsg = 4326)
+                    .__geo_interface__['features'])
+
+    return [dict(geometria = feature['geometry'],
+                 propiedades = feature['properties'])
+            for feature in features]
+
+# = = Anillos de un Polygon o MultiPolygon (retorna: list de np.ndarray) = = #
+def func_anillos(geometria):
+    if geometria['type'] == 'Polygon':
+        poligonos = [geometria['coordinates']]
+    elif geometria['type'] == 'MultiPolygon':
+        poligonos = geometria['coordinates']
+    else:
+        raise ValueError(f"Geometría no soportada: {geometria['type']}")
+
+    # Exteriores y huecos. Con la regla par-impar no hace falta distinguirlos
+    return [np.asarray(anillo, dtype = float)[:, :2]
+            for poligono in poligonos for anillo in poligono]
+
+# = = Centros de pixeles dentro de una geometría (retorna: tupla) = = #
+def func_pixeles_geometria(anillos, grid):
+    xs, ys = func_centros_pixeles(grid)
+    vertices = np.concatenate(anillos)
+    xmin, ymin = vertices.min(axis = 0)
+    xmax, ymax = vertices.max(axis = 0)
+
+    # Únicamente los pixeles dentro del rectángulo de la geometría
+    cols = np.flatnonzero((xs >= xmin) & (xs <= xmax))
+    rows = np.flatnonzero((ys >= ymin) & (ys <= ymax))
+
+    # Aristas de todos los anillos
+    x1 = np.concatenate([anillo[:-1, 0] for anillo in anillos])
+    y1 = np.concatenate([anillo[:-1, 1] for anillo in anillos])
+    x2 = np.concatenate([anillo[1:, 0] for anillo in anillos])
+    y2 = np.concatenate([anillo[1:, 1] for anillo in anillos])
+
+    list_rows, list_cols = list(), list()
+    if len(cols) > 0 and len(rows) > 0:
+        x_pix = xs[cols]
+        # Valor mayor a cualquier pixel para las aristas que no cruzan y
+        # separación entre renglones para buscar en todos a la vez
+        x_fuera = max(xmax, x_pix.max()) + 1.0
+        ancho = x_fuera - min(xmin, x_pix.min()) + 1.0
+
+        # Por bloques de renglones para acotar la memoria
+        n_bloque = max(1, n_celdas_bloque // max(len(x1), len(cols)))
+        for inicio in range(0, len(rows), n_bloque):
+            rows_bloque = rows[inicio:inicio + n_bloque]
+
+            # Para cada renglón, la posición en x donde cada arista cruza
+            # el centro de los pixeles
+            y = ys[rows_bloque][:, None]
+            cruza = (y1 > y) != (y2 > y)
+            with np.errstate(divide = 'ignore', invalid = 'ignore'):
+                x_cruce = np.where(cruza,
+                                   x1 + (y - y1) * (x2 - x1) / (y2 - y1),
+                                   x_fuera)
+            x_cruce.sort(axis = 1)
+
+            # Un pixel está dentro si tiene un número impar de cruces a su
+            # izquierda. Con el desplazamiento por renglón, la búsqueda de
+            # todos los renglones del bloque se hace en un solo arreglo
+            desplazamiento = (np.arange(len(rows_bloque)) * ancho)[:, None]
+            n_cruces = (np.searchsorted((x_cruce - x_pix.min() +
+                                         desplazamiento).ravel(),
+                                        (x_pix[None, :] - x_pix.min() +
+                                         desplazamiento).ravel(),
+                                        side = 'right')
+                        .reshape(len(rows_bloque), len(cols)) -
+                        np.arange(len(rows_bloque))[:, None] * len(x1))
+
+            i_row, i_col = np.nonzero(n_cruces % 2 == 1)
+            list_rows.append(rows_bloque[i_row])
+            list_cols.append(cols[i_col])
+
+    pix_rows = np.concatenate(list_rows) if list_rows else np.array([], int)
+    pix_cols = np.concatenate(list_cols) if list_cols else np.array([], int)
+
+    # Geometrías más pequeñas que un pixel: el pixel del centroide
+    if len(pix_rows) == 0:
+        centro = vertices.mean(axis = 0)
+        col = int(np.floor((centro[0] - grid['x0']) / grid['dx']))
+        row = int(np.floor((centro[1] - grid['y0']) / grid['dy']))
+        if 0 <= col < grid['n_cols'] and 0 <= row < grid['n_rows']:
+            pix_rows, pix_cols = np.array([row]), np.array([col])
+
+    return pix_rows, pix_cols
+
+# = = Rectángulo que contiene a las geometrías (retorna: tupla) = = #
+def func_bbox_geometrias(geometrias, margen = 0.1):
+    vertices = np.concatenate([np.concatenate(func_anillos(geometria['geometria']))
+                               for geometria in geometrias])
+    return (vertices[:, 0].min() - margen, vertices[:, 1].min() - margen,
+            vertices[:, 0].max() + margen, vertices[:, 1].max() + margen)
@@ -0,0 +1,320 @@
+"""
+Author: Isaac Arroyo
+Notes: Actualización incremental de los archivos de `data/ee_imports`: en
+       lugar de cambiar a mano `n_year_interes` y `limit_date` y volver a
+       extraer años completos, se extraen únicamente los meses que faltan.
+
+Pasos:
+
+1. **Inventario**: Se revisan los archivos
+   `mex_chirps_pr_mm_{ent|mun}_month_{año}.csv` que ya existen y sus
+   columnas de meses (`01`, ..., `12`). Un año con menos de 12 columnas es
+   el año parcial (el año en curso de la última actualización).
+2. **Meses faltantes**: Con la fecha límite (`limit_date`) se calculan los
+   meses de cada año y nivel que no están en los archivos o que se
+   extrajeron incompletos (`func_meses_faltantes`). La fecha límite con la
+   que se extrajo cada mes se guarda en `fechas_limite_chirps.json` (en la
+   misma carpeta); un mes extraído con una fecha límite anterior a su
+   último día se vuelve a extraer. Los meses sin registro (archivos
+   anteriores al registro) se consideran completos, excepto el último mes
+   del último año de cada nivel.
+3. **Extracción**: Se extraen únicamente esos meses con
+   `get_chirps_metrics(..., list_meses = [...])` (**`raster2csv_chirps.py`**),
+   que genera archivos `..._meses_{año}_{primero}-{último}.csv`.
+4. **Unión**: Los meses nuevos se agregan al archivo `month` del año y el
+   archivo `year` se vuelve a calcular como la suma de los meses
+   (`func_unir_meses`). La suma de los promedios mensuales es igual al
+   promedio de la precipitación anual. Los meses sin datos (vacíos) no se
+   suman, igual que en `una_pasada`; sin ningún mes, el total queda vacío.
+
+Con `backend = "local"` o `"ee_directo"` (descarga directa de Earth
+Engine) los pasos 3 y 4 se hacen en la misma llamada, únicamente con los
+archivos de meses de esa llamada. Con `backend = "ee"` se envían las
+tareas y, una vez que se descargan los archivos de Google Drive en una
+carpeta, se unen con `func_unir_meses_carpeta` (con la misma `limit_date`,
+para registrar los meses incompletos). En ambos casos, cada archivo de
+meses se mueve a la subcarpeta `unidos` después de unirlo, para que una
+corrida posterior no vuelva a unir archivos anteriores (con datos más
+viejos) sobre los nuevos.
+
+Por omisión únicamente se extrae el nivel `mun` (`list_fc = ('mun',)`):
+los estados y el nacional se calculan después a partir de los municipios
+con `func_wide2long_chirps(pesos_mun = func_pesos_area_00mun())`
+(**`wide2long_chirps.py`** y **`agregacion_chirps.py`**). Para crear las
+bases de datos igual que la versión en R (que lee los archivos `ent`) se
+usa `list_fc = ('ent', 'mun')`.
+
+Los archivos se leen y escriben como texto con `latin-1` (un byte por
+caracter), por lo que las columnas que no cambian quedan exactamente
+igual.
+"""
+
+# = = = Imports = = = #
+import json
+import os
+import re
+
+import pandas as pd
+
+from raster2csv_chirps import get_chirps_metrics
+from zonal_chirps import func_bandas_mes
+
+path2chirps = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+path_ee_imports_default = os.path.join(path2chirps, "data", "ee_imports")
+
+n_year_inicio = 1981
+encoding_ee = "latin-1"
+
+nombre_fechas_limite = "fechas_limite_chirps.json"
+
+patron_month = re.compile(r"mex_chirps_pr_mm_(ent|mun)_month_(\d{4})\.csv$")
+patron_meses = re.compile(
+    r"(?:mex_)?chirps_pr_mm_(ent|mun)_meses_(\d{4})_(\d{2})-(\d{2})\.csv$")
+
+# = = Leer CSV de Earth Engine como texto (retorna: pd.DataFrame) = = #
+def func_leer_csv_ee(path_csv, nrows = None):
+    return pd.read_csv(filepath_or_buffer = path_csv,
+                       dtype = str,
+                       keep_default_na = False,
+                       encoding = encoding_ee,
+                       nrows = nrows)
+
+# = = Columnas de meses (retorna: list) = = #
+def func_cols_meses(datframe):
+    return [col for col in datframe.columns if col.isdigit() and len(col) == 2]
+
+# = = Orden de columnas de Earth Engine (retorna: pd.DataFrame) = = #
+def func_ordenar_cols_ee(datframe):
+    # `system:index` al inicio, `.geo` al final y el resto por nombre
+    list_cols = sorted(col for col in datframe.columns
+                       if col not in ('system:index', '.geo'))
+    return datframe[['system:index'] + list_cols + ['.geo']]
+
+# = = Años y meses en `data/ee_imports` (retorna: pd.DataFrame) = = #
+def func_inventario_chirps(path_ee_imports = path_ee_imports_default):
+    list_registros = list()
+    for archivo in sorted(os.listdir(path_ee_imports)):
+        coincidencia = patron_month.match(archivo)
+        if coincidencia is None:
+            continue
+
+        # Únicamente el encabezado
+        list_meses = func_cols_meses(func_leer_csv_ee(
+            os.path.join(path_ee_imports, archivo), nrows = 0))
+        list_registros.append(dict(fc_interes = coincidencia.group(1),
+                                   n_year = int(coincidencia.group(2)),
+                                   list_meses = list_meses,
+                                   n_meses = len(list_meses),
+                                   parcial = len(list_meses) < 12))
+
+    return pd.DataFrame(list_registros,
+                        columns = ['fc_interes', 'n_year', 'list_meses',
+                                   'n_meses', 'parcial'])
+
+# = = Fechas límite de los meses extraídos (retorna: dict) = = #
+def func_cargar_fechas_limite(path_ee_imports = path_ee_imports_default):
+    # {nivel: {año: {mes: limit_date}}}
+    path_fechas = os.path.join(path_ee_imports, nombre_fechas_limite)
+    if not os.path.exists(path_fechas):
+        return dict()
+    with open(path_fechas, encoding = "utf-8") as archivo:
+        return json.load(archivo)
+
+# = = Registrar la fecha límite de meses extraídos (retorna: vacío) = = #
+def func_registrar_fechas_limite(fc_interes, n_year, list_meses, limit_date,
+                                 path_ee_imports = path_ee_imports_default):
+    fechas_limite = func_cargar_fechas_limite(path_ee_imports)
+    dict_meses = (fechas_limite.setdefault(fc_interes, dict())
+                  .setdefault(str(n_year), dict()))
+    for mes in list_meses:
+        dict_meses[mes] = limit_date
+
+    # Archivo temporal para no dejar el registro incompleto
+    path_fechas = os.path.join(path_ee_imports, nombre_fechas_limite)
+    with open(path_fechas + ".tmp", "w", encoding = "utf-8") as archivo:
+        json.dump(fechas_limite, archivo, indent = 1, sort_keys = True)
+    os.replace(path_fechas + ".tmp", path_fechas)
+    return None
+
+# = = Último día de un mes (retorna: str) = = #
+def func_fin_mes(n_year, mes):
+    return (pd.Timestamp(n_year, int(mes), 1) + pd.offsets.MonthEnd(0)).strftime('%Y-%m-%d')
+
+# = = Meses faltantes por año y nivel (retorna: pd.DataFrame) = = #
+def func_meses_faltantes(limit_date,
+                         path_ee_imports = path_ee_imports_default,
+                         list_fc = ('mun',),
+                         n_year_inicio = n_year_inicio):
+    inventario = func_inventario_chirps(path_ee_imports)
+    dict_existentes = {(fc, n_year): list_meses for fc, n_year, list_meses
+                       in inventario[['fc_interes', 'n_year', 'list_meses']]
+                       .itertuples(index = False)}
+    dict_ultimo_year = inventario.groupby('fc_interes')['n_year'].max().to_dict()
+    fechas_limite = func_cargar_fechas_limite(path_ee_imports)
+
+    list_registros = list()
+    for fc_interes in list_fc:
+        for n_year in range(n_year_inicio, int(limit_date[:4]) + 1):
+            list_existentes = dict_existentes.get((fc_interes, n_year), list())
+            dict_fechas = fechas_limite.get(fc_interes, dict()).get(str(n_year), dict())
+
+            # - - Meses extraídos antes de su último día - - #
+            set_incompletos = {mes for mes, fecha in dict_fechas.items()
+                               if fecha < func_fin_mes(n_year, mes) and
+                               fecha < limit_date}
+            # Sin registro: el último mes de la última actualización
+            ultimo_mes = max(list_existentes, default = None)
+            if (ultimo_mes is not None and ultimo_mes not in dict_fechas and
+                    n_year == dict_ultimo_year.get(fc_interes)):
+                set_incompletos.add(ultimo_mes)
+
+            list_meses = [mes for mes in func_bandas_mes(n_year, limit_date)
+                          if mes not in list_existentes or mes in set_incompletos]
+            if list_meses:
+                list_registros.append(dict(fc_interes = fc_interes,
+                                           n_year = n_year,
+                                           list_meses = list_meses))
+
+    return pd.DataFrame(list_registros,
+                        columns = ['fc_interes', 'n_year', 'list_meses'])
+
+# = = Tabla anual a partir de la mensual (retorna: pd.DataFrame) = = #
+def func_tabla_year(datframe_month):
+    # Los meses vacíos (geometrías sin datos) no se suman; sin ningún mes
+    # con datos el total queda vacío (`min_count = 1`)
+    cols_meses = func_cols_meses(datframe_month)
+    datframe_year = datframe_month.drop(columns = cols_meses)
+    datframe_year['mean'] = (datframe_month[cols_meses]
+                             .apply(pd.to_numeric, errors = 'coerce')
+                             .sum(axis = 1, min_count = 1))
+    return func_ordenar_cols_ee(datframe_year)
+
+# = = Unir meses nuevos al archivo del año (retorna: dict) = = #
+def func_unir_meses(path_csv_meses, path_ee_imports = path_ee_imports_default,
+                    limit_date = None):
+    # Con `limit_date` se registra la fecha límite de los meses unidos
+    fc_interes, n_year = patron_meses.search(
+        os.path.basename(path_csv_meses)).groups()[:2]
+    dict_paths = {periodo: os.path.join(
+                      path_ee_imports,
+                      f"mex_chirps_pr_mm_{fc_interes}_{periodo}_{n_year}.csv")
+                  for periodo in ('month', 'year')}
+
+    # El archivo de meses de Earth Engine tiene `mean` (`una_pasada`)
+    datframe_meses = func_leer_csv_ee(path_csv_meses)
+    datframe_meses = datframe_meses.drop(columns = ['mean'], errors = 'ignore')
+    cols_meses = func_cols_meses(datframe_meses)
+
+    if os.path.exists(dict_paths['month']):
+        # Los meses nuevos se agregan por clave geográfica
+        datframe_month = func_leer_csv_ee(dict_paths['month'])
+        valores_meses = datframe_meses.set_index('CVEGEO')[cols_meses]
+        faltantes = set(datframe_month['CVEGEO']) - set(valores_meses.index)
+        if faltantes:
+            raise ValueError(f"{path_csv_meses} no tiene las geometrías: "
+                             f"{sorted(faltantes)[:5]}")
+        datframe_month[cols_meses] = (valores_meses
+                                      .loc[datframe_month['CVEGEO']]
+                                      .to_numpy())
+    else:
+        datframe_month = datframe_meses
+
+    datframe_month = func_ordenar_cols_ee(datframe_month)
+    dict_datframes = dict(month = datframe_month,
+                          year = func_tabla_year(datframe_month))
+
+    for periodo, datframe in dict_datframes.items():
+        datframe.to_csv(dict_paths[periodo], index = False,
+                        encoding = encoding_ee)
+        print(f"Archivo: {dict_paths[periodo]}")
+
+    # El registro se actualiza después de escribir los archivos
+    if limit_date is not None:
+        func_registrar_fechas_limite(fc_interes, n_year, cols_meses, limit_date,
+                                     path_ee_imports)
+
+    return dict_paths
+
+# = = Archivo de meses de una extracción (retorna: str) = = #
+def func_path_meses(path_meses, fc_interes, n_year, list_meses):
+    # Mismo nombre que `get_chirps_metrics(..., list_meses = [...])`
+    return os.path.join(path_meses,
+                        f"mex_chirps_pr_mm_{fc_interes}_meses_{n_year}_"
+                        f"{list_meses[0]}-{list_meses[-1]}.csv")
+
+# = = Unir meses y mover el archivo a `unidos` (retorna: dict) = = #
+def func_unir_archivar_meses(path_csv_meses,
+                             path_ee_imports = path_ee_imports_default,
+                             limit_date = None):
+    dict_paths = func_unir_meses(path_csv_meses, path_ee_imports, limit_date)
+    path_unidos = os.path.join(os.path.dirname(path_csv_meses), "unidos")
+    os.makedirs(path_unidos, exist_ok = True)
+    os.replace(path_csv_meses,
+               os.path.join(path_unidos, os.path.basename(path_csv_meses)))
+    return dict_paths
+
+# = = Unir los archivos de meses (sin unir) de una carpeta (retorna: list) = = #
+def func_unir_meses_carpeta(path_meses,
+                            path_ee_imports = path_ee_imports_default,
+                            limit_date = None):
+    # Orden por nivel, año y primer mes para unir los meses en orden. Los
+    # archivos ya unidos están en la subcarpeta `unidos`
+    list_archivos = sorted(
+        (archivo for archivo in os.listdir(path_meses)
+         if patron_meses.search(archivo)),
+        key = lambda archivo: patron_meses.search(archivo).groups())
+
+    return [func_unir_archivar_meses(os.path.join(path_meses, archivo),
+                                     path_ee_imports, limit_date)
+            for archivo in list_archivos]
+
+# = = Actualización incremental (retorna: pd.DataFrame) = = #
+def func_actualizar_chirps(limit_date,
+                           path_ee_imports = path_ee_imports_default,
+                           list_fc = ('mun',),
+                           backend = "ee",
+                           path_meses = None,
+                           dict_path_geometrias = None,
+                           **kwargs_local):
+    # Con `backend = "local"`: `paths_archivos` (archivos diarios de
+    # CHIRPS), `dict_path_geometrias` (geometrías de `ent` y `mun`) y
+    # `path_meses` (carpeta de los archivos de meses)
+    faltantes = func_meses_faltantes(limit_date = limit_date,
+                                     path_ee_imports = path_ee_imports,
+                                     list_fc = list_fc)
+
+    list_paths_meses = list()
+    for fc_interes, n_year, list_meses in faltantes.itertuples(index = False):
+        print(f"{fc_interes} {n_year}: {', '.join(list_meses)}")
+        if backend in ("local", "ee_directo"):
+            list_paths_meses.append(func_path_meses(path_meses, fc_interes,
+                                                    n_year, list_meses))
+        if backend == "local":
+            get_chirps_metrics(n_year_interes = n_year,
+                               limit_date = limit_date,
+                               fc_interes = fc_interes,
+                               backend = backend,
+                               list_meses = list_meses,
+                               path_geometrias = dict_path_geometrias[fc_interes],
+                               path_salida = path_meses,
+                               **kwargs_local)
+        elif backend == "ee_directo":
+            get_chirps_metrics(n_year_interes = n_year,
+                               limit_date = limit_date,
+                               fc_interes = fc_interes,
+                               backend = backend,
+                               list_meses = list_meses,
+                               path_salida = path_meses,
+                               **kwargs_local)
+        else:
+            get_chirps_metrics(n_year_interes = n_year,
+                               limit_date = limit_date,
+                               fc_interes = fc_interes,
+                               backend = backend,
+                               list_meses = list_meses)
+
+    # Únicamente los archivos de esta corrida
+    for path_csv_meses in list_paths_meses:
+        func_unir_archivar_meses(path_csv_meses, path_ee_imports, limit_date)
+
+    return faltantes
@@ -0,0 +1,272 @@
+"""
+Author: Isaac Arroyo
+Notes: Lectura de todos los archivos de `data/ee_imports` en una sola tabla
+       con tipos (`func_ingesta_chirps`), con los nombres de los estados y
+       municipios reparados.
+
+Pasos:
+
+1. **Lectura en paralelo**: Los archivos se reparten entre varios procesos
+   (`n_procesos`) y se leen con `pyarrow.csv`, que descarta las columnas
+   `system:index` y `.geo` al leer (no se crean) y convierte cada columna
+   a su tipo: claves y nombres como texto, `n_year` entero y la
+   precipitación (`01`, ..., `12` o `mean`) decimal. Sin `pyarrow` se usa
+   `pd.read_csv` con `usecols`.
+2. **Codificación**: Los archivos se leen como UTF-8 y, si no lo son, como
+   `latin-1`. Los textos con doble codificación (`JosÃ©`) se corrigen.
+3. **Claves**: `cvegeo`, `cve_ent` y `cve_mun` se rellenan con ceros a la
+   izquierda (5, 2 y 3 caracteres; 2 para la `cvegeo` de los estados).
+4. **Nombres**: En los archivos de Earth Engine los caracteres con acento
+   se perdieron (`San Jos� de Gracia`, el caracter de reemplazo `U+FFFD`).
+   Cada palabra dañada se reemplaza por la única palabra de un vocabulario
+   (nombres de `GobiernoMexicano/cve_nom_*.csv` y nombres sin daño de los
+   archivos) que es igual salvo en el caracter dañado; si no hay palabra
+   con acento, por la vocal acentuada de la palabra sin acento del
+   vocabulario (`Tezoatl�n` -> `Tezoatlán`).
+
+La tabla tiene las columnas `fc` (`ent` o `mun`), `periodo` (`month` o
+`year`), las claves, `nomgeo`, `n_year`, los meses y `mean`; las columnas
+que no están en un archivo quedan sin datos.
+
+Los números se leen con el redondeo correcto (no como `as.numeric` de R),
+por lo que para los archivos idénticos a los de R se usa
+**`wide2long_chirps.py`**.
+
+Uso:
+    python ingesta_chirps.py [n_procesos]
+"""
+
+# = = = Imports = = = #
+import multiprocessing
+import os
+import re
+import sys
+import time
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
+from wide2long_chirps import list_meses, patron_archivo, path2chirpsdata, path2repo
+
+path_ee_imports_default = os.path.join(path2chirpsdata, "ee_imports")
+caracter_reemplazo = "�"
+
+cols_descartar = ['system:index', '.geo']
+cols_texto = ['CVEGEO', 'CVE_ENT', 'CVE_MUN', 'NOMGEO']
+cols_valores = list_meses + ['mean']
+dict_claves = dict(cvegeo = 'CVEGEO', cve_ent = 'CVE_ENT', cve_mun = 'CVE_MUN')
+dict_ancho_claves = dict(cve_ent = 2, cve_mun = 3)
+
+vocales_acento = dict(a = "á", e = "é", i = "í", o = "ó", u = "ú", n = "ñ",
+                      A = "Á", E = "É", I = "Í", O = "Ó", U = "Ú", N = "Ñ")
+
+# = = = Lectura = = = #
+
+# = = Columnas de un archivo (retorna: list) = = #
+def func_encabezado(path_csv):
+    with open(path_csv, encoding = "latin-1") as archivo:
+        return archivo.readline().rstrip("\r\n").split(",")
+
+# = = Leer un archivo con pyarrow (retorna: pa.Table) = = #
+def func_leer_pyarrow(path_csv, cols_interes):
+    opciones = pa_csv.ConvertOptions(
+        include_columns = cols_interes,
+        column_types = {col: (pa.string() if col in cols_texto else
+                              pa.int32() if col == 'n_year' else pa.float64())
+                        for col in cols_interes})
+    try:
+        tabla = pa_csv.read_csv(path_csv, convert_options = opciones)
+    except pa.ArrowInvalid:
+        # Texto que no es UTF-8
+        tabla = pa_csv.read_csv(path_csv,
+                                read_options = pa_csv.ReadOptions(encoding = "latin-1"),
+                                convert_options = opciones)
+    return tabla
+
+# = = Leer un archivo con pandas (retorna: pd.DataFrame) = = #
+def func_leer_pandas(path_csv, cols_interes):
+    kwargs = dict(filepath_or_buffer = path_csv,
+                  usecols = cols_interes,
+                  dtype = {col: str for col in cols_texto},
+                  keep_default_na = False,
+                  na_values = [""])
+    try:
+        return pd.read_csv(encoding = "utf-8", **kwargs)
+    except UnicodeDecodeError:
+        return pd.read_csv(encoding = "latin-1", **kwargs)
+
+# = = Leer un archivo de `ee_imports` (retorna: pa.Table o pd.DataFrame) = = #
+def func_leer_archivo(path_csv):
+    cols_interes = [col for col in func_encabezado(path_csv)
+                    if col not in cols_descartar]
+    func_leer = func_leer_pyarrow if pa is not None else func_leer_pandas
+    return func_leer(path_csv, cols_interes)
+
+# = = Leer varios archivos (retorna: list) = = #
+def func_leer_archivos(list_paths):
+    return [func_leer_archivo(path_csv) for path_csv in list_paths]
+
+# = = = Nombres = = = #
+
+# = = Corregir doble codificación (retorna: str) = = #
+def func_doble_codificacion(texto):
+    # "JosÃ©" (UTF-8 leído como latin-1) -> "José"
+    if "Ã" not in texto and "Â" not in texto:
+        return texto
+    try:
+        return texto.encode("latin-1").decode("utf-8")
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return texto
+
+# = = Vocabulario de palabras (retorna: tupla de dict) = = #
+def func_vocabulario(list_nombres):
+    # Palabras con caracteres no ASCII (por patrón de la palabra sin esos
+    # caracteres) y palabras sin acento (por letras en minúscula)
+    list_nombres = list(list_nombres)
+    for archivo, columnas in (("cve_nom_municipios.csv", ['nombre_estado',
+                                                          'nombre_municipio']),
+                              ("cve_nom_estados.csv", ['nombre_estado'])):
+        path_csv = os.path.join(path2repo, "GobiernoMexicano", archivo)
+        if os.path.exists(path_csv):
+            catalogo = pd.read_csv(path_csv, dtype = str)
+            for col in columnas:
+                list_nombres.extend(catalogo[col].dropna())
+
+    dict_acentos, dict_sin_acento = dict(), dict()
+    for nombre in list_nombres:
+        if caracter_reemplazo in nombre:
+            continue
+        for palabra in re.findall(r"[^\W\d_]+", nombre):
+            if palabra.isascii():
+                dict_sin_acento.setdefault(palabra.lower(), set()).add(palabra)
+            else:
+                llave = "".join(caracter if caracter.isascii() else caracter_reemplazo
+                                for caracter in palabra)
+                dict_acentos.setdefault(llave, set()).add(palabra)
+    return dict_acentos, dict_sin_acento
+
+# = = Reparar una palabra dañada (retorna: str) = = #
+def func_reparar_palabra(palabra, dict_acentos, dict_sin_acento):
+    candidatas = dict_acentos.get(palabra, set())
+    if len(candidatas) == 1:
+        return next(iter(candidatas))
+
+    # Palabra sin acento en el vocabulario: vocal con acento (o ñ) en la
+    # posición dañada
+    patron = re.compile(re.escape(palabra.lower()).replace(caracter_reemplazo, "[aeioun]"))
+    candidatas = {candidata for llave, palabras in dict_sin_acento.items()
+                  if patron.fullmatch(llave) for candidata in palabras}
+    if len(candidatas) == 1:
+        candidata = next(iter(candidatas))
+        return "".join(vocales_acento[letra] if caracter == caracter_reemplazo else caracter
+                       for caracter, letra in zip(palabra, candidata))
+    return palabra
+
+# = = Reparar nombres (retorna: pd.Series) = = #
+def func_reparar_nombres(serie_nombres):
+    # Se repara cada nombre distinto una sola vez
+    codigos, nombres = pd.factorize(serie_nombres)
+    nombres = [unicodedata.normalize("NFC", func_doble_codificacion(nombre))
+               for nombre in nombres]
+    dict_acentos, dict_sin_acento = func_vocabulario(nombres)
+
+    patron_palabra = re.compile(rf"[^\W\d_]*{caracter_reemplazo}[^\W\d_{caracter_reemplazo}]*"
+                                rf"(?:{caracter_reemplazo}[^\W\d_{caracter_reemplazo}]*)*")
+    nombres = np.array([
+        patron_palabra.sub(lambda coincidencia: func_reparar_palabra(
+            coincidencia.group(0), dict_acentos, dict_sin_acento), nombre)
+        if caracter_reemplazo in nombre else nombre
+        for nombre in nombres], dtype = object)
+
+    reparados = np.where(codigos >= 0, nombres[np.maximum(codigos, 0)], None)
+    return pd.Series(reparados, index = serie_nombres.index, dtype = "string")
+
+# = = = Tabla = = = #
+
+# = = Rellenar con ceros a la izquierda (retorna: pd.Series) = = #
+def func_zfill(serie, ancho):
+    # Cada clave distinta se rellena una sola vez
+    codigos, claves = pd.factorize(serie)
+    claves = np.array([clave.zfill(ancho) for clave in claves], dtype = object)
+    return pd.Series(np.where(codigos >= 0, claves[np.maximum(codigos, 0)], None),
+                     index = serie.index, dtype = "string")
+
+# = = Todos los archivos de `ee_imports` en una tabla (retorna: pd.DataFrame) = = #
+def func_ingesta_chirps(path_ee_imports = path_ee_imports_default,
+                        n_procesos = None,
+                        list_llaves = None):
+    # `list_llaves`: únicamente ciertos niveles y periodos
+    # (p. ej. `[('mun', 'month')]`)
+    list_paths = sorted(
+        os.path.join(path_ee_imports, archivo)
+        for archivo in os.listdir(path_ee_imports)
+        if patron_archivo.search(archivo) and
+        (list_llaves is None or patron_archivo.search(archivo).groups()[:2]
+         in list_llaves))
+    if not list_paths:
+        raise ValueError(f"No hay archivos de `ee_imports` en {path_ee_imports}")
+
+    # Un bloque de archivos por proceso (menos procesos que crear)
+    n_procesos = min(n_procesos or multiprocessing.cpu_count(), len(list_paths))
+    list_bloques = [list_paths[i::n_procesos] for i in range(n_procesos)]
+    if n_procesos == 1:
+        list_resultados = list(map(func_leer_archivos, list_bloques))
+    else:
+        with multiprocessing.Pool(processes = n_procesos) as pool:
+            list_resultados = pool.map(func_leer_archivos, list_bloques)
+
+    # Mismo orden de los archivos
+    dict_datframes = {path_csv: datframe
+                      for bloque, resultado in zip(list_bloques, list_resultados)
+                      for path_csv, datframe in zip(bloque, resultado)}
+    list_datframes = [dict_datframes[path_csv] for path_csv in list_paths]
+    # Las tablas de Arrow se unen antes de convertirlas (una sola conversión)
+    datframe = (pa.concat_tables(list_datframes, promote_options = "default")
+                .to_pandas() if pa is not None
+                else pd.concat(list_datframes, ignore_index = True))
+
+    # Nivel y periodo de cada archivo
+    list_llaves_archivos = [patron_archivo.search(path_csv).groups()[:2]
+                            for path_csv in list_paths]
+    n_renglones = [len(datframe_archivo) for datframe_archivo in list_datframes]
+    tabla = pd.DataFrame({
+        col: pd.Categorical.from_codes(
+            np.repeat([categorias.index(llave[i]) for llave in list_llaves_archivos],
+                      n_renglones),
+            categories = categorias)
+        for i, (col, categorias) in enumerate([('fc', ['ent', 'mun']),
+                                               ('periodo', ['month', 'year'])])})
+
+    # Claves de ancho fijo (la `cvegeo` de los estados es de 2 caracteres)
+    vacia = pd.Series(pd.NA, index = datframe.index, dtype = "string")
+    cvegeo = datframe.get('CVEGEO', vacia)
+    es_ent = (tabla['fc'] == 'ent').to_numpy()
+    tabla['cvegeo'] = func_zfill(cvegeo, 5).where(~es_ent, func_zfill(cvegeo, 2))
+    for col, ancho in dict_ancho_claves.items():
+        tabla[col] = func_zfill(datframe.get(dict_claves[col], vacia), ancho)
+    tabla['nomgeo'] = func_reparar_nombres(datframe.get('NOMGEO', vacia))
+    tabla['n_year'] = datframe['n_year'].to_numpy(dtype = np.int16)
+    for col in cols_valores:
+        if col in datframe:
+            tabla[col] = datframe[col].to_numpy(dtype = np.float64)
+    return tabla
+
+if __name__ == "__main__":
+    n_procesos = int(sys.argv[1]) if len(sys.argv) > 1 else None
+
+    tiempo_inicio = time.perf_counter()
+    datframe = func_ingesta_chirps(n_procesos = n_procesos)
+    print(f"Tabla de {len(datframe):,} renglones: "
+          f"{time.perf_counter() - tiempo_inicio:.2f} s")
+    print(datframe.dtypes.to_string())
+
+    nombres = datframe['nomgeo'].drop_duplicates()
+    print(f"Nombres con caracteres dañados: "
+          f"{nombres.str.contains(caracter_reemplazo).sum()} de {len(nombres)}")
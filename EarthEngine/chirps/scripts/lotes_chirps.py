@@ -0,0 +1,273 @@
+"""
+Author: Isaac Arroyo
+Notes: Extracción de varios años y niveles (`ent`, `mun`) de CHIRPS desde
+       Earth Engine (por ejemplo, 1981 - 2025) con un número máximo de
+       tareas al mismo tiempo. Usa las tareas de `func_tareas_chirps`
+       (**`raster2csv_chirps.py`**).
+
+* **Tareas al mismo tiempo**: A lo más `n_max_tareas` tareas están en la
+  cola de Earth Engine (`READY` o `RUNNING`). Al terminar una se envía la
+  siguiente.
+* **Consulta del estado**: El estado de las tareas se consulta cada
+  `espera_inicial` segundos. Si nada cambia, la espera se multiplica por
+  `factor_espera` (hasta `espera_max`), y regresa a `espera_inicial` en
+  cuanto alguna tarea cambia de estado.
+* **Reintentos**: Las tareas que fallan (`FAILED`, `CANCELLED` o un error
+  al enviarlas) se vuelven a crear y se envían al final de la cola, hasta
+  `n_reintentos` veces.
+* **Manifiesto**: El estado, número de intentos, id de Earth Engine y
+  errores de cada tarea se guardan en un JSON (`path_manifiesto`) después
+  de cada cambio. Si el manifiesto ya existe, las tareas completadas no se
+  vuelven a enviar.
+* **Niveles**: Con `list_fc = ['mun']` no se extrae el nivel `ent`; los
+  estados y el nacional se calculan con los pesos de los municipios
+  (`pesos_mun` de **`wide2long_chirps.py`**, **`agregacion_chirps.py`**).
+* **Continuación**: Las tareas que quedaron enviadas (`READY` o `RUNNING`,
+  con `id_tarea`) en una corrida interrumpida se consultan en Earth Engine
+  (`ee.data.getTaskStatus`) antes de armar la cola: las que siguen activas
+  se vuelven a seguir (cuentan para `n_max_tareas`) sin enviarlas de
+  nuevo, las que terminaron se marcan como completadas y las que fallaron
+  se reintentan.
+
+Las tareas únicamente necesitan `start()`, `status()` y `id` (como
+`ee.batch.Task`) y la consulta por `id_tarea` se puede reemplazar
+(`func_estado_tarea`), por lo que el envío se puede probar sin Earth Engine con
+tareas simuladas (**`simulacion_lotes_chirps.py`**).
+"""
+
+# = = = Imports = = = #
+import json
+import os
+import time
+from datetime import datetime
+from functools import partial
+
+try:
+    import ee
+except ImportError:
+    ee = None
+
+from raster2csv_chirps import func_iniciar_ee, func_tareas_chirps
+
+# Estados de `ee.batch.Task.status()['state']`
+estado_completado = 'COMPLETED'
+list_estados_fallidos = ['FAILED', 'CANCELLED']
+list_estados_activos = ['READY', 'RUNNING', 'CANCEL_REQUESTED']
+
+# = = Fecha y hora actual como texto (retorna: str) = = #
+def func_ahora():
+    return datetime.now().isoformat(timespec = 'seconds')
+
+# = = Crear una tarea de `func_tareas` (retorna: tarea) = = #
+def func_crear_tarea(func_tareas, nombre, **kwargs_tareas):
+    # `func_tareas` regresa todas las tareas de un año y nivel; se toma la
+    # del archivo `nombre`
+    return func_tareas(**kwargs_tareas)[nombre]
+
+# = = Estado de una tarea de Earth Engine por su id (retorna: dict) = = #
+def func_estado_tarea_ee(id_tarea):
+    func_iniciar_ee()
+    return ee.data.getTaskStatus(id_tarea)[0]
+
+# = = Tarea enviada en una corrida anterior (como `ee.batch.Task`) = = #
+class TareaRegistrada:
+    def __init__(self, id_tarea, func_estado_tarea):
+        self.id = id_tarea
+        self.func_estado_tarea = func_estado_tarea
+
+    def status(self):
+        return self.func_estado_tarea(self.id)
+
+# = = Trabajos de los años y niveles de interés (retorna: dict) = = #
+def func_trabajos_chirps(list_years,
+                         list_fc,
+                         limit_date,
+                         una_pasada = False,
+                         func_tareas = None):
+    func_tareas = func_tareas or func_tareas_chirps
+    dict_trabajos = dict()
+
+    for n_year in list_years:
+        for fc_interes in list_fc:
+            kwargs_tareas = dict(n_year_interes = n_year,
+                                 limit_date = limit_date,
+                                 fc_interes = fc_interes,
+                                 una_pasada = una_pasada)
+            # Las tareas de Earth Engine no se pueden volver a iniciar, por
+            # lo que cada trabajo guarda cómo crear su tarea
+            for nombre in func_tareas(**kwargs_tareas):
+                dict_trabajos[nombre] = dict(
+                    n_year = n_year,
+                    fc_interes = fc_interes,
+                    crear = partial(func_crear_tarea, func_tareas, nombre,
+                                    **kwargs_tareas))
+
+    return dict_trabajos
+
+# = = Leer manifiesto (retorna: dict) = = #
+def func_leer_manifiesto(path_manifiesto):
+    if path_manifiesto is not None and os.path.exists(path_manifiesto):
+        with open(path_manifiesto, encoding = "utf-8") as archivo:
+            return json.load(archivo)
+    return dict(creado = func_ahora(), tareas = dict())
+
+# = = Guardar manifiesto (retorna: vacío) = = #
+def func_guardar_manifiesto(dict_manifiesto, path_manifiesto):
+    if path_manifiesto is None:
+        return None
+
+    dict_manifiesto['actualizado'] = func_ahora()
+    # Se escribe en un archivo temporal para no dejar archivos incompletos
+    path_temporal = f"{path_manifiesto}.tmp"
+    with open(path_temporal, "w", encoding = "utf-8") as archivo:
+        json.dump(dict_manifiesto, archivo, indent = 2, ensure_ascii = False)
+    os.replace(path_temporal, path_manifiesto)
+    return None
+
+# = = Envío de tareas con límite y reintentos (retorna: dict) = = #
+def func_ejecutar_tareas(dict_trabajos,
+                         n_max_tareas = 3,
+                         n_reintentos = 2,
+                         path_manifiesto = None,
+                         espera_inicial = 10,
+                         espera_max = 300,
+                         factor_espera = 2,
+                         func_dormir = time.sleep,
+                         func_estado_tarea = None):
+    # `func_estado_tarea(id_tarea)`: estado de una tarea enviada en una
+    # corrida anterior (`ee.data.getTaskStatus` por omisión)
+    func_estado_tarea = func_estado_tarea or func_estado_tarea_ee
+    dict_manifiesto = func_leer_manifiesto(path_manifiesto)
+    dict_registros = dict_manifiesto['tareas']
+
+    list_pendientes = list()
+    dict_activas = dict()
+    dict_fallos = dict()
+    espera = espera_inicial
+
+    # - - Fallo de una tarea: reintento o fallo definitivo - - #
+    def func_fallo(nombre, mensaje):
+        registro = dict_registros[nombre]
+        registro['errores'].append(dict(intento = registro['intentos'],
+                                        error = mensaje,
+                                        fecha = func_ahora()))
+        dict_fallos[nombre] += 1
+        if dict_fallos[nombre] <= n_reintentos:
+            registro['estado'] = 'PENDIENTE'
+            list_pendientes.append(nombre)
+            print(f"Reintento: {nombre} ({mensaje})")
+        else:
+            registro['estado'] = 'FAILED'
+            print(f"Falló: {nombre} ({mensaje})")
+
+    # - - Cola de tareas (sin las completadas en corridas anteriores) - - #
+    for nombre, trabajo in dict_trabajos.items():
+        registro = dict_registros.setdefault(
+            nombre, dict(n_year = trabajo['n_year'],
+                         fc_interes = trabajo['fc_interes'],
+                         intentos = 0,
+                         errores = list()))
+        if registro.get('estado') == estado_completado:
+            continue
+        dict_fallos[nombre] = 0
+
+        # ~ Tareas enviadas en una corrida interrumpida ~ #
+        if registro.get('estado') in list_estados_activos and registro.get('id_tarea'):
+            tarea = TareaRegistrada(registro['id_tarea'], func_estado_tarea)
+            try:
+                status = tarea.status()
+            except Exception:
+                # Sin respuesta: se sigue como activa y se vuelve a
+                # consultar en la siguiente vuelta
+                status = dict(state = registro['estado'])
+            estado = status.get('state')
+
+            if estado in list_estados_activos:
+                registro['estado'] = estado
+                dict_activas[nombre] = tarea
+                print(f"Continúa: {nombre}")
+                continue
+            if estado == estado_completado:
+                registro.update(estado = estado, fin = func_ahora())
+                print(f"Completada: {nombre}")
+                continue
+            if estado in list_estados_fallidos:
+                func_fallo(nombre, status.get('error_message', estado))
+                continue
+
+        registro['estado'] = 'PENDIENTE'
+        list_pendientes.append(nombre)
+
+    while list_pendientes or dict_activas:
+        # - - Envío hasta llenar los lugares disponibles - - #
+        while list_pendientes and len(dict_activas) < n_max_tareas:
+            nombre = list_pendientes.pop(0)
+            registro = dict_registros[nombre]
+            registro['intentos'] += 1
+            try:
+                tarea = dict_trabajos[nombre]['crear']()
+                tarea.start()
+            except Exception as error:
+                func_fallo(nombre, repr(error))
+                continue
+
+            registro.update(estado = 'READY',
+                            id_tarea = getattr(tarea, 'id', None),
+                            inicio = func_ahora())
+            dict_activas[nombre] = tarea
+            print(f"Task: {nombre}")
+
+        func_guardar_manifiesto(dict_manifiesto, path_manifiesto)
+        if not (list_pendientes or dict_activas):
+            break
+
+        # - - Consulta del estado - - #
+        func_dormir(espera)
+        cambio = False
+        for nombre, tarea in list(dict_activas.items()):
+            registro = dict_registros[nombre]
+            try:
+                status = tarea.status()
+            except Exception:
+                # Error al consultar: se vuelve a consultar en la siguiente
+                # vuelta
+                continue
+
+            estado = status.get('state')
+            if estado != registro['estado']:
+                cambio = True
+                registro['estado'] = estado
+
+            if estado == estado_completado:
+                registro['fin'] = func_ahora()
+                del dict_activas[nombre]
+                print(f"Completada: {nombre}")
+            elif estado in list_estados_fallidos:
+                del dict_activas[nombre]
+                func_fallo(nombre, status.get('error_message', estado))
+
+        espera = (espera_inicial if cambio
+                  else min(espera * factor_espera, espera_max))
+
+    func_guardar_manifiesto(dict_manifiesto, path_manifiesto)
+    return dict_manifiesto
+
+# = = Extracción de varios años y niveles (retorna: dict) = = #
+def func_lote_chirps(list_years,
+                     list_fc,
+                     limit_date,
+                     una_pasada = False,
+                     path_manifiesto = "manifiesto_lote_chirps.json",
+                     func_tareas = None,
+                     **kwargs_ejecucion):
+    # `kwargs_ejecucion`: `n_max_tareas`, `n_reintentos`, `espera_inicial`,
+    # `espera_max`, `factor_espera`, `func_dormir` y `func_estado_tarea` de
+    # `func_ejecutar_tareas`
+    dict_trabajos = func_trabajos_chirps(list_years = list_years,
+                                         list_fc = list_fc,
+                                         limit_date = limit_date,
+                                         una_pasada = una_pasada,
+                                         func_tareas = func_tareas)
+    return func_ejecutar_tareas(dict_trabajos,
+                                path_manifiesto = path_manifiesto,
+                                **kwargs_ejecucion)
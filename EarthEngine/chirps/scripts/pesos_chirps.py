@@ -0,0 +1,215 @@
+"""
+Author: Isaac Arroyo
+Notes: Matriz dispersa de pesos (geometría x pixel) para calcular promedios
+       zonales de cualquier número de bandas con una multiplicación de
+       matrices. Es usada por **`zonal_chirps.py`**.
+
+El peso de un pixel en una geometría es la fracción del área del pixel que
+cubre la geometría (como el `ee.Reducer.mean()` de Earth Engine). La
+fracción se calcula dividiendo cada pixel en `n_subpixeles x n_subpixeles`
+sub-pixeles y contando cuántos centros quedan dentro de la geometría.
+
+Las geometrías (~2,470 municipios) y la malla de CHIRPS son las mismas
+cada año, por lo que la matriz se calcula una sola vez y se guarda en la
+caché (`~/.cache/datos_facil_acceso/pesos_chirps`, o la carpeta indicada
+en la variable de ambiente `DATOS_FACIL_ACCESO_CACHE`). La llave del
+archivo es el _hash_ de las geometrías, la definición de la malla y
+`n_subpixeles`.
+
+Con la matriz `W` (geometrías x pixeles) y las bandas `X` (pixeles x
+bandas), los promedios son `(W @ X) / (W @ validos)`, donde `validos`
+indica los pixeles con datos de cada banda.
+
+Otras estadísticas (`func_estadisticas_zonales_pesos`, con los nombres de
+los reductores de Earth Engine: `min`, `max`, `stdDev` y percentiles
+`pNN`) se calculan en una sola pasada sobre los valores de los pixeles de
+cada geometría (los elementos de la matriz dispersa, en el orden de sus
+renglones): mínimo y máximo por segmentos (`reduceat`), desviación
+estándar ponderada alrededor del promedio y percentiles ponderados (el
+primer valor cuyo peso acumulado llega al percentil, como el histograma de
+`ee.Reducer.percentile`).
+
+Los pesos y el promedio zonal se verifican con geometrías y mallas
+sintéticas en **`simulacion_zonal_chirps.py`**.
+"""
+
+# = = = Imports = = = #
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+from scipy import sparse
+
+from geometrias_chirps import func_anillos, func_grid, func_pixeles_geometria
+
+path_cache_default = os.path.join(
+    os.environ.get(
+        "DATOS_FACIL_ACCESO_CACHE",
+        os.path.join(os.path.expanduser("~"), ".cache", "datos_facil_acceso")),
+    "pesos_chirps")
+
+# Estadísticas además del promedio (`pNN`: percentil NN)
+patron_estadistica = re.compile(r"min|max|stdDev|p(\d{1,2})")
+
+# Cambiar si cambia la forma de calcular los pesos
+version_pesos = "1"
+
+# = = Llave de la matriz de pesos (retorna: str) = = #
+def func_llave_pesos(geometrias, grid, n_subpixeles):
+    hash_pesos = hashlib.sha256()
+    for geometria in geometrias:
+        hash_pesos.update(json.dumps(geometria['geometria'],
+                                     sort_keys = True).encode("utf-8"))
+    # Malla redondeada para que diferencias numéricas mínimas no cambien
+    # la llave
+    hash_pesos.update(json.dumps(
+        {llave: round(valor, 9) for llave, valor in grid.items()},
+        sort_keys = True).encode("utf-8"))
+    hash_pesos.update(f"{n_subpixeles}|{version_pesos}".encode("utf-8"))
+    return hash_pesos.hexdigest()[:32]
+
+# = = Matriz de pesos (retorna: sparse.csr_matrix) = = #
+def func_matriz_pesos(geometrias, grid, n_subpixeles = 8):
+    # Malla de sub-pixeles: cada pixel se divide en n x n
+    grid_sub = func_grid(grid['x0'], grid['y0'],
+                         grid['dx'] / n_subpixeles, grid['dy'] / n_subpixeles,
+                         grid['n_cols'] * n_subpixeles,
+                         grid['n_rows'] * n_subpixeles)
+
+    list_geom, list_pix, list_pesos = list(), list(), list()
+    for i, geometria in enumerate(geometrias):
+        anillos = func_anillos(geometria['geometria'])
+        rows, cols = func_pixeles_geometria(anillos, grid_sub)
+
+        # Sub-pixeles a pixeles: número de sub-pixeles dentro por pixel
+        pix, n_sub = np.unique((rows // n_subpixeles) * grid['n_cols'] +
+                               cols // n_subpixeles,
+                               return_counts = True)
+
+        list_geom.append(np.full(len(pix), i))
+        list_pix.append(pix)
+        list_pesos.append(n_sub / n_subpixeles ** 2)
+
+    return sparse.csr_matrix(
+        (np.concatenate(list_pesos).astype(np.float32),
+         (np.concatenate(list_geom), np.concatenate(list_pix))),
+        shape = (len(geometrias), grid['n_cols'] * grid['n_rows']))
+
+# = = Matriz de pesos con caché (retorna: sparse.csr_matrix) = = #
+def func_cargar_matriz_pesos(geometrias, grid, n_subpixeles = 8,
+                             path_cache = None):
+    path_cache = path_cache or path_cache_default
+    os.makedirs(path_cache, exist_ok = True)
+    path_matriz = os.path.join(
+        path_cache,
+        f"{func_llave_pesos(geometrias, grid, n_subpixeles)}.npz")
+
+    if os.path.exists(path_matriz):
+        return sparse.load_npz(path_matriz).tocsr()
+
+    matriz = func_matriz_pesos(geometrias, grid, n_subpixeles)
+    # Se escribe en un archivo temporal para no dejar archivos incompletos
+    path_temporal = path_matriz[:-len(".npz")] + ".tmp.npz"
+    sparse.save_npz(path_temporal, matriz)
+    os.replace(path_temporal, path_matriz)
+    return matriz
+
+# = = Promedio zonal de varias bandas (retorna: np.ndarray) = = #
+def func_media_zonal_pesos(matriz_pesos, bandas):
+    # `bandas`: (n_bandas, n_pixeles). Pixeles sin datos (NaN) no cuentan.
+    # Resultado: (n_geometrias, n_bandas)
+    validos = ~np.isnan(bandas)
+    suma = matriz_pesos @ np.where(validos, bandas, 0.0).T
+    suma_pesos = matriz_pesos @ validos.T.astype(np.float32)
+
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        return np.asarray(suma) / np.asarray(suma_pesos)
+
+# = = Revisar nombres de estadísticas (retorna: list) = = #
+def func_validar_estadisticas(estadisticas):
+    estadisticas = [estadistica for estadistica in (estadisticas or list())
+                    if estadistica != 'mean']
+    for estadistica in estadisticas:
+        if not patron_estadistica.fullmatch(estadistica):
+            raise ValueError(f"Estadística no soportada: {estadistica} "
+                             "(min, max, stdDev o pNN)")
+    return list(dict.fromkeys(estadisticas))
+
+# = = Reducción por segmentos de renglones (retorna: np.ndarray) = = #
+def func_reduceat(ufunc, valores, indptr, vacio):
+    # `valores`: (n_bandas, n_elementos). Resultado: (n_bandas, n_geometrias);
+    # las geometrías sin pixeles son `vacio`
+    # Únicamente se reducen los segmentos con elementos: con segmentos
+    # vacíos (p. ej. al final) `reduceat` recortaría el segmento anterior
+    resultado = np.full((valores.shape[0], len(indptr) - 1), vacio,
+                        dtype = np.result_type(valores, type(vacio)))
+    no_vacios = indptr[:-1] < indptr[1:]
+    if no_vacios.any():
+        resultado[:, no_vacios] = ufunc.reduceat(valores, indptr[:-1][no_vacios],
+                                                 axis = 1)
+    return resultado
+
+# = = Estadísticas zonales de varias bandas en una pasada (retorna: dict) = = #
+def func_estadisticas_zonales_pesos(matriz_pesos, bandas, estadisticas):
+    # `bandas`: (n_bandas, n_pixeles). Resultado: {estadística: (n_geometrias,
+    # n_bandas)}, siempre con `mean`
+    estadisticas = func_validar_estadisticas(estadisticas)
+    matriz = sparse.csr_matrix(matriz_pesos)
+    matriz.sort_indices()
+    indptr = matriz.indptr
+    filas = np.repeat(np.arange(matriz.shape[0]), np.diff(indptr))
+
+    # Valores de los pixeles de cada geometría (n_bandas, n_elementos)
+    valores = np.asarray(bandas, dtype = np.float64)[:, matriz.indices]
+    validos = ~np.isnan(valores)
+    pesos = np.where(validos, matriz.data.astype(np.float64), 0.0)
+
+    suma_pesos = func_reduceat(np.add, pesos, indptr, 0.0)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        media = func_reduceat(np.add, pesos * np.where(validos, valores, 0.0),
+                              indptr, 0.0) / suma_pesos
+    dict_estadisticas = dict(mean = media)
+
+    for estadistica in estadisticas:
+        if estadistica in ('min', 'max'):
+            ufunc = np.fmin if estadistica == 'min' else np.fmax
+            dict_estadisticas[estadistica] = func_reduceat(ufunc, valores,
+                                                           indptr, np.nan)
+        elif estadistica == 'stdDev':
+            desviaciones = np.where(validos, valores - media[:, filas], 0.0)
+            with np.errstate(invalid = 'ignore', divide = 'ignore'):
+                dict_estadisticas[estadistica] = np.sqrt(func_reduceat(
+                    np.add, pesos * desviaciones ** 2, indptr, 0.0) / suma_pesos)
+
+    # - - Percentiles ponderados - - #
+    list_percentiles = [estadistica for estadistica in estadisticas
+                        if estadistica.startswith('p')]
+    if list_percentiles:
+        n_validos = func_reduceat(np.add, validos.astype(np.int64), indptr, 0)
+        for estadistica in list_percentiles:
+            dict_estadisticas[estadistica] = np.full(media.shape, np.nan)
+
+        # Orden por valor y después (estable) por geometría: los valores de
+        # cada geometría quedan ordenados y los NaN al final
+        tipo_filas = np.uint16 if matriz.shape[0] <= np.iinfo(np.uint16).max else np.int64
+        filas = filas.astype(tipo_filas)
+        orden_valores = np.argsort(valores, axis = 1)
+        for banda in range(valores.shape[0]):
+            orden = orden_valores[banda][np.argsort(filas[orden_valores[banda]],
+                                                    kind = 'stable')]
+            valores_orden = valores[banda, orden]
+            acumulado = np.cumsum(pesos[banda, orden])
+            base = np.concatenate([[0.0], acumulado])[indptr[:-1]]
+            con_datos = n_validos[banda] > 0
+            for estadistica in list_percentiles:
+                objetivo = base + int(estadistica[1:]) / 100 * suma_pesos[banda]
+                idx = np.searchsorted(acumulado, objetivo, side = 'left')
+                idx = np.clip(idx, indptr[:-1],
+                              indptr[:-1] + np.maximum(n_validos[banda] - 1, 0))
+                dict_estadisticas[estadistica][banda, con_datos] = \
+                    valores_orden[idx[con_datos]]
+
+    return {estadistica: valores_estadistica.T
+            for estadistica, valores_estadistica in dict_estadisticas.items()}
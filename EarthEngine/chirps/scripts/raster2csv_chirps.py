@@ -24,23 +24,249 @@ Cambiantes:
                 - `mun` (Municipios)
 * `limit_date`: Fecha del límite próximo de los datos. Esta información se
                 puede consultar en la página del la `ee.ImageCollection`
+* `backend`: `"ee"` (Earth Engine, exportación a Google Drive) o `"local"`
+             (archivos diarios de CHIRPS y geometrías en disco, ver
+             **`zonal_chirps.py`**). Con `"local"` se necesitan
+             `paths_archivos`, `path_geometrias` y `path_salida` (y
+             opcionalmente `path_cache` para la matriz de pesos).
+             Con `"ee_directo"` el resultado de Earth Engine se descarga
+             por páginas directamente a `path_salida` (sin Google Drive,
+             ver **`herramientas/descarga_ee.py`**)
+* `una_pasada`: Con `True` (y `backend = "ee"`) se reducen únicamente las
+                bandas mensuales y la precipitación anual (`mean`) se
+                calcula como la suma de los promedios mensuales (los meses
+                sin datos no se suman), en una sola tarea y un solo archivo
+                (`..._monthyear_{año}`). El archivo
+                se separa en los archivos `month` y `year` de siempre con
+                `func_separar_month_year`
+* `list_meses`: Únicamente los meses indicados (`["08", "09"]`) en un
+                archivo `..._meses_{año}_{primero}-{último}`, para la
+                actualización incremental (ver **`incremental_chirps.py`**)
+* `diario`: Con `True` se extrae el promedio de cada día (una columna
+            `MMDD` por día) en lugar de las sumas mensuales y anual. Con
+            Earth Engine se genera un archivo por mes
+            (`..._day_{año}_{mes}`) y con `backend = "local"` un archivo por
+            año (`..._day_{año}`). Los índices de lluvia extrema se calculan
+            con **`extremos_chirps.py`**
+* `estadisticas`: Estadísticas además del promedio (`["min", "max",
+                  "stdDev", "p25", "p50", "p75"]`) en la misma reducción:
+                  un reductor combinado (`ee.Reducer.combine`) en Earth
+                  Engine y una sola pasada en `backend = "local"`. Se
+                  agregan como columnas `{mes}_{estadística}` en el archivo
+                  `month` y `{estadística}` en el archivo `year` (con
+                  `una_pasada`, las del año salen de la banda anual que se
+                  agrega a la misma reducción)
+
+Nota: El promedio de la suma de las bandas es la suma de los promedios de
+      cada banda (mismos pixeles y pesos), por lo que `una_pasada = True`
+      da el mismo resultado que la reducción de la imagen anual.
+
+Los nombres de las salidas de Earth Engine y las columnas a las que se
+cambian (`func_nombres_estadisticas`) se revisan en
+**`simulacion_nombres_chirps.py`**.
 """
 
 # = = = Imports = = = #
-import ee
+import os
+import re
+import sys
 from datetime import datetime
 
-# Trigger the authentication flow.
-ee.Authenticate()
+import pandas as pd
 
-# Initialize the library.
-ee.Initialize(project='project-name')
+try:
+    import ee
+except ImportError:
+    ee = None
+
+from pesos_chirps import func_validar_estadisticas, patron_estadistica
+from zonal_chirps import func_chirps_diario_local, func_chirps_metrics_local
+
+path2ee = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+sys.path.append(os.path.join(path2ee, "herramientas"))
+from descarga_ee import func_descargar_fc
+
+ee_iniciado = False
+
+# = = Autenticación e inicio de Earth Engine (retorna: vacío) = = #
+def func_iniciar_ee():
+    global ee_iniciado
+
+    if not ee_iniciado:
+        # Trigger the authentication flow.
+        ee.Authenticate()
+
+        # Initialize the library.
+        ee.Initialize(project='project-name')
+        ee_iniciado = True
+
+    return None
 
 # = = Función de extracción (retorna: vacío) = = #
 def get_chirps_metrics(
         n_year_interes,
         limit_date,
-        fc_interes):
+        fc_interes,
+        backend = "ee",
+        una_pasada = False,
+        list_meses = None,
+        diario = False,
+        estadisticas = None,
+        **kwargs_local):
+
+    estadisticas = func_validar_estadisticas(estadisticas)
+    if diario and estadisticas:
+        raise ValueError("`estadisticas` no está disponible con `diario = True`")
+
+    # - - Extracción local (sin Earth Engine) - - #
+    if backend == "local" and diario:
+        func_chirps_diario_local(n_year_interes = n_year_interes,
+                                 limit_date = limit_date,
+                                 fc_interes = fc_interes,
+                                 **kwargs_local)
+        return None
+
+    if backend == "local":
+        func_chirps_metrics_local(n_year_interes = n_year_interes,
+                                  limit_date = limit_date,
+                                  fc_interes = fc_interes,
+                                  list_meses = list_meses,
+                                  estadisticas = estadisticas,
+                                  **kwargs_local)
+        return None
+
+    # - - Descarga directa (sin Google Drive) - - #
+    if backend == "ee_directo":
+        dict_colecciones = func_colecciones_chirps(
+            n_year_interes = n_year_interes,
+            limit_date = limit_date,
+            fc_interes = fc_interes,
+            una_pasada = una_pasada,
+            list_meses = list_meses,
+            diario = diario,
+            estadisticas = estadisticas)
+        path_salida = kwargs_local.pop('path_salida')
+        os.makedirs(path_salida, exist_ok = True)
+        for filename, fc_periodo in dict_colecciones.items():
+            # Mismos nombres que los archivos en `data/ee_imports`
+            func_descargar_fc(fc_periodo,
+                              os.path.join(path_salida, f"mex_{filename}.csv"),
+                              **kwargs_local)
+        return None
+
+    # - - Exportación desde Earth Engine - - #
+    dict_tareas = func_tareas_chirps(n_year_interes = n_year_interes,
+                                     limit_date = limit_date,
+                                     fc_interes = fc_interes,
+                                     una_pasada = una_pasada,
+                                     list_meses = list_meses,
+                                     diario = diario,
+                                     estadisticas = estadisticas)
+    for filename, task in dict_tareas.items():
+        task.start()
+        print(f"Task: {filename}")
+
+    return None
+
+# = = Tareas de exportación sin iniciar (retorna: dict) = = #
+def func_tareas_chirps(
+        n_year_interes,
+        limit_date,
+        fc_interes,
+        una_pasada = False,
+        list_meses = None,
+        diario = False,
+        estadisticas = None):
+    # Llave: nombre del archivo (`description` de la tarea)
+    dict_colecciones = func_colecciones_chirps(n_year_interes = n_year_interes,
+                                               limit_date = limit_date,
+                                               fc_interes = fc_interes,
+                                               una_pasada = una_pasada,
+                                               list_meses = list_meses,
+                                               diario = diario,
+                                               estadisticas = estadisticas)
+
+    return {filename: ee.batch.Export.table.toDrive(collection = fc_periodo,
+                                                   description = filename,
+                                                   folder = "pruebas_ee")
+            for filename, fc_periodo in dict_colecciones.items()}
+
+# = = Reductor con el promedio y otras estadísticas (retorna: ee.Reducer) = = #
+def func_reductor_ee(estadisticas):
+    # Un solo reductor (`sharedInputs`): las estadísticas se calculan en la
+    # misma pasada sobre los pixeles
+    dict_reductores = dict(min = ee.Reducer.min,
+                           max = ee.Reducer.max,
+                           stdDev = ee.Reducer.stdDev)
+    reductor = ee.Reducer.mean()
+    for estadistica in estadisticas:
+        if estadistica in dict_reductores:
+            reductor = reductor.combine(reducer2 = dict_reductores[estadistica](),
+                                        sharedInputs = True)
+
+    list_percentiles = [int(estadistica[1:]) for estadistica in estadisticas
+                        if estadistica.startswith('p')]
+    if list_percentiles:
+        # Nombres `p25`, `p50`, ... (como `pesos_chirps.py`)
+        reductor = reductor.combine(
+            reducer2 = ee.Reducer.percentile(list_percentiles),
+            sharedInputs = True)
+    return reductor
+
+# = = Nombres de Earth Engine a nombres de columnas (retorna: dict) = = #
+def func_nombres_estadisticas(bandas, estadisticas, banda_year = None):
+    # Con una sola banda Earth Engine nombra las salidas `{estadística}`. Con
+    # varias bandas, el reductor combinado las nombra `{banda}_{estadística}`
+    # y el promedio solo (sin `estadisticas`) `{banda}`. El promedio de los
+    # meses queda como `{banda}` y las estadísticas de la banda anual como
+    # `{estadística}`; el promedio de la banda anual se quita (`None`)
+    list_bandas = list(bandas) + ([banda_year] if banda_year else [])
+    dict_nombres = dict()
+    for banda in list_bandas:
+        for estadistica in ['mean'] + list(estadisticas):
+            if len(list_bandas) == 1:
+                nombre_ee = estadistica
+            elif estadisticas:
+                nombre_ee = f"{banda}_{estadistica}"
+            else:
+                nombre_ee = banda
+            if banda == banda_year:
+                dict_nombres[nombre_ee] = None if estadistica == 'mean' else estadistica
+            else:
+                dict_nombres[nombre_ee] = (banda if estadistica == 'mean'
+                                           else f"{banda}_{estadistica}")
+    return dict_nombres
+
+# = = Renombrar propiedades de un ee.Feature (retorna: ee.Feature) = = #
+def func_renombrar_propiedades(feature, dict_nombres):
+    feature = ee.Feature(feature)
+    dict_renombrar = {nombre_ee: nombre for nombre_ee, nombre in dict_nombres.items()
+                      if nombre is not None and nombre != nombre_ee}
+    list_quitar = [nombre_ee for nombre_ee, nombre in dict_nombres.items()
+                   if nombre != nombre_ee]
+    if not list_quitar:
+        return feature
+
+    feature = feature.set(ee.Dictionary.fromLists(
+        list(dict_renombrar.values()),
+        [feature.get(nombre_ee) for nombre_ee in dict_renombrar]))
+    return feature.select(feature.propertyNames().removeAll(list_quitar))
+
+# = = Colecciones con la precipitación por geometría (retorna: dict) = = #
+def func_colecciones_chirps(
+        n_year_interes,
+        limit_date,
+        fc_interes,
+        una_pasada = False,
+        list_meses = None,
+        diario = False,
+        estadisticas = None):
+    # Llave: nombre del archivo
+
+    func_iniciar_ee()
+    estadisticas = func_validar_estadisticas(estadisticas)
+    reductor = func_reductor_ee(estadisticas)
 
     # - - Función de etiquetado de fecha - - #
     def func_tag_date(img):
@@ -62,7 +288,8 @@ def get_chirps_metrics(
                            .filter(ee.Filter.eq("n_year", n_year_interes)))
 
     # - - Reducción a los periodos de interés - - #
-    list_month = ee.List.sequence(1, 12)
+    list_month = (ee.List.sequence(1, 12) if list_meses is None
+                  else ee.List([int(mes) for mes in list_meses]))
     list_year = ee.List.sequence(n_year_interes, n_year_interes)
 
     # - - Agrupación por año - - #
@@ -98,6 +325,11 @@ def get_chirps_metrics(
             month = [f"0{i}" if i < 10 else str(i) for i in range(1,13)],
             year = [str(n_year_interes)])
 
+    # ~ Únicamente los meses de `list_meses` (actualización incremental) ~ #
+    if list_meses is not None:
+        dict_nombre_bandas["month"] = list(list_meses)
+        una_pasada = True
+
     img_pr_year = (imgcoll_pr_year
                 .toBands()
                 .rename(dict_nombre_bandas["year"]))
@@ -112,12 +344,90 @@ def get_chirps_metrics(
         mun = "projects/project-name/assets/00mun")
     fc = ee.FeatureCollection(dict_fc[fc_interes])
 
+    # - - Promedio de cada día (un archivo por mes) - - #
+    if diario:
+        dict_colecciones = dict()
+        for n_month in range(1, 13):
+            # Días del mes hasta la fecha límite (bandas `MMDD`)
+            list_dias = [fecha for fecha in pd.date_range(
+                             start = f"{n_year_interes}-{n_month:02d}-01",
+                             periods = 31)
+                         if fecha.month == n_month and fecha <= limit_date]
+            if not list_dias:
+                break
+
+            img_pr_day = (chirps_year_interes
+                          .filterDate(list_dias[0].strftime('%Y-%m-%d'),
+                                      (list_dias[-1] + pd.Timedelta(days = 1))
+                                      .strftime('%Y-%m-%d'))
+                          .toBands()
+                          .rename([fecha.strftime("%m%d") for fecha in list_dias]))
+
+            img2fc_pr_day = (img_pr_day
+            .reduceRegions(
+                collection = fc,
+                reducer = ee.Reducer.mean(),
+                scale = 5566)
+            .map(lambda feature: (ee.Feature(feature)
+                                    .set({'n_year': n_year_interes})
+                                    .setGeometry(None))))
+
+            filename_pr_day = f"chirps_pr_mm_{fc_interes}_day_{n_year_interes}_{n_month:02d}"
+            dict_colecciones[filename_pr_day] = ee.FeatureCollection(
+                img2fc_pr_day.toList(3000).flatten())
+
+        return dict_colecciones
+
+    # - - Precipitación mensual y anual en una sola reducción - - #
+    if una_pasada:
+        bandas_mes = ee.List(dict_nombre_bandas["month"])
+        # ~ Con estadísticas, la banda anual entra en la misma reducción ~ #
+        banda_year = (dict_nombre_bandas["year"][0]
+                      if estadisticas and list_meses is None else None)
+        img_pr_monthyear = (img_pr_month.addBands(img_pr_year) if banda_year
+                            else img_pr_month)
+        dict_nombres = func_nombres_estadisticas(dict_nombre_bandas["month"],
+                                                 estadisticas, banda_year)
+
+        def func_feature_monthyear(feature):
+            # Con un solo mes Earth Engine nombra la salida `mean`; después
+            # de renombrar, todos los meses quedan como `{banda}`
+            feature = func_renombrar_propiedades(feature, dict_nombres)
+            # Los meses sin datos (propiedad nula o ausente) no se suman
+            # (`ee.List.map` quita los nulos); sin ningún mes el total es nulo
+            valores_mes = ee.List(bandas_mes.map(
+                lambda banda: feature.get(ee.String(banda))))
+            total_year = ee.Algorithms.If(valores_mes.size().gt(0),
+                                          valores_mes.reduce(ee.Reducer.sum()),
+                                          None)
+            return (feature
+                    .set({'n_year': n_year_interes,
+                          'mean': total_year})
+                    .setGeometry(None))
+
+        img2fc_pr_monthyear = (img_pr_monthyear
+        .reduceRegions(
+            collection = fc,
+            reducer = reductor,
+            scale = 5566)
+        .map(func_feature_monthyear))
+
+        fc_pr_monthyear = ee.FeatureCollection(
+            img2fc_pr_monthyear.toList(3000).flatten())
+
+        filename_pr_monthyear = f"chirps_pr_mm_{fc_interes}_monthyear_{n_year_interes}"
+        if list_meses is not None:
+            filename_pr_monthyear = (f"chirps_pr_mm_{fc_interes}_meses_{n_year_interes}_"
+                                     f"{list_meses[0]}-{list_meses[-1]}")
+
+        return {filename_pr_monthyear: fc_pr_monthyear}
+
     # - - Precipitación anual - - #
     # ~ Pasar imagen a FeatureCollection ~ #
     img2fc_pr_year = (img_pr_year
     .reduceRegions(
         collection = fc,
-        reducer = ee.Reducer.mean(),
+        reducer = reductor,
         scale = 5566)
     .map(lambda feature: (ee.Feature(feature)
                             .set({'n_year': n_year_interes})
@@ -129,12 +439,14 @@ def get_chirps_metrics(
     fc_pr_year = ee.FeatureCollection(img2fc_pr_year.toList(3000).flatten())
 
     # - - Precipitación mensual - - #
+    dict_nombres = func_nombres_estadisticas(dict_nombre_bandas["month"],
+                                             estadisticas)
     img2fc_pr_month = (img_pr_month
     .reduceRegions(
         collection = fc,
-        reducer = ee.Reducer.mean(),
+        reducer = reductor,
         scale = 5566)
-    .map(lambda feature: (ee.Feature(feature)
+    .map(lambda feature: (func_renombrar_propiedades(feature, dict_nombres)
                             .set({'n_year': n_year_interes})
                             .setGeometry(None))))
 
@@ -147,20 +459,37 @@ def get_chirps_metrics(
     # ~ Precipitación mensual ~ #
     filename_pr_month = f"chirps_pr_mm_{fc_interes}_month_{n_year_interes}"
 
-    # ~ Exportar precipitación anual ~ #
-    task_pr_year = ee.batch.Export.table.toDrive(
-        collection = fc_pr_year,
-        description = filename_pr_year,
-        folder = "pruebas_ee")
-    task_pr_year.start()
-    print(f"Task: {filename_pr_year}")
-
-    # ~ Exportar precipitacion mensual ~ #
-    task_pr_month = ee.batch.Export.table.toDrive(
-        collection = fc_pr_month,
-        description = filename_pr_month,
-        folder = "pruebas_ee")
-    task_pr_month.start()
-    print(f"Task: {filename_pr_month}")
-
-    return None
\ No newline at end of file
+    return {filename_pr_year: fc_pr_year,
+            filename_pr_month: fc_pr_month}
+
+# = = Separar el archivo `monthyear` en `month` y `year` (retorna: dict) = = #
+def func_separar_month_year(path_csv_monthyear, encoding = "latin-1"):
+    # Se lee todo como texto y con `latin-1` (un byte por caracter) para
+    # escribir los valores y nombres exactamente como vienen de Earth Engine
+    datframe = pd.read_csv(filepath_or_buffer = path_csv_monthyear,
+                           dtype = str,
+                           keep_default_na = False,
+                           encoding = encoding)
+    # Bandas de los meses (`01`, `01_min`, ...) y columnas del año (`mean`,
+    # `min`, ...)
+    cols_bandas = [col for col in datframe.columns
+                   if re.fullmatch(r"\d{2}(_\w+)?", col)]
+    cols_year = [col for col in datframe.columns
+                 if col == 'mean' or patron_estadistica.fullmatch(col)]
+
+    dict_datframes = dict(
+        month = datframe.drop(columns = cols_year),
+        year = datframe.drop(columns = cols_bandas))
+
+    dict_paths = dict()
+    for periodo, datframe_periodo in dict_datframes.items():
+        dict_paths[periodo] = os.path.join(
+            os.path.dirname(path_csv_monthyear),
+            os.path.basename(path_csv_monthyear).replace("_monthyear_",
+                                                         f"_{periodo}_"))
+        datframe_periodo.to_csv(dict_paths[periodo],
+                                index = False,
+                                encoding = encoding)
+        print(f"Archivo: {dict_paths[periodo]}")
+
+    return dict_paths
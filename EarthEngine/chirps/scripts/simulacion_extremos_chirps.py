@@ -0,0 +1,137 @@
+"""
+Author: Isaac Arroyo
+Notes: Simulación de `func_extremos_chirps` (**`extremos_chirps.py`**) con
+       archivos diarios sintéticos (lluvia aleatoria con temporada seca).
+
+Se verifica que:
+
+* Los índices de todas las geometrías (matriz geometría x día) sean
+  iguales a los de un cálculo día por día de cada geometría con la serie
+  completa, incluidas las rachas y ventanas que cruzan de un año a otro
+* Los archivos por mes (Earth Engine) y por año (extracción local) den el
+  mismo resultado
+
+Uso:
+    python simulacion_extremos_chirps.py [n_geometrias] [n_years]
+"""
+
+# = = = Imports = = = #
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from extremos_chirps import (func_extremos_chirps, n_dias_rx5day,
+                             percentil_r95p, umbral_lluvia, umbral_r20mm)
+
+# = = Escribir archivos diarios sintéticos (retorna: dict) = = #
+def func_diario_sintetico(path_diario, n_geometrias, list_years,
+                          years_por_mes = (), semilla = 0):
+    # Regresa {cvegeo: serie completa} para la comparación
+    aleatorio = np.random.default_rng(semilla)
+    list_cvegeo = [f"{i:05d}" for i in range(1, n_geometrias + 1)]
+    dict_series = {cvegeo: list() for cvegeo in list_cvegeo}
+
+    for n_year in list_years:
+        fechas = pd.date_range(f"{n_year}-01-01", f"{n_year}-12-31")
+        temporada = 0.15 + 0.6 * np.sin(np.pi * (fechas.dayofyear.to_numpy() - 120) / 365).clip(0)
+        lluvia = aleatorio.random((n_geometrias, len(fechas))) < temporada
+        valores = np.where(lluvia, aleatorio.gamma(0.8, 9, lluvia.shape), 0)
+        valores[aleatorio.random(valores.shape) < 0.002] = np.nan
+        for cvegeo, serie in zip(list_cvegeo, valores):
+            dict_series[cvegeo].append(serie)
+
+        datframe = pd.DataFrame(valores, columns = fechas.strftime("%m%d"))
+        datframe.insert(0, 'CVEGEO', list_cvegeo)
+        # Geometrías en otro orden (como en los archivos de Earth Engine)
+        datframe = datframe.sample(frac = 1, random_state = n_year)
+        if n_year in years_por_mes:
+            for n_month in range(1, 13):
+                columnas = [col for col in datframe.columns[1:]
+                            if int(col[:2]) == n_month]
+                datframe[['CVEGEO'] + columnas].to_csv(
+                    os.path.join(path_diario, f"mex_chirps_pr_mm_mun_day_{n_year}_{n_month:02d}.csv"),
+                    index = False)
+        else:
+            datframe.to_csv(
+                os.path.join(path_diario, f"mex_chirps_pr_mm_mun_day_{n_year}.csv"),
+                index = False)
+
+    return {cvegeo: np.concatenate(list_series)
+            for cvegeo, list_series in dict_series.items()}
+
+# = = Índices de una geometría, día por día (retorna: pd.DataFrame) = = #
+def func_extremos_lento(serie, list_years, n_year_inicio, n_year_fin):
+    years = np.concatenate([np.full(len(pd.date_range(f"{n_year}-01-01",
+                                                      f"{n_year}-12-31")), n_year)
+                            for n_year in list_years])
+    base = serie[(years >= n_year_inicio) & (years <= n_year_fin)]
+    umbral = np.percentile(base[base >= umbral_lluvia], percentil_r95p)
+
+    list_registros = list()
+    racha_seca = racha_lluvia = 0
+    for n_year in list_years:
+        registro = dict(n_year = n_year, cdd = 0, cwd = 0, r20mm = 0, r95p = 0.0,
+                        rx1day = np.nan, rx5day = np.nan, prcptot = 0.0)
+        for i in np.nonzero(years == n_year)[0]:
+            valor = serie[i]
+            racha_seca = racha_seca + 1 if valor < umbral_lluvia else 0
+            racha_lluvia = racha_lluvia + 1 if valor >= umbral_lluvia else 0
+            registro['cdd'] = max(registro['cdd'], racha_seca)
+            registro['cwd'] = max(registro['cwd'], racha_lluvia)
+            if np.isnan(valor):
+                continue
+            registro['r20mm'] += valor >= umbral_r20mm
+            if valor >= umbral_lluvia:
+                registro['prcptot'] += valor
+                registro['r95p'] += valor if valor > umbral else 0
+            registro['rx1day'] = np.nanmax([registro['rx1day'], valor])
+            if i >= n_dias_rx5day - 1:
+                ventana = serie[i - n_dias_rx5day + 1:i + 1]
+                if not np.isnan(ventana).any():
+                    registro['rx5day'] = np.nanmax([registro['rx5day'], ventana.sum()])
+        list_registros.append(registro)
+    return pd.DataFrame(list_registros)
+
+if __name__ == "__main__":
+    n_geometrias = int(sys.argv[1]) if len(sys.argv) > 1 else 2475
+    n_years = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    list_years = list(range(2005, 2005 + n_years))
+    n_year_inicio, n_year_fin = list_years[0], list_years[n_years // 2]
+    list_columnas = ['cdd', 'cwd', 'r20mm', 'r95p', 'rx1day', 'rx5day', 'prcptot']
+
+    with tempfile.TemporaryDirectory() as path_temporal:
+        path_anual = os.path.join(path_temporal, "anual")
+        path_mensual = os.path.join(path_temporal, "mensual")
+        os.makedirs(path_anual)
+        os.makedirs(path_mensual)
+        dict_series = func_diario_sintetico(path_anual, n_geometrias, list_years)
+        func_diario_sintetico(path_mensual, n_geometrias, list_years,
+                              years_por_mes = list_years[1::2])
+
+        tiempo_inicio = time.perf_counter()
+        datframe = func_extremos_chirps("mun", path_anual, n_year_inicio, n_year_fin)
+        tiempo = time.perf_counter() - tiempo_inicio
+        datframe_mensual = func_extremos_chirps("mun", path_mensual,
+                                                n_year_inicio, n_year_fin)
+
+    pd.testing.assert_frame_equal(datframe, datframe_mensual)
+
+    # - - Comparación con el cálculo día por día - - #
+    list_cvegeo = list(dict_series)[::max(1, n_geometrias // 25)]
+    for cvegeo in list_cvegeo:
+        lento = func_extremos_lento(dict_series[cvegeo], list_years,
+                                    n_year_inicio, n_year_fin)
+        rapido = datframe[datframe['cvegeo'] == cvegeo].reset_index(drop = True)
+        np.testing.assert_array_equal(rapido[['cdd', 'cwd', 'r20mm']],
+                                      lento[['cdd', 'cwd', 'r20mm']])
+        np.testing.assert_allclose(rapido[['r95p', 'rx1day', 'rx5day', 'prcptot']],
+                                   lento[['r95p', 'rx1day', 'rx5day', 'prcptot']],
+                                   rtol = 1e-10)
+
+    print(f"Índices ({', '.join(list_columnas)}) de {n_geometrias} geometrías "
+          f"y {n_years} años: {tiempo:.2f} s; "
+          f"{len(list_cvegeo)} geometrías iguales al cálculo día por día")
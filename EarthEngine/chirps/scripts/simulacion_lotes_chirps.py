@@ -0,0 +1,222 @@
+"""
+Author: Isaac Arroyo
+Notes: Simulación de `func_lote_chirps` (**`lotes_chirps.py`**) sin Earth
+       Engine. Las tareas simuladas tienen lo mismo que `ee.batch.Task`
+       que se usa (`start()`, `status()` e `id`): duran un número
+       aleatorio de consultas y fallan con cierta probabilidad.
+
+Se verifica que:
+
+* Nunca haya más de `n_max_tareas` tareas activas al mismo tiempo
+* Las tareas que fallan se reintentan hasta `n_reintentos` veces
+* El manifiesto tenga el estado final de cada tarea, y que al correr de
+  nuevo con el mismo manifiesto no se envíen las tareas completadas
+* Al continuar una corrida interrumpida (el proceso termina con tareas
+  enviadas), las tareas que siguen activas en el servidor no se vuelvan a
+  enviar y cuenten para `n_max_tareas`, las que terminaron mientras tanto
+  se marquen como completadas y únicamente las que fallaron se reintenten
+
+Uso:
+    python simulacion_lotes_chirps.py [n_max_tareas] [prob_fallo]
+"""
+
+# = = = Imports = = = #
+import json
+import os
+import random
+import sys
+import tempfile
+
+from lotes_chirps import func_lote_chirps
+
+# = = Servidor simulado: reloj y tareas activas = = #
+class ServidorSimulado:
+    def __init__(self, prob_fallo = 0.2, semilla = 0):
+        self.aleatorio = random.Random(semilla)
+        self.prob_fallo = prob_fallo
+        self.reloj = 0
+        self.activas = set()
+        self.max_activas = 0
+        self.envios = list()
+        self.tareas = dict()
+
+    # Reemplazo de `time.sleep`
+    def dormir(self, segundos):
+        self.reloj += segundos
+
+    # Reemplazo de `ee.data.getTaskStatus(id)[0]`
+    def estado_tarea(self, id_tarea):
+        if id_tarea not in self.tareas:
+            return dict(state = 'UNKNOWN', id = id_tarea)
+        return self.tareas[id_tarea].status()
+
+# = = Interrupción del proceso (p. ej. se cierra la sesión) = = #
+class InterrupcionSimulada(Exception):
+    pass
+
+# = = `time.sleep` que interrumpe el proceso después de n esperas = = #
+def func_dormir_interrumpido(servidor, n_esperas):
+    def func_dormir(segundos):
+        if len(servidor.envios) >= n_esperas:
+            raise InterrupcionSimulada()
+        servidor.dormir(segundos)
+    return func_dormir
+
+# = = Tarea simulada (como `ee.batch.Task`) = = #
+class TareaSimulada:
+    def __init__(self, servidor, nombre):
+        self.servidor = servidor
+        self.nombre = nombre
+        self.id = None
+        self.estado = 'UNSUBMITTED'
+
+    def start(self):
+        servidor = self.servidor
+        self.id = f"SIM{len(servidor.envios):06d}"
+        servidor.tareas[self.id] = self
+        self.fin = servidor.reloj + servidor.aleatorio.randint(1, 120)
+        self.falla = servidor.aleatorio.random() < servidor.prob_fallo
+        self.estado = 'READY'
+        servidor.envios.append(self.nombre)
+        servidor.activas.add(self.id)
+        servidor.max_activas = max(servidor.max_activas,
+                                   len(servidor.activas))
+
+    def status(self):
+        servidor = self.servidor
+        if self.estado in ('READY', 'RUNNING'):
+            if servidor.reloj >= self.fin:
+                self.estado = 'FAILED' if self.falla else 'COMPLETED'
+                servidor.activas.discard(self.id)
+            else:
+                self.estado = 'RUNNING'
+
+        status = dict(state = self.estado, id = self.id)
+        if self.estado == 'FAILED':
+            status['error_message'] = "Error simulado"
+        return status
+
+# = = `func_tareas_chirps` simulada (retorna: dict) = = #
+def func_tareas_simuladas(servidor):
+    def func_tareas(n_year_interes, limit_date, fc_interes, una_pasada = False):
+        list_periodos = ['monthyear'] if una_pasada else ['year', 'month']
+        list_nombres = [f"chirps_pr_mm_{fc_interes}_{periodo}_{n_year_interes}"
+                        for periodo in list_periodos]
+        return {nombre: TareaSimulada(servidor, nombre)
+                for nombre in list_nombres}
+    return func_tareas
+
+if __name__ == "__main__":
+    n_max_tareas = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    prob_fallo = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    n_reintentos = 2
+
+    with tempfile.TemporaryDirectory() as path_temporal:
+        path_manifiesto = os.path.join(path_temporal, "manifiesto.json")
+
+        servidor = ServidorSimulado(prob_fallo = prob_fallo)
+        dict_manifiesto = func_lote_chirps(
+            list_years = range(1981, 2026),
+            list_fc = ['ent', 'mun'],
+            limit_date = '2025-12-31',
+            path_manifiesto = path_manifiesto,
+            func_tareas = func_tareas_simuladas(servidor),
+            n_max_tareas = n_max_tareas,
+            n_reintentos = n_reintentos,
+            func_dormir = servidor.dormir)
+
+        dict_registros = dict_manifiesto['tareas']
+        list_completadas = [nombre for nombre, registro in dict_registros.items()
+                            if registro['estado'] == 'COMPLETED']
+        list_fallidas = [nombre for nombre, registro in dict_registros.items()
+                         if registro['estado'] == 'FAILED']
+
+        assert servidor.max_activas <= n_max_tareas
+        assert len(list_completadas) + len(list_fallidas) == len(dict_registros)
+        assert all(dict_registros[nombre]['intentos'] == n_reintentos + 1
+                   for nombre in list_fallidas)
+        assert all(len(registro['errores']) == registro['intentos'] - 1
+                   for registro in dict_registros.values()
+                   if registro['estado'] == 'COMPLETED')
+        with open(path_manifiesto, encoding = "utf-8") as archivo:
+            assert json.load(archivo)['tareas'] == dict_registros
+
+        print(f"Tareas: {len(dict_registros)}, envíos: {len(servidor.envios)}, "
+              f"máximo al mismo tiempo: {servidor.max_activas}, "
+              f"completadas: {len(list_completadas)}, "
+              f"fallidas: {len(list_fallidas)}, "
+              f"tiempo simulado: {servidor.reloj / 60:.0f} min")
+
+        # - - Segunda corrida con el mismo manifiesto - - #
+        servidor_2 = ServidorSimulado(prob_fallo = 0)
+        func_lote_chirps(
+            list_years = range(1981, 2026),
+            list_fc = ['ent', 'mun'],
+            limit_date = '2025-12-31',
+            path_manifiesto = path_manifiesto,
+            func_tareas = func_tareas_simuladas(servidor_2),
+            n_max_tareas = n_max_tareas,
+            func_dormir = servidor_2.dormir)
+
+        assert sorted(servidor_2.envios) == sorted(list_fallidas)
+        print(f"Segunda corrida: {len(servidor_2.envios)} envíos "
+              f"(las tareas que fallaron)")
+
+    # - - Continuación de una corrida interrumpida - - #
+    with tempfile.TemporaryDirectory() as path_temporal:
+        path_manifiesto = os.path.join(path_temporal, "manifiesto.json")
+        kwargs_lote = dict(list_years = range(1981, 2026),
+                           list_fc = ['ent', 'mun'],
+                           limit_date = '2025-12-31',
+                           path_manifiesto = path_manifiesto,
+                           n_max_tareas = n_max_tareas,
+                           n_reintentos = n_reintentos)
+
+        servidor = ServidorSimulado(prob_fallo = prob_fallo, semilla = 1)
+        try:
+            func_lote_chirps(func_tareas = func_tareas_simuladas(servidor),
+                             func_dormir = func_dormir_interrumpido(servidor, 30),
+                             func_estado_tarea = servidor.estado_tarea,
+                             **kwargs_lote)
+        except InterrupcionSimulada:
+            pass
+
+        with open(path_manifiesto, encoding = "utf-8") as archivo:
+            dict_interrumpido = json.load(archivo)['tareas']
+        dict_enviadas = {nombre: registro['id_tarea']
+                         for nombre, registro in dict_interrumpido.items()
+                         if registro['estado'] in ('READY', 'RUNNING')}
+        assert dict_enviadas
+
+        # Las tareas siguen en el servidor mientras el proceso no corre
+        servidor.dormir(60)
+        dict_estado_servidor = {nombre: servidor.tareas[id_tarea].status()['state']
+                                for nombre, id_tarea in dict_enviadas.items()}
+        n_envios = len(servidor.envios)
+
+        dict_manifiesto = func_lote_chirps(func_tareas = func_tareas_simuladas(servidor),
+                                           func_dormir = servidor.dormir,
+                                           func_estado_tarea = servidor.estado_tarea,
+                                           **kwargs_lote)
+        dict_registros = dict_manifiesto['tareas']
+        list_reenvios = servidor.envios[n_envios:]
+
+        assert servidor.max_activas <= n_max_tareas
+        for nombre, estado in dict_estado_servidor.items():
+            if estado == 'COMPLETED':
+                assert nombre not in list_reenvios
+                assert dict_registros[nombre]['estado'] == 'COMPLETED'
+            elif estado == 'FAILED':
+                assert nombre in list_reenvios
+            else:
+                # Seguía activa: se sigue con el mismo id, sin enviarla de
+                # nuevo hasta que termine
+                assert (nombre not in list_reenvios or
+                        servidor.tareas[dict_enviadas[nombre]].status()['state'] == 'FAILED')
+        assert all(registro['estado'] in ('COMPLETED', 'FAILED')
+                   for registro in dict_registros.values())
+
+        print(f"Continuación: {len(dict_enviadas)} tareas enviadas al "
+              f"interrumpir ({sum(estado == 'COMPLETED' for estado in dict_estado_servidor.values())} "
+              f"completadas y {sum(estado == 'RUNNING' for estado in dict_estado_servidor.values())} "
+              f"activas en el servidor), máximo al mismo tiempo: {servidor.max_activas}")
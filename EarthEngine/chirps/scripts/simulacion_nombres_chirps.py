@@ -0,0 +1,70 @@
+"""
+Author: Isaac Arroyo
+Notes: Revisión de los nombres de las salidas de Earth Engine y de su
+       cambio a los nombres de las columnas (`func_nombres_estadisticas` de
+       **`raster2csv_chirps.py`**), sin Earth Engine.
+
+`reduceRegions` nombra las propiedades según el número de bandas y de
+reductores:
+
+* Una banda: `{estadística}` (`mean`, `min`, ...)
+* Varias bandas y únicamente el promedio: `{banda}` (`01`, ..., `12`)
+* Varias bandas y reductor combinado: `{banda}_{estadística}`
+
+Se verifica que, para 1 y 12 bandas, con y sin `estadisticas` (y con la
+banda anual de `una_pasada`), el mapa de nombres parta de las propiedades
+que genera Earth Engine y llegue a las columnas de la extracción local
+(**`zonal_chirps.py`**): `{banda}` y `{banda}_{estadística}` para los meses
+y `{estadística}` para el año.
+
+Uso:
+    python simulacion_nombres_chirps.py
+"""
+
+# = = = Imports = = = #
+from raster2csv_chirps import func_nombres_estadisticas
+
+# = = Propiedades que genera `reduceRegions` (retorna: list) = = #
+def func_salidas_ee(bandas, estadisticas):
+    list_estadisticas = ['mean'] + list(estadisticas)
+    if len(bandas) == 1:
+        return list_estadisticas
+    if not estadisticas:
+        return list(bandas)
+    return [f"{banda}_{estadistica}" for banda in bandas
+            for estadistica in list_estadisticas]
+
+# = = Propiedades después de renombrar (retorna: list) = = #
+def func_renombrar(propiedades, dict_nombres):
+    # Igual que `func_renombrar_propiedades` con un `dict` en lugar de un
+    # `ee.Feature`
+    return sorted(dict_nombres.get(nombre, nombre) for nombre in propiedades
+                  if dict_nombres.get(nombre, nombre) is not None)
+
+if __name__ == "__main__":
+    list_casos = [
+        # (bandas, estadisticas, banda_year, columnas esperadas)
+        (["01"], [], None, ["01"]),
+        ([f"{i:02d}" for i in range(1, 13)], [], None,
+         [f"{i:02d}" for i in range(1, 13)]),
+        (["01"], ["min", "p50"], None, ["01", "01_min", "01_p50"]),
+        ([f"{i:02d}" for i in range(1, 13)], ["min", "p50"], None,
+         [f"{i:02d}{sufijo}" for i in range(1, 13)
+          for sufijo in ("", "_min", "_p50")]),
+        (["01"], ["stdDev"], "2024", ["01", "01_stdDev", "stdDev"]),
+    ]
+
+    for bandas, estadisticas, banda_year, columnas in list_casos:
+        dict_nombres = func_nombres_estadisticas(bandas, estadisticas, banda_year)
+        salidas = func_salidas_ee(bandas + ([banda_year] if banda_year else []),
+                                  estadisticas)
+        # Todas las propiedades de Earth Engine tienen nombre de columna
+        assert sorted(dict_nombres) == sorted(salidas), (dict_nombres, salidas)
+        assert func_renombrar(salidas, dict_nombres) == sorted(columnas), dict_nombres
+        print(f"{len(bandas)} banda(s), estadísticas {estadisticas or 'ninguna'}"
+              f"{', banda anual' if banda_year else ''}: {len(columnas)} columnas")
+
+    # Sin estadísticas y varias bandas no se renombra nada
+    dict_nombres = func_nombres_estadisticas([f"{i:02d}" for i in range(1, 13)], [])
+    assert all(nombre_ee == nombre for nombre_ee, nombre in dict_nombres.items())
+    assert func_nombres_estadisticas(["01"], []) == {"mean": "01"}
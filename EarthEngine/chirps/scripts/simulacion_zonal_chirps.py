@@ -0,0 +1,213 @@
+"""
+Author: Isaac Arroyo
+Notes: Simulación de la matriz de pesos (**`pesos_chirps.py`**) y del
+       promedio zonal (`func_media_zonal_pesos`) con geometrías y mallas
+       sintéticas.
+
+Se verifica que:
+
+* Un cuadrado que cubre exactamente 2 x 2 pixeles tenga peso 1.0 en cada
+  uno y ningún otro pixel
+* Los pixeles cubiertos en parte tengan como peso la fracción cubierta
+  (mitades, cuartos y tres cuartos)
+* Los pixeles dentro del hueco de un polígono no tengan peso y los
+  cubiertos en parte por el hueco tengan la fracción sin hueco
+* Con polígonos irregulares (con huecos y `MultiPolygon`) y pixeles sin
+  datos, el promedio zonal sea igual al promedio de los sub-pixeles cuyo
+  centro está dentro de la geometría, calculado punto por punto (fuerza
+  bruta)
+* Las estadísticas de una pasada (`func_estadisticas_zonales_pesos`) sean
+  iguales a las de cada geometría por separado, también con geometrías
+  sin pixeles (fuera de la malla) al inicio, en medio y al final de la
+  matriz
+
+Las pruebas se hacen con la malla de norte a sur (GeoTIFF, `dy` negativo)
+y de sur a norte (NetCDF de CHIRPS, `dy` positivo).
+
+Uso:
+    python simulacion_zonal_chirps.py [n_geometrias]
+"""
+
+# = = = Imports = = = #
+import sys
+
+import numpy as np
+from scipy import sparse
+
+from geometrias_chirps import func_anillos, func_grid
+from pesos_chirps import (func_estadisticas_zonales_pesos, func_matriz_pesos,
+                          func_media_zonal_pesos)
+
+# = = Polígono rectangular (retorna: list) = = #
+def func_rectangulo(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]
+
+# = = Geometría con sus anillos (retorna: dict) = = #
+def func_geometria(*anillos):
+    return dict(geometria = dict(type = 'Polygon',
+                                 coordinates = [list(anillo) for anillo in anillos]),
+                propiedades = dict())
+
+# = = Pesos de una geometría por pixel (retorna: dict) = = #
+def func_pesos_pixeles(geometria, grid, n_subpixeles = 8):
+    # {(renglón, columna): peso}, con el renglón de la malla
+    fila = func_matriz_pesos([geometria], grid, n_subpixeles).tocoo()
+    return {divmod(int(pix), grid['n_cols']): float(peso)
+            for pix, peso in zip(fila.col, fila.data)}
+
+# = = Renglón de la malla de un renglón contado de sur a norte (retorna: int) = = #
+def func_renglon(grid, renglon_sur):
+    return renglon_sur if grid['dy'] > 0 else grid['n_rows'] - 1 - renglon_sur
+
+# = = Punto dentro de una geometría, regla par-impar (retorna: np.ndarray) = = #
+def func_dentro_fuerza_bruta(anillos, xs, ys):
+    # Una arista a la vez sobre todos los puntos (independiente de la
+    # búsqueda por renglones de `func_pixeles_geometria`)
+    dentro = np.zeros(xs.shape, dtype = bool)
+    for anillo in anillos:
+        for (x1, y1), (x2, y2) in zip(anillo[:-1], anillo[1:]):
+            cruza = (y1 > ys) != (y2 > ys)
+            with np.errstate(divide = 'ignore', invalid = 'ignore'):
+                x_cruce = x1 + (ys - y1) * (x2 - x1) / (y2 - y1)
+            dentro ^= cruza & (xs < x_cruce)
+    return dentro
+
+# = = Promedio de los sub-pixeles dentro de la geometría (retorna: np.ndarray) = = #
+def func_media_fuerza_bruta(geometria, grid, bandas, n_subpixeles = 8):
+    anillos = func_anillos(geometria['geometria'])
+    n_sub_cols = grid['n_cols'] * n_subpixeles
+    n_sub_rows = grid['n_rows'] * n_subpixeles
+    xs = grid['x0'] + (np.arange(n_sub_cols) + 0.5) * grid['dx'] / n_subpixeles
+    ys = grid['y0'] + (np.arange(n_sub_rows) + 0.5) * grid['dy'] / n_subpixeles
+    xs, ys = np.meshgrid(xs, ys)
+
+    sub_rows, sub_cols = np.nonzero(func_dentro_fuerza_bruta(anillos, xs, ys))
+    pix = (sub_rows // n_subpixeles) * grid['n_cols'] + sub_cols // n_subpixeles
+    # Cada sub-pixel cuenta lo mismo; los pixeles sin datos no cuentan
+    valores = bandas[:, pix]
+    return np.nanmean(valores, axis = 1) if len(pix) else np.full(len(bandas), np.nan)
+
+# = = Estadísticas de una geometría por separado (retorna: dict) = = #
+def func_estadisticas_geometria(pesos, valores):
+    # `pesos` y `valores` de los pixeles de la geometría (una banda)
+    validos = ~np.isnan(valores)
+    pesos, valores = pesos[validos], valores[validos]
+    if len(valores) == 0:
+        return dict(mean = np.nan, min = np.nan, max = np.nan, stdDev = np.nan)
+    media = np.average(valores, weights = pesos)
+    return dict(mean = media, min = valores.min(), max = valores.max(),
+                stdDev = np.sqrt(np.average((valores - media) ** 2, weights = pesos)))
+
+# = = Polígono irregular alrededor de un centro (retorna: list) = = #
+def func_poligono_aleatorio(aleatorio, centro, radio, n_vertices):
+    angulos = np.sort(aleatorio.uniform(0, 2 * np.pi, n_vertices))
+    radios = radio * aleatorio.uniform(0.4, 1.0, n_vertices)
+    anillo = np.column_stack([centro[0] + radios * np.cos(angulos),
+                              centro[1] + radios * np.sin(angulos)])
+    return np.vstack([anillo, anillo[:1]]).tolist()
+
+if __name__ == "__main__":
+    n_geometrias = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+    # Pixeles de 1 grado, 8 columnas x 6 renglones
+    dict_grids = dict(
+        geotiff = func_grid(-100, 26, 1.0, -1.0, 8, 6),
+        netcdf = func_grid(-100, 20, 1.0, 1.0, 8, 6))
+
+    for nombre_grid, grid in dict_grids.items():
+        # - - Pixeles completos - - #
+        pesos = func_pesos_pixeles(
+            func_geometria(func_rectangulo(-98, 21, -96, 23)), grid)
+        assert pesos == {(func_renglon(grid, renglon), columna): 1.0
+                         for renglon in (1, 2) for columna in (2, 3)}, pesos
+
+        # - - Pixeles cubiertos en parte - - #
+        # Columnas: mitad, completa, cuarto. Renglones: tres cuartos, mitad
+        pesos = func_pesos_pixeles(
+            func_geometria(func_rectangulo(-98.5, 21.25, -96.75, 22.5)), grid)
+        esperado = {(func_renglon(grid, renglon), columna): fraccion_x * fraccion_y
+                    for renglon, fraccion_y in ((1, 0.75), (2, 0.5))
+                    for columna, fraccion_x in ((1, 0.5), (2, 1.0), (3, 0.25))}
+        assert pesos.keys() == esperado.keys(), pesos
+        assert all(np.isclose(pesos[pix], esperado[pix]) for pix in esperado), pesos
+
+        # - - Polígono con hueco - - #
+        # Exterior de 4 x 4 pixeles; hueco de los 2 x 2 del centro y medio
+        # pixel a la derecha
+        pesos = func_pesos_pixeles(
+            func_geometria(func_rectangulo(-100, 20, -96, 24),
+                           func_rectangulo(-99, 21, -96.5, 23)), grid)
+        esperado = {(func_renglon(grid, renglon), columna): 1.0
+                    for renglon in range(4) for columna in range(4)}
+        for renglon in (1, 2):
+            del esperado[(func_renglon(grid, renglon), 1)]
+            del esperado[(func_renglon(grid, renglon), 2)]
+            esperado[(func_renglon(grid, renglon), 3)] = 0.5
+        assert pesos.keys() == esperado.keys(), pesos
+        assert all(np.isclose(pesos[pix], esperado[pix]) for pix in esperado), pesos
+        print(f"{nombre_grid}: pesos de pixeles completos, en parte y con hueco")
+
+        # - - Promedio zonal contra fuerza bruta - - #
+        aleatorio = np.random.default_rng(0)
+        n_pixeles = grid['n_cols'] * grid['n_rows']
+        bandas = aleatorio.gamma(2.0, 30.0, (13, n_pixeles))
+        bandas[aleatorio.random(bandas.shape) < 0.1] = np.nan
+
+        geometrias = list()
+        for i in range(n_geometrias):
+            centro = (aleatorio.uniform(-99, -93), aleatorio.uniform(21, 25))
+            exterior = func_poligono_aleatorio(aleatorio, centro, 1.8, 12)
+            if i % 3 == 1:
+                # Hueco dentro del exterior (radio menor al radio mínimo)
+                geometrias.append(func_geometria(
+                    exterior, func_poligono_aleatorio(aleatorio, centro, 0.7, 6)[::-1]))
+            elif i % 3 == 2:
+                segundo = func_poligono_aleatorio(
+                    aleatorio, (centro[0] + 3, centro[1] - 2), 0.6, 5)
+                geometrias.append(dict(
+                    geometria = dict(type = 'MultiPolygon',
+                                     coordinates = [[exterior], [segundo]]),
+                    propiedades = dict()))
+            else:
+                geometrias.append(func_geometria(exterior))
+
+        media = func_media_zonal_pesos(func_matriz_pesos(geometrias, grid), bandas)
+        esperado = np.array([func_media_fuerza_bruta(geometria, grid, bandas)
+                             for geometria in geometrias])
+        assert media.shape == esperado.shape
+        assert np.array_equal(np.isnan(media), np.isnan(esperado))
+        np.testing.assert_allclose(media, esperado, rtol = 1e-5)
+        print(f"{nombre_grid}: promedio de {n_geometrias} geometrías igual al "
+              "de fuerza bruta por sub-pixel")
+
+        # - - Estadísticas con geometrías sin pixeles - - #
+        geometria_fuera = func_geometria(func_rectangulo(-80, 40, -79, 41))
+        geometrias_vacias = ([geometria_fuera] + geometrias[:3] + [geometria_fuera] +
+                             geometrias[3:6] + [geometria_fuera] * 2)
+        matriz = func_matriz_pesos(geometrias_vacias, grid)
+        assert matriz.getnnz(axis = 1)[-1] == 0
+        estadisticas = func_estadisticas_zonales_pesos(matriz, bandas,
+                                                       ["min", "max", "stdDev"])
+        np.testing.assert_allclose(estadisticas['mean'],
+                                   func_media_zonal_pesos(matriz, bandas),
+                                   rtol = 1e-5)
+        for i in range(matriz.shape[0]):
+            fila = matriz[i]
+            for banda in range(len(bandas)):
+                esperado = func_estadisticas_geometria(fila.data.astype(float),
+                                                       bandas[banda, fila.indices])
+                for estadistica, valor in esperado.items():
+                    np.testing.assert_allclose(estadisticas[estadistica][i, banda],
+                                               valor, rtol = 1e-5)
+        print(f"{nombre_grid}: estadísticas con geometrías sin pixeles al "
+              "inicio, en medio y al final")
+
+    # - - Último segmento con datos seguido de geometrías vacías - - #
+    matriz = sparse.csr_matrix((np.ones(4), [0, 1, 2, 3], [0, 2, 4, 4]),
+                               shape = (3, 4))
+    estadisticas = func_estadisticas_zonales_pesos(
+        matriz, np.array([[1.0, 2.0, 3.0, 4.0]]), ["min", "max"])
+    np.testing.assert_array_equal(estadisticas['mean'][:, 0], [1.5, 3.5, np.nan])
+    np.testing.assert_array_equal(estadisticas['min'][:, 0], [1.0, 3.0, np.nan])
+    np.testing.assert_array_equal(estadisticas['max'][:, 0], [2.0, 4.0, np.nan])
+    print("Segmentos [0, 2, 4, 4]: promedio [1.5, 3.5, nan], máximo [2, 4, nan]")
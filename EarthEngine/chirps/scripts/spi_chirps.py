@@ -0,0 +1,183 @@
+"""
+Author: Isaac Arroyo
+Notes: Índice Estandarizado de Precipitación (SPI) de 1, 3, 6 y 12 meses
+       para todas las geometrías del cubo de precipitación mensual
+       (**`cubo_chirps.py`**).
+
+Pasos (para cada escala de `k` meses):
+
+1. **Acumulación**: Suma móvil de `k` meses de la serie mensual continua
+   de cada geometría (resta de sumas acumuladas). Si falta algún mes de la
+   ventana, la acumulación no tiene dato.
+2. **Ajuste**: Para cada geometría y mes del calendario se ajusta una
+   distribución gamma a las acumulaciones mayores a cero del periodo de
+   calibración (por omisión 1981 - 2010), por máxima verosimilitud: el
+   valor inicial de la forma es la aproximación de Thom y se corrige con
+   iteraciones de Newton.
+3. **Meses sin lluvia**: La probabilidad acumulada es la de una
+   distribución mixta, `H(x) = q + (1 - q) G(x)`, donde `q` es la
+   proporción de acumulaciones iguales a cero.
+4. **SPI**: `H(x)` se transforma a la normal estándar y se limita a
+   `[-3.09, 3.09]`.
+
+Todos los ajustes (geometría x mes) se calculan al mismo tiempo con
+arreglos; las geometrías se dividen en bloques que se calculan en varios
+procesos (`n_procesos`).
+
+Uso:
+    python spi_chirps.py [n_procesos]
+"""
+
+# = = = Imports = = = #
+import multiprocessing
+import sys
+import time
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from scipy import special
+
+from cubo_chirps import func_abrir_cubo
+
+list_escalas = [1, 3, 6, 12]
+spi_min, spi_max = -3.09, 3.09
+n_minimo_positivos = 3
+n_iteraciones_newton = 6
+
+# = = Suma móvil de k meses (retorna: np.ndarray) = = #
+def func_acumulacion(serie, k):
+    # `serie`: (geometría x tiempo); las primeras k - 1 columnas no tienen dato
+    validos = ~np.isnan(serie)
+    ceros = np.zeros((serie.shape[0], 1))
+    suma = np.concatenate([ceros, np.cumsum(np.where(validos, serie, 0), axis = 1)],
+                          axis = 1)
+    n_validos = np.concatenate([ceros, np.cumsum(validos, axis = 1)], axis = 1)
+
+    acumulacion = np.full(serie.shape, np.nan)
+    acumulacion[:, k - 1:] = suma[:, k:] - suma[:, :-k]
+    completos = np.zeros(serie.shape, dtype = bool)
+    completos[:, k - 1:] = (n_validos[:, k:] - n_validos[:, :-k]) == k
+    acumulacion[~completos] = np.nan
+    # La resta de sumas acumuladas puede dejar residuos negativos mínimos
+    return np.maximum(acumulacion, 0, where = completos, out = acumulacion)
+
+# = = Ajuste gamma por máxima verosimilitud (retorna: dict) = = #
+def func_ajuste_gamma(valores, eje = 1):
+    # `valores`: acumulaciones del periodo de calibración; se ajusta sobre
+    # el eje `eje` (años)
+    validos = ~np.isnan(valores)
+    positivos = validos & (valores > 0)
+    n_validos = validos.sum(axis = eje)
+    n_positivos = positivos.sum(axis = eje)
+
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        media = np.where(positivos, valores, 0).sum(axis = eje) / n_positivos
+        media_log = (np.where(positivos, np.log(np.where(positivos, valores, 1)), 0)
+                     .sum(axis = eje) / n_positivos)
+        a = np.log(media) - media_log
+
+        # Aproximación de Thom y corrección de Newton de
+        # ln(alpha) - digamma(alpha) = a
+        alpha = (1 + np.sqrt(1 + 4 * a / 3)) / (4 * a)
+        for _ in range(n_iteraciones_newton):
+            f = np.log(alpha) - special.digamma(alpha) - a
+            df = 1 / alpha - special.polygamma(1, alpha)
+            alpha = np.maximum(alpha - f / df, alpha / 2)
+
+    ajustables = (n_positivos >= n_minimo_positivos) & (a > 0)
+    alpha = np.where(ajustables, alpha, np.nan)
+    return dict(alpha = alpha,
+                beta = np.where(ajustables, media / alpha, np.nan),
+                q = np.where(n_validos > 0, (n_validos - n_positivos) /
+                             np.maximum(n_validos, 1), np.nan))
+
+# = = SPI de una escala (retorna: np.ndarray) = = #
+def func_spi_escala(cubo_valores, k, idx_calibracion):
+    # `cubo_valores`: (geometría x año x mes); `idx_calibracion`: rango de
+    # años (slice) del periodo de calibración
+    n_cvegeo, n_years, _ = cubo_valores.shape
+    acumulacion = func_acumulacion(cubo_valores.reshape(n_cvegeo, -1), k)
+    acumulacion = acumulacion.reshape(n_cvegeo, n_years, 12)
+
+    ajuste = func_ajuste_gamma(acumulacion[:, idx_calibracion], eje = 1)
+    alpha, beta, q = (ajuste[llave][:, None, :] for llave in ('alpha', 'beta', 'q'))
+
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        prob = q + (1 - q) * special.gammainc(alpha, acumulacion / beta)
+        prob = np.where(acumulacion == 0, q, prob)
+        spi = special.ndtri(prob)
+    spi = np.clip(spi, spi_min, spi_max)
+    spi[np.isnan(acumulacion) | np.isnan(alpha)] = np.nan
+    return spi
+
+# = = SPI de varias escalas de un bloque de geometrías (retorna: dict) = = #
+def func_spi_bloque(cubo_valores, list_escalas, idx_calibracion):
+    cubo_valores = np.asarray(cubo_valores, dtype = np.float64)
+    return {k: func_spi_escala(cubo_valores, k, idx_calibracion)
+            for k in list_escalas}
+
+# = = SPI de todas las geometrías del cubo (retorna: dict) = = #
+def func_spi_cubo(cubo,
+                  list_escalas = list_escalas,
+                  n_year_inicio = 1981,
+                  n_year_fin = 2010,
+                  n_procesos = None,
+                  n_bloque = 256):
+    # Regresa {k: arreglo (geometría x año x mes)}
+    years = cubo['years']
+    idx_calibracion = slice(n_year_inicio - years[0], n_year_fin - years[0] + 1)
+    list_bloques = [cubo['cubo'][inicio:inicio + n_bloque]
+                    for inicio in range(0, len(cubo['cvegeo']), n_bloque)]
+
+    func_bloque = partial(func_spi_bloque, list_escalas = list_escalas,
+                          idx_calibracion = idx_calibracion)
+    if n_procesos == 1:
+        list_resultados = list(map(func_bloque, list_bloques))
+    else:
+        with multiprocessing.Pool(processes = n_procesos) as pool:
+            list_resultados = pool.map(func_bloque, list_bloques)
+
+    return {k: np.concatenate([resultado[k] for resultado in list_resultados])
+            for k in list_escalas}
+
+# = = SPI en formato long (retorna: pd.DataFrame) = = #
+def func_tabla_spi(cubo, dict_spi):
+    n_cvegeo, n_years, _ = cubo['cubo'].shape
+    datframe = pd.DataFrame({
+        'cvegeo': np.repeat(cubo['cvegeo'], n_years * 12),
+        'n_year': np.tile(np.repeat(cubo['years'], 12), n_cvegeo),
+        'n_month': np.tile(np.arange(1, 13), n_cvegeo * n_years)})
+    for k, spi in dict_spi.items():
+        datframe[f"spi_{k}"] = spi.ravel()
+    return datframe
+
+if __name__ == "__main__":
+    n_procesos = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    cubo = func_abrir_cubo("mun")
+
+    # - - Tiempo a escala nacional (todos los municipios) - - #
+    for n in sorted({1, n_procesos or multiprocessing.cpu_count()}):
+        tiempo_inicio = time.perf_counter()
+        dict_spi = func_spi_cubo(cubo, n_procesos = n)
+        print(f"SPI-{'/'.join(map(str, list_escalas))} de "
+              f"{cubo['cubo'].shape[0]} municipios ({n} proceso(s)): "
+              f"{time.perf_counter() - tiempo_inicio:.2f} s")
+
+    # - - Comparación con el ajuste de scipy.stats de un municipio - - #
+    from scipy import stats
+    i, k = cubo['cvegeo'].index("01001"), 3
+    serie = np.asarray(cubo['cubo'][i], dtype = np.float64).ravel()
+    acumulacion = pd.Series(serie).rolling(k).sum().to_numpy().reshape(-1, 12)
+    diferencia_max = 0
+    for mes in range(12):
+        calibracion = acumulacion[1981 - cubo['years'][0]:2011 - cubo['years'][0], mes]
+        calibracion = calibracion[~np.isnan(calibracion)]
+        q = (calibracion == 0).mean()
+        alpha, _, beta = stats.gamma.fit(calibracion[calibracion > 0], floc = 0)
+        x = acumulacion[:, mes]
+        spi = stats.norm.ppf(q + (1 - q) * stats.gamma.cdf(x, alpha, scale = beta))
+        diferencia_max = max(diferencia_max,
+                             np.nanmax(np.abs(np.clip(spi, spi_min, spi_max) -
+                                              dict_spi[k][i, :, mes])))
+    print(f"Diferencia máxima con scipy.stats (SPI-{k}, 01001): {diferencia_max:.2e}")
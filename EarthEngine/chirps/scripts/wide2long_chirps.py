@@ -0,0 +1,415 @@
+"""
+Author: Isaac Arroyo
+Notes: Versión en Python de **`documentacion_wide2long_chirps.R`**: une los
+       180 archivos de `data/ee_imports` y crea las bases de datos de
+       precipitación de `data/estados`, `data/municipios` y `data/normal`
+       (`db_mex_pr_*.csv`), con los mismos valores y formato que la
+       versión en R.
+
+Pasos:
+
+1. **Lectura en paralelo**: Los archivos se leen con varios procesos,
+   únicamente con las columnas de interés (sin `system:index`, `.geo` ni
+   nombres) y con tipos (`cvegeo` texto, `n_year` entero y precipitación
+   decimal).
+2. **Formato long**: Las columnas de los meses se convierten en filas
+   (`n_month`) con `reshape`, y la precipitación acumulada por año es una
+   suma acumulada sobre la matriz (geometría-año x mes).
+3. **Normal** (1981 - 2010, `n_year_inicio` y `n_year_fin`) y **anomalías**:
+   Promedios por geometría (y mes) y diferencias con la normal, sin
+   `groupby` fila por fila.
+
+Los estados y el nacional se pueden calcular a partir de los municipios
+(`pesos_mun`, **`agregacion_chirps.py`**) en lugar de leer los archivos
+`ent`; en ese caso el nacional es un promedio ponderado y no el promedio
+simple de los estados de R. Es la ruta de actualización sin extracciones
+`ent` en Earth Engine (`list_fc = ('mun',)` en
+**`incremental_chirps.py`**), con los pesos por área de los 2,475
+municipios de `00mun.shp` (`func_pesos_area_00mun`). Sin `pesos_mun` se
+leen los archivos `ent`, por lo que en ese caso siguen siendo necesarios.
+
+Para que los archivos sean idénticos a los de R:
+
+* Los números se leen como `as.numeric` de R (`func_as_numeric_r`), que
+  no siempre redondea igual que Python en el último bit.
+* Los promedios (con la segunda pasada de corrección) y las sumas
+  acumuladas se calculan en el orden y con el tipo (`tipo_acumulador`) de
+  `mean` y `cumsum` de R (`func_media_r`, `func_cumsum_r`).
+* Los números se escriben como `readr::write_csv` (`func_formato_readr` de
+  **`herramientas/formato_readr.py`**).
+
+Uso:
+    python wide2long_chirps.py [n_procesos] [path_00mun]
+
+Con `path_00mun` (`GobiernoMexicano/geometrias/og_geoms/00mun.shp`) los
+estados y el nacional se calculan con los pesos por área de los municipios.
+"""
+
+# = = = Imports = = = #
+import multiprocessing
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+path2chirps = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+path2ee = os.path.dirname(path2chirps)
+path2repo = os.path.dirname(path2ee)
+path2chirpsdata = os.path.join(path2chirps, "data")
+sys.path.append(os.path.join(path2ee, "herramientas"))
+from formato_readr import func_formato_readr
+
+# Periodo base de la normal (ver **`climatologia_chirps.py`** para otros
+# periodos sin volver a leer los archivos)
+n_year_inicio_normal, n_year_fin_normal = 1981, 2010
+list_meses = [f"{i:02d}" for i in range(1, 13)]
+
+# Tipo de `long double` de R (`LDOUBLE`) en el equipo donde se crearon las
+# bases de datos: en ARM (Apple M1/M2) es igual a double (`np.float64`); en
+# x86 es de 80 bits (`np.longdouble`)
+tipo_acumulador = np.float64
+
+patron_archivo = re.compile(r"_(ent|mun)_(month|year)_(\d{4})\.csv$")
+
+# = = = Números como en R = = = #
+
+# = = Texto a número como `as.numeric` de R (retorna: np.ndarray) = = #
+def func_as_numeric_r(serie_texto):
+    # R (`R_strtod`) convierte los dígitos en un número entero y lo divide
+    # entre la potencia de 10; únicamente usa el redondeo correcto
+    # (`strtod`) si los dígitos caben en un double y son 15 o más
+    serie_texto = serie_texto.fillna("").str.upper()
+    mask_na = (serie_texto == "").to_numpy()
+    serie_texto = serie_texto.where(~mask_na, "0")
+
+    mantisa = serie_texto.str.partition("E")
+    signo = mantisa[0].str.startswith("-").to_numpy()
+    partes = mantisa[0].str.lstrip("-").str.partition(".")
+    digitos = partes[0] + partes[2]
+
+    n_digitos = digitos.str.len().to_numpy()
+    expn = (mantisa[2].replace("", "0").astype(int).to_numpy() -
+            partes[2].str.len().to_numpy())
+
+    valores = digitos.to_numpy(dtype = str).astype(np.int64)
+
+    # Potencias de 10 por cuadrados sucesivos, como en R
+    dict_potencias = dict()
+    for n in np.unique(np.abs(expn)):
+        p10, fac, k = tipo_acumulador(10), tipo_acumulador(1), int(n)
+        while k:
+            if k & 1:
+                fac *= p10
+            k >>= 1
+            p10 *= p10
+        dict_potencias[n] = fac
+    fac = np.array([dict_potencias[n] for n in np.abs(expn)],
+                   dtype = tipo_acumulador)
+
+    mask_strtod = (valores <= 2**53) & (expn < 0) & (n_digitos >= 15)
+    valores = valores.astype(tipo_acumulador)
+    valores = np.where(expn < 0, valores / fac, valores * fac).astype(np.float64)
+    valores[mask_strtod] = (serie_texto.str.lstrip("-").to_numpy(dtype = str)
+                            [mask_strtod].astype(np.float64))
+
+    valores = np.where(signo, -valores, valores)
+    valores[mask_na] = np.nan
+    return valores
+
+# = = Matriz (grupo x posición) con ceros de relleno (retorna: tupla) = = #
+def func_matriz_grupos(valores, codigos, n_grupos):
+    # Los valores de cada grupo quedan en el orden en el que aparecen
+    orden = np.argsort(codigos, kind = 'stable')
+    codigos = codigos[orden]
+    n_por_grupo = np.bincount(codigos, minlength = n_grupos)
+    posicion = (np.arange(len(codigos)) -
+                np.repeat(np.cumsum(n_por_grupo) - n_por_grupo, n_por_grupo))
+
+    matriz = np.zeros((n_grupos, max(n_por_grupo.max(initial = 0), 1)),
+                      dtype = tipo_acumulador)
+    matriz[codigos, posicion] = valores[orden]
+    mask = np.zeros(matriz.shape, dtype = bool)
+    mask[codigos, posicion] = True
+    return matriz, mask, n_por_grupo
+
+# = = Promedio por grupo como `mean` de R (retorna: np.ndarray) = = #
+def func_media_r(valores, codigos, n_grupos, na_rm = False):
+    # Suma en `tipo_acumulador` en orden, y una segunda pasada con la suma de
+    # las diferencias con el promedio
+    if na_rm:
+        mask_validos = ~np.isnan(valores)
+        valores, codigos = valores[mask_validos], codigos[mask_validos]
+
+    matriz, mask, n_por_grupo = func_matriz_grupos(valores, codigos, n_grupos)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        media = np.cumsum(matriz, axis = 1)[:, -1] / n_por_grupo
+        diferencias = np.where(mask, matriz - media[:, None], 0)
+        correccion = np.cumsum(diferencias, axis = 1)[:, -1] / n_por_grupo
+
+    media = np.where(np.isfinite(media.astype(np.float64)),
+                     media + correccion, media)
+    return media.astype(np.float64)
+
+# = = Suma acumulada por fila como `cumsum` de R (retorna: np.ndarray) = = #
+def func_cumsum_r(matriz):
+    return np.cumsum(matriz.astype(tipo_acumulador), axis = 1).astype(np.float64)
+
+# = = Columnas decimales con el formato de readr (retorna: pd.DataFrame) = = #
+def func_formato_datframe(datframe):
+    datframe = datframe.copy()
+    for col in datframe.columns[datframe.dtypes == np.float64]:
+        datframe[col] = func_formato_readr(datframe[col].to_numpy())
+    return datframe
+
+# = = Guardar como `readr::write_csv(na = "")` (retorna: vacío) = = #
+def func_guardar_csv(datframe, path_csv):
+    os.makedirs(os.path.dirname(path_csv), exist_ok = True)
+    func_formato_datframe(datframe).to_csv(path_csv, index = False, na_rep = "")
+    print(f"Archivo: {path_csv}")
+    return None
+
+# = = = Lectura = = = #
+
+# = = Leer un archivo de `ee_imports` (retorna: pd.DataFrame) = = #
+def func_leer_ee_import(path_csv):
+    datframe = pd.read_csv(
+        filepath_or_buffer = path_csv,
+        usecols = lambda col: (col in ('CVEGEO', 'n_year', 'mean') or
+                               col in list_meses),
+        dtype = str,
+        keep_default_na = False,
+        encoding = "latin-1")
+
+    cols_valores = [col for col in datframe.columns
+                    if col not in ('CVEGEO', 'n_year')]
+    datframe_tipos = pd.DataFrame({
+        'cvegeo': datframe['CVEGEO'],
+        'n_year': datframe['n_year']})
+    for col in cols_valores:
+        datframe_tipos[col] = func_as_numeric_r(datframe[col])
+    return datframe_tipos
+
+# = = Leer y unir los archivos de `ee_imports` (retorna: dict) = = #
+def func_leer_ee_imports(path_ee_imports = None, n_procesos = None,
+                         list_llaves = None):
+    # `list_llaves`: únicamente los archivos de ciertos niveles y periodos
+    # (p. ej. `[('mun', 'month')]`)
+    path_ee_imports = path_ee_imports or os.path.join(path2chirpsdata,
+                                                      "ee_imports")
+    # Mismo orden que `list.files`
+    list_paths = sorted(os.path.join(path_ee_imports, archivo)
+                        for archivo in os.listdir(path_ee_imports)
+                        if patron_archivo.search(archivo) and
+                        (list_llaves is None or
+                         patron_archivo.search(archivo).groups()[:2]
+                         in list_llaves))
+
+    with multiprocessing.Pool(processes = n_procesos) as pool:
+        list_datframes = pool.map(func_leer_ee_import, list_paths)
+
+    dict_datframes = dict()
+    for path_csv, datframe in zip(list_paths, list_datframes):
+        fc_interes, periodo, _ = patron_archivo.search(path_csv).groups()
+        dict_datframes.setdefault((fc_interes, periodo), list()).append(datframe)
+
+    # Meses faltantes (año en curso) quedan sin datos, como `bind_rows`
+    return {llave: pd.concat(list_datframes, ignore_index = True)
+            for llave, list_datframes in dict_datframes.items()}
+
+# = = = Métricas = = = #
+
+# = = Agregar el promedio nacional (retorna: pd.DataFrame) = = #
+def func_agregar_nacional(datframe):
+    codigos, years = pd.factorize(datframe['n_year'], sort = True)
+    datframe_nac = pd.DataFrame({'cvegeo': "00", 'n_year': years})
+    for col in datframe.columns.drop(['cvegeo', 'n_year']):
+        datframe_nac[col] = func_media_r(datframe[col].to_numpy(), codigos,
+                                         len(years))
+    return pd.concat([datframe_nac, datframe], ignore_index = True)
+
+# = = Precipitación mensual en formato long (retorna: pd.DataFrame) = = #
+def func_wide2long_month(datframe):
+    # Orden por geometría, año y mes (`group_by` + `arrange`)
+    datframe = datframe.sort_values(['cvegeo', 'n_year'], kind = 'stable')
+    matriz = datframe[list_meses].to_numpy()
+
+    return pd.DataFrame({
+        'cvegeo': np.repeat(datframe['cvegeo'].to_numpy(), 12),
+        'n_year': np.repeat(datframe['n_year'].to_numpy(), 12),
+        'n_month': np.tile(list_meses, len(datframe)),
+        'pr_mm': matriz.ravel(),
+        'cumsum_pr_mm': func_cumsum_r(matriz).ravel()})
+
+# = = Precipitación normal (retorna: pd.DataFrame) = = #
+def func_normal_pr_mm(datframe_long,
+                      n_year_inicio = n_year_inicio_normal,
+                      n_year_fin = n_year_fin_normal):
+    list_years = [str(n_year) for n_year in range(n_year_inicio, n_year_fin + 1)]
+    datframe_base = datframe_long[datframe_long['n_year'].isin(list_years)]
+    cols_grupo = ['cvegeo', 'n_month'] if 'n_month' in datframe_long else ['cvegeo']
+
+    grupos = datframe_base.groupby(cols_grupo, sort = True)
+    codigos = grupos.ngroup().to_numpy()
+    datframe_normal = grupos.size().index.to_frame(index = False)
+    datframe_normal['normal_pr_mm'] = func_media_r(
+        datframe_base['pr_mm'].to_numpy(), codigos, grupos.ngroups, na_rm = True)
+
+    if 'n_month' in datframe_long:
+        datframe_normal['normal_cumsum_pr_mm'] = func_cumsum_r(
+            datframe_normal['normal_pr_mm'].to_numpy().reshape(-1, 12)).ravel()
+    return datframe_normal
+
+# = = Anomalías (retorna: pd.DataFrame) = = #
+def func_anomaly_pr(datframe_long, datframe_normal):
+    cols_llave = ['cvegeo', 'n_month'] if 'n_month' in datframe_long else ['cvegeo']
+    datframe = pd.merge(left = datframe_long,
+                        right = datframe_normal,
+                        how = 'left',
+                        on = cols_llave)
+
+    datframe['anomaly_pr_mm'] = datframe['pr_mm'] - datframe['normal_pr_mm']
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        datframe['anomaly_pr_prop'] = (datframe['anomaly_pr_mm'] /
+                                       datframe['normal_pr_mm'])
+        if 'n_month' in datframe_long:
+            datframe['cumulative_anomaly_pr_mm'] = (datframe['cumsum_pr_mm'] -
+                                                    datframe['normal_cumsum_pr_mm'])
+            datframe['cumulative_anomaly_pr_prop'] = (
+                datframe['cumulative_anomaly_pr_mm'] /
+                datframe['normal_cumsum_pr_mm'])
+
+    return datframe.drop(columns = ['normal_pr_mm', 'normal_cumsum_pr_mm'],
+                         errors = 'ignore')
+
+# = = = Nombres y formato final = = = #
+
+# = = Claves y nombres de estados y municipios (retorna: pd.DataFrame) = = #
+def func_cve_nom_ent_mun():
+    cve_nom = pd.read_csv(
+        filepath_or_buffer = os.path.join(path2repo, "GobiernoMexicano",
+                                          "cve_nom_municipios.csv"),
+        dtype = str)
+    nacional = pd.DataFrame([dict(cve_geo = "00000", nombre_estado = "Nacional",
+                                  cve_ent = "00", nombre_municipio = "Nacional",
+                                  cve_mun = "000")])
+    return pd.concat([cve_nom, nacional], ignore_index = True)
+
+# = = Adjuntar nombres (retorna: pd.DataFrame) = = #
+def func_adjuntar_cve_nom_ent_mun(datframe, cve_nom, region, cols_inicio):
+    if region == "ent":
+        nombres = (cve_nom[['cve_ent', 'nombre_estado']].drop_duplicates()
+                   .rename(columns = {'cve_ent': 'cvegeo'}))
+        cols_nombres = ['cve_ent', 'nombre_estado']
+    else:
+        nombres = (cve_nom[['cve_geo', 'nombre_estado', 'cve_ent',
+                            'nombre_municipio']].drop_duplicates()
+                   .rename(columns = {'cve_geo': 'cvegeo'}))
+        cols_nombres = ['cve_ent', 'nombre_estado', 'cve_geo',
+                        'nombre_municipio']
+
+    datframe = pd.merge(left = datframe, right = nombres, how = 'left',
+                        on = 'cvegeo')
+    datframe = datframe.rename(columns = {'cvegeo': cols_nombres[0] if
+                                          region == "ent" else 'cve_geo'})
+    cols_nombres = [col for col in cols_inicio if col in cols_nombres]
+    return datframe[cols_nombres + [col for col in datframe.columns
+                                    if col not in cols_nombres]]
+
+# = = Formato numérico y de fecha (retorna: pd.DataFrame) = = #
+def func_string2numberdate(datframe):
+    if 'n_month' in datframe:
+        datframe.insert(loc = datframe.columns.get_loc('n_year'),
+                        column = 'date_year_month',
+                        value = (datframe['n_year'] + "-" +
+                                 datframe['n_month'] + "-15"))
+        datframe['n_month'] = datframe['n_month'].astype(int)
+    datframe['n_year'] = datframe['n_year'].astype(int)
+    return datframe
+
+# = = Bases de datos finales (retorna: dict) = = #
+def func_wide2long_chirps(path_ee_imports = None, n_procesos = None,
+                          n_year_inicio = n_year_inicio_normal,
+                          n_year_fin = n_year_fin_normal,
+                          pesos_mun = None):
+    # Con `pesos_mun` (pd.Series con índice `cvegeo`, ver
+    # **`agregacion_chirps.py`**) los estados y el nacional son promedios
+    # ponderados de los municipios y no se leen los archivos `ent`
+    if pesos_mun is None:
+        dict_ee = func_leer_ee_imports(path_ee_imports, n_procesos)
+    else:
+        from agregacion_chirps import func_agregar_ent_nac, func_matrices_agregacion
+        dict_ee = func_leer_ee_imports(path_ee_imports, n_procesos,
+                                       list_llaves = [('mun', 'year'),
+                                                      ('mun', 'month')])
+        matrices = func_matrices_agregacion(
+            dict_ee[('mun', 'year')]['cvegeo'].unique(), pesos_mun)
+        for periodo in ('year', 'month'):
+            dict_ee[('ent', periodo)] = func_agregar_ent_nac(
+                dict_ee[('mun', periodo)], matrices)
+    cve_nom = func_cve_nom_ent_mun()
+    cols_ent = ['cve_ent', 'nombre_estado']
+    cols_mun = ['cve_ent', 'nombre_estado', 'cve_geo', 'nombre_municipio']
+    dict_dbs = dict()
+
+    for fc_interes in ('ent', 'mun'):
+        datframe_year = dict_ee[(fc_interes, 'year')]
+        datframe_month = dict_ee[(fc_interes, 'month')]
+        if fc_interes == 'ent' and pesos_mun is None:
+            datframe_year = func_agregar_nacional(datframe_year)
+            datframe_month = func_agregar_nacional(datframe_month)
+        nombre = "ent_nac" if fc_interes == 'ent' else "mun"
+        cols_inicio = cols_ent if fc_interes == 'ent' else cols_mun
+
+        # - - Formato long - - #
+        datframe_year_long = datframe_year.rename(columns = {'mean': 'pr_mm'})
+        datframe_month_long = func_wide2long_month(datframe_month)
+
+        # - - Normal y anomalías - - #
+        for periodo, datframe_long in (('year', datframe_year_long),
+                                       ('month', datframe_month_long)):
+            datframe_normal = func_normal_pr_mm(datframe_long, n_year_inicio,
+                                                n_year_fin)
+
+            db_pr = func_adjuntar_cve_nom_ent_mun(
+                func_anomaly_pr(datframe_long, datframe_normal),
+                cve_nom, fc_interes, cols_inicio)
+            dict_dbs[f"db_mex_pr_{nombre}_{periodo}"] = func_string2numberdate(db_pr)
+
+            # Nombres antes de la clave en la normal
+            db_normal = func_adjuntar_cve_nom_ent_mun(
+                datframe_normal, cve_nom, fc_interes,
+                ['nombre_estado', 'cve_ent', 'nombre_municipio', 'cve_geo'])
+            if fc_interes == 'mun' and periodo == 'month':
+                db_normal['n_month'] = db_normal['n_month'].astype(int)
+            dict_dbs[f"db_mex_pr_normal_{nombre}_{periodo}"] = db_normal
+
+    return dict_dbs
+
+# = = Guardar bases de datos (retorna: dict) = = #
+def func_guardar_dbs_chirps(dict_dbs, path_data = path2chirpsdata):
+    dict_paths = dict(
+        db_mex_pr_ent_nac_year = "estados/db_mex_pr_ent_nac_year.csv",
+        db_mex_pr_ent_nac_month = "estados/db_mex_pr_ent_nac_month.csv",
+        db_mex_pr_mun_year = "municipios/db_mex_pr_mun_year.csv",
+        db_mex_pr_mun_month = "municipios/db_mex_pr_mun_month.csv.bz2",
+        db_mex_pr_normal_ent_nac_year = "normal/db_mex_pr_normal_ent_nac_year.csv",
+        db_mex_pr_normal_ent_nac_month = "normal/db_mex_pr_normal_ent_nac_month.csv",
+        db_mex_pr_normal_mun_year = "normal/db_mex_pr_normal_mun_year.csv",
+        db_mex_pr_normal_mun_month = "normal/db_mex_pr_normal_mun_month.csv")
+
+    dict_paths = {nombre: os.path.join(path_data, path)
+                  for nombre, path in dict_paths.items()}
+    for nombre, db in dict_dbs.items():
+        func_guardar_csv(db, dict_paths[nombre])
+    return dict_paths
+
+if __name__ == "__main__":
+    n_procesos = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    pesos_mun = None
+    if len(sys.argv) > 2:
+        from agregacion_chirps import func_pesos_area_00mun
+        pesos_mun = func_pesos_area_00mun(sys.argv[2])
+    func_guardar_dbs_chirps(func_wide2long_chirps(n_procesos = n_procesos,
+                                                  pesos_mun = pesos_mun))
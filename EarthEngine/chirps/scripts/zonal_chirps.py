@@ -0,0 +1,338 @@
+"""
+Author: Isaac Arroyo
+Notes: Extracción local (sin Earth Engine) de la precipitación mensual y
+       anual de los estados y municipios a partir de los archivos diarios
+       de CHIRPS (GeoTIFF o NetCDF) y de las geometrías de `00ent` y
+       `00mun`. Es usada por `get_chirps_metrics(..., backend = "local")` en
+       **`raster2csv_chirps.py`**.
+
+El resultado tiene la misma estructura que los archivos que se exportan
+desde Earth Engine y se guardan en `data/ee_imports`
+(`mex_chirps_pr_mm_{ent|mun}_{month|year}_{año}.csv`), por lo que el resto
+del proceso (**`documentacion_wide2long_chirps.R`**) no cambia.
+
+Pasos:
+
+1. **Lectura por día**: Los archivos diarios se leen uno por uno y
+   recortados a la extensión de las geometrías (`func_iter_dias_chirps`).
+   Únicamente se guardan las sumas mensuales por pixel.
+2. **Pesos de cada geometría**: El peso de un pixel en una geometría es la
+   fracción del pixel que cubre la geometría (matriz dispersa geometrías x
+   pixeles de **`pesos_chirps.py`**). La matriz se calcula una sola vez y
+   se guarda en la caché, ya que las geometrías y la malla no cambian
+   entre años.
+3. **Promedio zonal**: El promedio ponderado de los pixeles con datos de
+   cada geometría, para todas las bandas con una multiplicación de matrices
+   (`func_media_zonal_pesos`). Con `estadisticas` (p. ej.
+   `["min", "max", "stdDev", "p50"]`) las demás estadísticas se calculan
+   en la misma pasada (`func_estadisticas_zonales_pesos`) y se agregan
+   como columnas `{banda}_{estadística}` (meses) y `{estadística}` (año),
+   con los nombres de Earth Engine.
+
+Los archivos GeoTIFF se leen con `rasterio` y los NetCDF con `xarray`.
+Las funciones de los pasos 2 y 3 únicamente usan NumPy y SciPy, por lo que
+se pueden probar con rasters sintéticos (`func_zonal_chirps`).
+
+**Precipitación diaria** (`get_chirps_metrics(..., diario = True)`): Los
+promedios zonales de cada día se calculan en bloques de días
+(`func_medias_diarias`) y se guardan en un archivo por año
+(`mex_chirps_pr_mm_{ent|mun}_day_{año}.csv`, una columna `MMDD` por día).
+Los índices de lluvia extrema se calculan con **`extremos_chirps.py`**.
+"""
+
+# = = = Imports = = = #
+import os
+import re
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    import rasterio
+    from rasterio.windows import from_bounds
+except ImportError:
+    rasterio = None
+
+try:
+    import xarray as xr
+except ImportError:
+    xr = None
+
+from geometrias_chirps import (func_grid,
+                               func_leer_geometrias,
+                               func_bbox_geometrias)
+from pesos_chirps import (func_cargar_matriz_pesos,
+                          func_estadisticas_zonales_pesos,
+                          func_media_zonal_pesos)
+
+# Valor de los pixeles sin datos (océano) en los archivos de CHIRPS
+nodata_chirps = -9999.0
+
+geo_vacia = '{"type":"MultiPoint","coordinates":[]}'
+
+# = = = Rasters = = = #
+
+# = = Fecha en el nombre del archivo diario (retorna: date) = = #
+def func_fecha_archivo(path_archivo):
+    # chirps-v2.0.2024.01.31.tif
+    fecha = re.search(r"(\d{4})\.(\d{2})\.(\d{2})", os.path.basename(path_archivo))
+    return date(*map(int, fecha.groups()))
+
+# = = Días de archivos GeoTIFF (retorna: generador de tuplas) = = #
+def func_iter_dias_geotiff(paths_archivos, bbox):
+    for path_archivo in sorted(paths_archivos, key = func_fecha_archivo):
+        with rasterio.open(path_archivo) as raster:
+            ventana = from_bounds(*bbox, transform = raster.transform).round_offsets().round_lengths()
+            array = raster.read(1, window = ventana).astype(np.float32)
+            transform = raster.window_transform(ventana)
+            nodata = raster.nodata if raster.nodata is not None else nodata_chirps
+
+        array[(array == nodata) | (array < 0)] = np.nan
+        grid = func_grid(transform.c, transform.f, transform.a, transform.e,
+                         array.shape[1], array.shape[0])
+        yield func_fecha_archivo(path_archivo), array, grid
+
+# = = Días de archivos NetCDF (retorna: generador de tuplas) = = #
+def func_iter_dias_netcdf(paths_archivos, bbox, variable = 'precip'):
+    for path_archivo in sorted(paths_archivos):
+        with xr.open_dataset(path_archivo) as dataset:
+            datos = dataset[variable]
+            lon = datos['longitude'].to_numpy()
+            lat = datos['latitude'].to_numpy()
+            cols = np.flatnonzero((lon >= bbox[0]) & (lon <= bbox[2]))
+            rows = np.flatnonzero((lat >= bbox[1]) & (lat <= bbox[3]))
+            datos = datos.isel(longitude = slice(cols[0], cols[-1] + 1),
+                               latitude = slice(rows[0], rows[-1] + 1))
+
+            dx = float(lon[1] - lon[0])
+            dy = float(lat[1] - lat[0])
+            grid = func_grid(lon[cols[0]] - dx / 2, lat[rows[0]] - dy / 2,
+                             dx, dy, len(cols), len(rows))
+
+            fechas = pd.to_datetime(datos['time'].to_numpy())
+            for i, fecha in enumerate(fechas):
+                array = datos.isel(time = i).to_numpy().astype(np.float32)
+                array[array < 0] = np.nan
+                yield fecha.date(), array, grid
+
+# = = Días de CHIRPS (retorna: generador de tuplas) = = #
+def func_iter_dias_chirps(paths_archivos, bbox):
+    # `bbox`: (xmin, ymin, xmax, ymax) en grados
+    if all(path.lower().endswith((".nc", ".nc4")) for path in paths_archivos):
+        if xr is None:
+            raise ImportError("Se necesita xarray para leer archivos NetCDF")
+        return func_iter_dias_netcdf(paths_archivos, bbox)
+
+    if rasterio is None:
+        raise ImportError("Se necesita rasterio para leer archivos GeoTIFF")
+    return func_iter_dias_geotiff(paths_archivos, bbox)
+
+# = = = Precipitación mensual y anual = = = #
+
+# = = Nombres de las bandas mensuales (retorna: list) = = #
+def func_bandas_mes(n_year_interes, limit_date):
+    # Mismo criterio que en `get_chirps_metrics`: si el año de interés es el
+    # de la fecha límite, únicamente hasta el mes de la fecha límite
+    limit_date = datetime.strptime(limit_date, '%Y-%m-%d')
+    n_meses = limit_date.month if limit_date.year == n_year_interes else 12
+    return [f"{i:02d}" for i in range(1, n_meses + 1)]
+
+# = = Suma mensual por pixel (retorna: tupla) = = #
+def func_suma_mensual(iter_dias, n_year_interes, limit_date, list_meses = None):
+    limit_date = datetime.strptime(limit_date, '%Y-%m-%d').date()
+    set_meses = set(range(1, 13) if list_meses is None
+                    else map(int, list_meses))
+    suma, n_dias, grid = None, None, None
+
+    for fecha, array, grid_dia in iter_dias:
+        if (fecha.year != n_year_interes or fecha > limit_date or
+                fecha.month not in set_meses):
+            continue
+        if suma is None:
+            grid = grid_dia
+            suma = np.zeros((12,) + array.shape)
+            n_dias = np.zeros((12,) + array.shape, dtype = np.int32)
+
+        validos = ~np.isnan(array)
+        suma[fecha.month - 1][validos] += array[validos]
+        n_dias[fecha.month - 1][validos] += 1
+
+    if suma is None:
+        raise ValueError(f"No hay datos de CHIRPS para {n_year_interes}")
+
+    # Pixeles sin datos todo el mes (océano) quedan sin datos
+    suma[n_dias == 0] = np.nan
+    return suma.reshape(12, -1), grid
+
+# = = Tabla con la estructura de Earth Engine (retorna: pd.DataFrame) = = #
+def func_tabla_ee(propiedades, datframe_valores, n_year_interes):
+    # Earth Engine ordena las columnas por nombre, con `system:index` al
+    # inicio y `.geo` al final
+    datframe = pd.concat([datframe_valores.reset_index(drop = True),
+                          propiedades.reset_index(drop = True)], axis = 1)
+    datframe['n_year'] = n_year_interes
+    datframe = datframe[sorted(datframe.columns)]
+
+    datframe.insert(loc = 0,
+                    column = 'system:index',
+                    value = [f"{i:020d}" for i in range(len(datframe))])
+    datframe['.geo'] = geo_vacia
+    return datframe
+
+# = = Precipitación mensual y anual por geometría (retorna: dict) = = #
+def func_zonal_chirps(iter_dias, geometrias, n_year_interes, limit_date,
+                      matriz_pesos = None, path_cache = None,
+                      list_meses = None, estadisticas = None):
+    # Con `list_meses` únicamente se regresa la tabla `meses` con esos meses
+    # (actualización incremental)
+    suma_mensual, grid = func_suma_mensual(iter_dias, n_year_interes,
+                                           limit_date, list_meses)
+    bandas_mes = (func_bandas_mes(n_year_interes, limit_date)
+                  if list_meses is None else list(list_meses))
+    suma_mensual = suma_mensual[[int(banda) - 1 for banda in bandas_mes]]
+
+    # La suma anual es la suma de los meses (los pixeles sin datos en
+    # algún mes quedan sin datos)
+    suma_anual = suma_mensual.sum(axis = 0, keepdims = True)
+
+    if matriz_pesos is None:
+        matriz_pesos = func_cargar_matriz_pesos(geometrias, grid,
+                                                path_cache = path_cache)
+    bandas = np.concatenate([suma_mensual, suma_anual])
+    if estadisticas:
+        dict_estadisticas = func_estadisticas_zonales_pesos(matriz_pesos, bandas,
+                                                            estadisticas)
+    else:
+        dict_estadisticas = dict(mean = func_media_zonal_pesos(matriz_pesos, bandas))
+
+    # Columnas de los meses (`01`, `01_min`, ...) y del año (`mean`, `min`, ...)
+    valores_mes = pd.DataFrame({
+        (banda if estadistica == 'mean' else f"{banda}_{estadistica}"): valores[:, i]
+        for estadistica, valores in dict_estadisticas.items()
+        for i, banda in enumerate(bandas_mes)})
+    valores_year = pd.DataFrame({estadistica: valores[:, -1]
+                                 for estadistica, valores in dict_estadisticas.items()})
+
+    propiedades = pd.DataFrame([geometria['propiedades']
+                                for geometria in geometrias])
+    if list_meses is not None:
+        return dict(meses = func_tabla_ee(propiedades, valores_mes,
+                                          n_year_interes))
+
+    return dict(
+        month = func_tabla_ee(propiedades, valores_mes, n_year_interes),
+        year = func_tabla_ee(propiedades, valores_year, n_year_interes))
+
+# = = Extracción local y escritura de archivos (retorna: dict) = = #
+def func_chirps_metrics_local(n_year_interes,
+                              limit_date,
+                              fc_interes,
+                              paths_archivos,
+                              path_geometrias,
+                              path_salida,
+                              path_cache = None,
+                              list_meses = None,
+                              estadisticas = None):
+    geometrias = func_leer_geometrias(path_geometrias)
+    # Únicamente se leen los archivos diarios del año (y de los meses) de
+    # interés; los NetCDF anuales se filtran por día en `func_suma_mensual`
+    paths_archivos = [
+        path for path in paths_archivos
+        if path.lower().endswith((".nc", ".nc4")) or
+        (func_fecha_archivo(path).year == n_year_interes and
+         (list_meses is None or
+          f"{func_fecha_archivo(path).month:02d}" in list_meses))]
+    iter_dias = func_iter_dias_chirps(paths_archivos,
+                                      func_bbox_geometrias(geometrias))
+
+    dict_tablas = func_zonal_chirps(iter_dias, geometrias, n_year_interes,
+                                    limit_date, path_cache = path_cache,
+                                    list_meses = list_meses,
+                                    estadisticas = estadisticas)
+
+    # Mismos nombres que los archivos en `data/ee_imports`
+    dict_paths = dict()
+    os.makedirs(path_salida, exist_ok = True)
+    for periodo, tabla in dict_tablas.items():
+        sufijo = (f"_{list_meses[0]}-{list_meses[-1]}" if periodo == 'meses'
+                  else "")
+        dict_paths[periodo] = os.path.join(
+            path_salida,
+            f"mex_chirps_pr_mm_{fc_interes}_{periodo}_{n_year_interes}{sufijo}.csv")
+        tabla.to_csv(dict_paths[periodo], index = False)
+        print(f"Archivo: {dict_paths[periodo]}")
+
+    return dict_paths
+
+# = = = Precipitación diaria = = = #
+
+# = = Promedios zonales diarios por bloques de días (retorna: tupla) = = #
+def func_medias_diarias(iter_dias, geometrias, n_year_interes, limit_date,
+                        matriz_pesos = None, path_cache = None,
+                        n_dias_bloque = 31):
+    # Los días se leen de uno en uno y se reducen en bloques de
+    # `n_dias_bloque` (una multiplicación de matrices por bloque), por lo que
+    # en memoria únicamente hay un bloque de rasters y la tabla del año
+    # (geometrías x días)
+    limit_date = datetime.strptime(limit_date, '%Y-%m-%d').date()
+    list_fechas, list_medias, bloque = list(), list(), list()
+
+    def func_reducir_bloque():
+        list_medias.append(func_media_zonal_pesos(
+            matriz_pesos, np.stack([array.ravel() for array in bloque])))
+        bloque.clear()
+
+    for fecha, array, grid in iter_dias:
+        if fecha.year != n_year_interes or fecha > limit_date:
+            continue
+        if matriz_pesos is None:
+            matriz_pesos = func_cargar_matriz_pesos(geometrias, grid,
+                                                    path_cache = path_cache)
+        list_fechas.append(fecha)
+        bloque.append(array)
+        if len(bloque) == n_dias_bloque:
+            func_reducir_bloque()
+    if bloque:
+        func_reducir_bloque()
+
+    if not list_fechas:
+        raise ValueError(f"No hay datos de CHIRPS para {n_year_interes}")
+    return list_fechas, np.concatenate(list_medias, axis = 1)
+
+# = = Extracción local diaria y escritura del archivo (retorna: str) = = #
+def func_chirps_diario_local(n_year_interes,
+                             limit_date,
+                             fc_interes,
+                             paths_archivos,
+                             path_geometrias,
+                             path_salida,
+                             path_cache = None,
+                             n_dias_bloque = 31):
+    geometrias = func_leer_geometrias(path_geometrias)
+    paths_archivos = [
+        path for path in paths_archivos
+        if path.lower().endswith((".nc", ".nc4")) or
+        func_fecha_archivo(path).year == n_year_interes]
+    iter_dias = func_iter_dias_chirps(paths_archivos,
+                                      func_bbox_geometrias(geometrias))
+
+    list_fechas, medias = func_medias_diarias(iter_dias, geometrias,
+                                              n_year_interes, limit_date,
+                                              path_cache = path_cache,
+                                              n_dias_bloque = n_dias_bloque)
+
+    # Bandas `MMDD`, como en la extracción diaria de Earth Engine
+    propiedades = pd.DataFrame([geometria['propiedades']
+                                for geometria in geometrias])
+    tabla = func_tabla_ee(propiedades,
+                          pd.DataFrame(medias, columns = [fecha.strftime("%m%d")
+                                                          for fecha in list_fechas]),
+                          n_year_interes)
+
+    os.makedirs(path_salida, exist_ok = True)
+    path_csv = os.path.join(path_salida,
+                            f"mex_chirps_pr_mm_{fc_interes}_day_{n_year_interes}.csv")
+    tabla.to_csv(path_csv, index = False)
+    print(f"Archivo: {path_csv}")
+    return path_csv
@@ -0,0 +1,153 @@
+"""
+Author: Isaac Arroyo
+Notes: Descarga directa de una `ee.FeatureCollection` a un CSV local, sin
+       exportar a Google Drive. Es usada por **`chirps/scripts/raster2csv_chirps.py`**
+       y **`terraclimate/scripts/raster2table_terraclimate.py`**.
+
+* **Páginas**: La colección se descarga en páginas de `n_pagina`
+  _features_ (`fc.toList(n_pagina, inicio)`). Cada página es independiente
+  de las demás, por lo que se pueden pedir varias al mismo tiempo.
+* **Peticiones al mismo tiempo**: Las páginas se piden con `n_hilos`
+  hilos (el tiempo es de espera de la respuesta de Earth Engine, no de
+  cálculo local).
+* **Reintentos**: Si una página falla, se vuelve a pedir hasta
+  `n_reintentos` veces, con una espera que se duplica en cada intento.
+* **Puntos de control**: Cada página descargada se guarda (como JSON) en
+  la carpeta `{path_csv}.paginas`. Si la descarga se interrumpe, la
+  siguiente ejecución únicamente pide las páginas que faltan. Al terminar
+  se escribe el CSV y se borra la carpeta.
+
+El CSV tiene la misma estructura que los archivos que se exportan a Google
+Drive: `system:index` (id del _feature_) al inicio, las propiedades
+ordenadas por nombre y `.geo` al final, y los números con el mismo
+formato (`func_numero_ee`).
+
+La descarga de páginas es una función (`func_pagina(inicio, n)`), por lo
+que se puede probar sin Earth Engine (**`simulacion_descarga_ee.py`**).
+"""
+
+# = = = Imports = = = #
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from functools import partial
+
+import pandas as pd
+
+geo_vacia = '{"type":"MultiPoint","coordinates":[]}'
+
+# = = Página de una ee.FeatureCollection (retorna: list) = = #
+def func_pagina_ee(fc, inicio, n):
+    # Se importa aquí para que el resto del módulo funcione sin Earth Engine
+    import ee
+    return (ee.FeatureCollection(fc.toList(n, inicio))
+            .getInfo()['features'])
+
+# = = Ruta del punto de control de una página (retorna: str) = = #
+def func_path_pagina(path_paginas, inicio, n):
+    return os.path.join(path_paginas, f"pagina_{inicio:09d}_{n}.json")
+
+# = = Descargar y guardar una página (retorna: str) = = #
+def func_descargar_pagina(func_pagina, path_paginas, n_reintentos,
+                          espera_inicial, rango):
+    inicio, n = rango
+    path_pagina = func_path_pagina(path_paginas, inicio, n)
+    if os.path.exists(path_pagina):
+        return path_pagina
+
+    espera = espera_inicial
+    for intento in range(n_reintentos + 1):
+        try:
+            list_features = func_pagina(inicio, n)
+            break
+        except Exception as error:
+            if intento == n_reintentos:
+                raise RuntimeError(
+                    f"Página {inicio}-{inicio + n} falló "
+                    f"{n_reintentos + 1} veces") from error
+            time.sleep(espera)
+            espera *= 2
+
+    # Se escribe en un archivo temporal para no dejar páginas incompletas
+    path_temporal = f"{path_pagina}.tmp"
+    with open(path_temporal, "w", encoding = "utf-8") as archivo:
+        json.dump(list_features, archivo)
+    os.replace(path_temporal, path_pagina)
+    return path_pagina
+
+# = = Número con el formato de los CSV de Earth Engine (retorna: str) = = #
+def func_numero_ee(valor):
+    # Earth Engine escribe los decimales como Java (`Double.toString`):
+    # notación científica si el valor es menor a 1e-3 o mayor o igual a
+    # 1e7 (`1.3890932304690584E-4`), y con los dígitos mínimos (`repr`)
+    if not isinstance(valor, float) or valor != valor:
+        return valor
+    if valor == 0 or 1e-3 <= abs(valor) < 1e7:
+        return repr(valor)
+
+    signo, digitos, exponente = Decimal(repr(valor)).as_tuple()
+    digitos = "".join(map(str, digitos))
+    exponente += len(digitos) - 1
+    digitos = digitos.rstrip("0") or "0"
+    return (f"{'-' if signo else ''}{digitos[0]}.{digitos[1:] or '0'}"
+            f"E{exponente}")
+
+# = = Features a tabla con la estructura de Earth Engine (retorna: pd.DataFrame) = = #
+def func_features2datframe(list_features):
+    datframe = pd.DataFrame([{llave: func_numero_ee(valor) for llave, valor
+                              in (feature.get('properties') or dict()).items()}
+                             for feature in list_features])
+    datframe = datframe[sorted(datframe.columns)]
+    datframe.insert(loc = 0,
+                    column = 'system:index',
+                    value = [feature.get('id') for feature in list_features])
+    datframe['.geo'] = [json.dumps(feature['geometry'], separators = (',', ':'))
+                        if feature.get('geometry') else geo_vacia
+                        for feature in list_features]
+    return datframe
+
+# = = Descarga paginada a CSV (retorna: str) = = #
+def func_descargar_paginas(func_pagina,
+                           n_total,
+                           path_csv,
+                           n_pagina = 500,
+                           n_hilos = 4,
+                           n_reintentos = 3,
+                           espera_inicial = 2):
+    path_paginas = f"{path_csv}.paginas"
+    os.makedirs(path_paginas, exist_ok = True)
+
+    list_rangos = [(inicio, min(n_pagina, n_total - inicio))
+                   for inicio in range(0, n_total, n_pagina)]
+    n_guardadas = sum(os.path.exists(func_path_pagina(path_paginas, *rango))
+                      for rango in list_rangos)
+    if n_guardadas:
+        print(f"Páginas guardadas: {n_guardadas} de {len(list_rangos)}")
+
+    func_descarga = partial(func_descargar_pagina, func_pagina, path_paginas,
+                            n_reintentos, espera_inicial)
+    with ThreadPoolExecutor(max_workers = n_hilos) as ejecutor:
+        # `map` regresa las páginas en orden
+        list_paths_paginas = list(ejecutor.map(func_descarga, list_rangos))
+
+    list_features = list()
+    for path_pagina in list_paths_paginas:
+        with open(path_pagina, encoding = "utf-8") as archivo:
+            list_features.extend(json.load(archivo))
+
+    func_features2datframe(list_features).to_csv(path_csv, index = False)
+    shutil.rmtree(path_paginas)
+    print(f"Archivo: {path_csv}")
+    return path_csv
+
+# = = Descarga directa de una ee.FeatureCollection (retorna: str) = = #
+def func_descargar_fc(fc, path_csv, **kwargs_descarga):
+    # `kwargs_descarga`: `n_pagina`, `n_hilos`, `n_reintentos` y
+    # `espera_inicial` de `func_descargar_paginas`
+    return func_descargar_paginas(func_pagina = partial(func_pagina_ee, fc),
+                                  n_total = fc.size().getInfo(),
+                                  path_csv = path_csv,
+                                  **kwargs_descarga)
@@ -0,0 +1,197 @@
+"""
+Author: Isaac Arroyo
+Notes: Números con el mismo texto que escribe `readr::write_csv` (R), para
+       que los CSV que se crean en Python sean idénticos a los que se
+       crean en R. Es usada por **`chirps/scripts/wide2long_chirps.py`**.
+
+`write_csv` (`vroom`) escribe los decimales con el algoritmo Grisu3
+(`dtoa_grisu3`):
+
+* Si Grisu3 encuentra los dígitos mínimos, el número se escribe con esos
+  dígitos (los mismos que `repr` de Python): `56.077369728567554`.
+* Si no los encuentra (cerca del 0.5% de los números), el número se
+  escribe con `sprintf("%.17g")`: `165.30863289617469`.
+* Los números menores a 1e-3 (o mayores o iguales a 1e15) se escriben en
+  notación científica sin ceros en el exponente: `8.366473680767237e-4`.
+* Los números enteros no tienen punto decimal (`0`, `-1`) y los infinitos
+  son `Inf` y `-Inf`.
+
+Grisu3 (`func_grisu3_exito`) se calcula con operaciones de `np.uint64`
+sobre todos los números al mismo tiempo, con los mismos redondeos y
+desbordamientos que la versión en C.
+"""
+
+# = = = Imports = = = #
+from fractions import Fraction
+
+import numpy as np
+
+mask_32 = np.uint64(0xFFFFFFFF)
+bit_64 = np.uint64(1 << 63)
+pow10_cache = np.array([0, 1, 10, 100, 1000, 10000, 100000, 1000000,
+                        10000000, 100000000, 1000000000], dtype = np.uint64)
+
+# = = Potencias de 10 en punto flotante de 64 bits (retorna: tupla) = = #
+def func_potencias_grisu():
+    # 10^k = f * 2^e con f en [2^63, 2^64) y k = -348, -340, ..., 340 (la
+    # tabla `pow_cache` de Grisu3)
+    list_f, list_e = list(), list()
+    for k in range(-348, 341, 8):
+        valor = Fraction(10) ** k
+        e = valor.numerator.bit_length() - valor.denominator.bit_length() - 64
+        while not 2**63 <= valor / Fraction(2) ** e < 2**64:
+            e += 1 if valor / Fraction(2) ** e >= 2**64 else -1
+        list_f.append(round(valor / Fraction(2) ** e))
+        list_e.append(e)
+    return np.array(list_f, dtype = np.uint64), np.array(list_e)
+
+pow_cache_f, pow_cache_e = func_potencias_grisu()
+
+# = = Producto de números de 64 bits, redondeado (retorna: tupla) = = #
+def func_multiplicar(x_f, x_e, y_f, y_e):
+    a, b = x_f >> np.uint64(32), x_f & mask_32
+    c, d = y_f >> np.uint64(32), y_f & mask_32
+    ac, bc, ad, bd = a * c, b * c, a * d, b * d
+    tmp = ((bd >> np.uint64(32)) + (ad & mask_32) + (bc & mask_32) +
+           np.uint64(1 << 31))
+    f = (ac + (ad >> np.uint64(32)) + (bc >> np.uint64(32)) +
+         (tmp >> np.uint64(32)))
+    return f, x_e + y_e + 64
+
+# = = Bit más alto en 1 (retorna: tupla) = = #
+def func_normalizar(f, e):
+    f, e = f.copy(), e.copy()
+    for n_bits, tope in ((10, np.uint64(0xFFC0000000000000)), (1, bit_64)):
+        mask = (f & tope) == 0
+        while mask.any():
+            f[mask] <<= np.uint64(n_bits)
+            e[mask] -= n_bits
+            mask = (f & tope) == 0
+    return f, e
+
+# = = Revisar el último dígito (`round_weed`) (retorna: np.ndarray) = = #
+def func_round_weed(wp_w, delta, rest, ten_kappa, ulp):
+    wp_w_up, wp_w_down = wp_w - ulp, wp_w + ulp
+    rest = rest.copy()
+
+    def func_acercar(rest, wp, estricto):
+        lejos = rest + ten_kappa - wp
+        cerca = wp - rest
+        return ((rest < wp) & (delta - rest >= ten_kappa) &
+                ((rest + ten_kappa < wp) |
+                 ((cerca > lejos) if estricto else (cerca >= lejos))))
+
+    mask = func_acercar(rest, wp_w_up, estricto = False)
+    while mask.any():
+        rest[mask] += ten_kappa[mask]
+        mask = func_acercar(rest, wp_w_up, estricto = False)
+
+    return (~func_acercar(rest, wp_w_down, estricto = True) &
+            (np.uint64(2) * ulp <= rest) & (rest <= delta - np.uint64(4) * ulp))
+
+# = = Grisu3 encuentra los dígitos mínimos (retorna: np.ndarray) = = #
+def func_grisu3_exito(valores):
+    # `valores`: positivos y finitos
+    u = np.ascontiguousarray(valores, dtype = np.float64).view(np.uint64)
+    mask_exp = np.uint64(0x7FF0000000000000)
+    mask_fract = np.uint64(0x000FFFFFFFFFFFFF)
+    normales = (u & mask_exp) != 0
+
+    f = np.where(normales, (u & mask_fract) + np.uint64(1 << 52), u & mask_fract)
+    e = np.where(normales, (u & mask_exp) >> np.uint64(52), 1).astype(np.int64) - 1075
+
+    w_f, w_e = func_normalizar(f, e)
+    mas_f, mas_e = func_normalizar((f << np.uint64(1)) + np.uint64(1), e - 1)
+    # La frontera inferior está más cerca en las potencias de 2
+    cerca = ((u & mask_fract) == 0) & normales
+    menos_f = np.where(cerca, (f << np.uint64(2)) - np.uint64(1),
+                       (f << np.uint64(1)) - np.uint64(1))
+    menos_e = np.where(cerca, e - 2, e - 1)
+    menos_f = menos_f << (menos_e - mas_e).astype(np.uint64)
+    menos_e = mas_e
+
+    # Potencia de 10 de la tabla (`cached_pow`)
+    k = np.ceil((-60 - 64 - w_e + 63) * 0.30102999566398114).astype(np.int64)
+    i = (k + 348 - 1) // 8 + 1
+    c_f, c_e = pow_cache_f[i], pow_cache_e[i]
+    w_f, w_e = func_multiplicar(w_f, w_e, c_f, c_e)
+    menos_f, _ = func_multiplicar(menos_f, menos_e, c_f, c_e)
+    mas_f, _ = func_multiplicar(mas_f, mas_e, c_f, c_e)
+
+    # - - Dígitos (`digit_gen`) - - #
+    unidad = np.ones(len(u), dtype = np.uint64)
+    too_high = mas_f + unidad
+    unsafe = too_high - (menos_f - unidad)
+    corrimiento = (-w_e).astype(np.uint64)
+    one_f = np.uint64(1) << corrimiento
+    p1 = too_high >> corrimiento
+    p2 = too_high & (one_f - np.uint64(1))
+
+    guess = ((64 + w_e + 1) * 1233 >> 12) + 1
+    guess = guess - (p1 < pow10_cache[guess])
+    divisor, kappa = pow10_cache[guess], guess
+
+    # Argumentos de `round_weed` de cada número
+    wp_w = too_high - w_f
+    rest = np.zeros(len(u), dtype = np.uint64)
+    ten_kappa = np.zeros(len(u), dtype = np.uint64)
+    activos = np.ones(len(u), dtype = bool)
+
+    # Parte entera
+    while (activos & (kappa > 0)).any():
+        mask = activos & (kappa > 0)
+        p1 = np.where(mask, p1 % np.maximum(divisor, np.uint64(1)), p1)
+        kappa = kappa - mask
+        rest_kappa = (p1 << corrimiento) + p2
+        fin = mask & (rest_kappa < unsafe)
+        rest[fin] = rest_kappa[fin]
+        ten_kappa[fin] = (divisor << corrimiento)[fin]
+        activos &= ~fin
+        divisor = np.where(mask, divisor // np.uint64(10), divisor)
+
+    # Parte fraccionaria
+    while activos.any():
+        p2 = np.where(activos, p2 * np.uint64(10), p2)
+        unidad = np.where(activos, unidad * np.uint64(10), unidad)
+        unsafe = np.where(activos, unsafe * np.uint64(10), unsafe)
+        p2 = np.where(activos, p2 & (one_f - np.uint64(1)), p2)
+        fin = activos & (p2 < unsafe)
+        rest[fin] = p2[fin]
+        ten_kappa[fin] = one_f[fin]
+        wp_w[fin] = wp_w[fin] * unidad[fin]
+        activos &= ~fin
+
+    return func_round_weed(wp_w, unsafe, rest, ten_kappa, unidad)
+
+# = = Texto de un número con dígitos mínimos (retorna: str) = = #
+def func_texto_minimo(valor):
+    # Enteros y notación científica (los demás números son `repr`)
+    if valor == int(valor) and abs(valor) < 1e15:
+        return str(int(valor))
+    exponente = f"{valor:.16e}".split("e")[1]
+    digitos = repr(abs(valor)).replace(".", "").split("e")[0].strip("0")
+    decimales = f".{digitos[1:]}" if len(digitos) > 1 else ""
+    return f"{'-' if valor < 0 else ''}{digitos[0]}{decimales}e{int(exponente)}"
+
+# = = Números como texto de `readr::write_csv` (retorna: np.ndarray) = = #
+def func_formato_readr(valores):
+    valores = np.asarray(valores, dtype = np.float64)
+    textos = np.full(len(valores), "", dtype = object)
+
+    finitos = np.isfinite(valores) & (valores != 0)
+    textos[valores == 0] = "0"
+    textos[np.isposinf(valores)] = "Inf"
+    textos[np.isneginf(valores)] = "-Inf"
+
+    exito = np.zeros(len(valores), dtype = bool)
+    exito[finitos] = func_grisu3_exito(np.abs(valores[finitos]))
+    with np.errstate(invalid = 'ignore'):
+        mask_repr = (exito & (np.abs(valores) >= 1e-3) & (np.abs(valores) < 1e15) &
+                     (valores != np.trunc(valores)))
+    textos[mask_repr] = [repr(valor) for valor in valores[mask_repr].tolist()]
+    mask_otros = exito & ~mask_repr
+    textos[mask_otros] = [func_texto_minimo(valor)
+                          for valor in valores[mask_otros].tolist()]
+    mask_17 = finitos & ~exito
+    textos[mask_17] = ["%.17g" % valor for valor in valores[mask_17].tolist()]
+    return textos
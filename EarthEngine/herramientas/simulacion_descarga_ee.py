@@ -0,0 +1,130 @@
+"""
+Author: Isaac Arroyo
+Notes: Simulación de la descarga paginada de **`descarga_ee.py`** sin Earth
+       Engine. La página de _features_ (`func_pagina(inicio, n)`) se
+       simula a partir de un CSV de `chirps/data/ee_imports`, con tiempo de
+       respuesta aleatorio y errores con cierta probabilidad.
+
+Se verifica que:
+
+* El CSV descargado sea idéntico (byte a byte) al CSV exportado a Google
+  Drive del que salen los _features_
+* Las páginas descargadas antes de una interrupción no se vuelven a pedir
+* Con varias peticiones al mismo tiempo la descarga sea más rápida
+
+Uso:
+    python simulacion_descarga_ee.py [n_hilos] [prob_error]
+"""
+
+# = = = Imports = = = #
+import filecmp
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import pandas as pd
+
+from descarga_ee import func_descargar_paginas
+
+path2ee = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+path_csv_ejemplo = os.path.join(path2ee, "chirps", "data", "ee_imports",
+                                "mex_chirps_pr_mm_mun_month_2024.csv")
+
+# = = Features de un CSV exportado de Earth Engine (retorna: list) = = #
+def func_features_csv(path_csv):
+    # Números como números (igual que en la respuesta de Earth Engine) y
+    # claves como texto
+    datframe = pd.read_csv(path_csv,
+                           dtype = {'CVEGEO': str, 'CVE_ENT': str,
+                                    'CVE_MUN': str, 'system:index': str},
+                           float_precision = "round_trip",
+                           encoding = "latin-1")
+    cols_propiedades = [col for col in datframe.columns
+                        if col not in ('system:index', '.geo')]
+    return [dict(type = 'Feature',
+                 id = registro['system:index'],
+                 geometry = None,
+                 properties = {col: registro[col] for col in cols_propiedades})
+            for registro in datframe.to_dict(orient = 'records')]
+
+# = = Endpoint de páginas simulado (retorna: función) = = #
+def func_endpoint_simulado(list_features, prob_error, semilla = 0,
+                           segundos_pagina = 0.02, n_max_paginas = None):
+    aleatorio = random.Random(semilla)
+    candado = threading.Lock()
+    dict_conteo = dict(peticiones = 0, paginas = list())
+
+    def func_pagina(inicio, n):
+        with candado:
+            dict_conteo['peticiones'] += 1
+            # Interrupción después de `n_max_paginas` páginas
+            if (n_max_paginas is not None and
+                    len(dict_conteo['paginas']) >= n_max_paginas):
+                raise KeyboardInterrupt
+            error = aleatorio.random() < prob_error
+
+        time.sleep(segundos_pagina)
+        if error:
+            raise ConnectionError("Error simulado")
+
+        with candado:
+            dict_conteo['paginas'].append(inicio)
+        # Copia, como una respuesta nueva
+        return json.loads(json.dumps(list_features[inicio:inicio + n]))
+
+    return func_pagina, dict_conteo
+
+if __name__ == "__main__":
+    n_hilos = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    prob_error = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+    n_pagina = 100
+
+    list_features = func_features_csv(path_csv_ejemplo)
+    n_total = len(list_features)
+
+    with tempfile.TemporaryDirectory() as path_temporal:
+        # Para comparar se escribe el CSV original en UTF-8 (como lo
+        # escribe `func_descargar_paginas`)
+        path_original = os.path.join(path_temporal, "original.csv")
+        pd.read_csv(path_csv_ejemplo, dtype = str, keep_default_na = False,
+                    encoding = "latin-1").to_csv(path_original, index = False)
+
+        # - - Interrupción a la mitad y continuación - - #
+        path_csv = os.path.join(path_temporal, "descarga.csv")
+        func_pagina, dict_conteo = func_endpoint_simulado(
+            list_features, prob_error, n_max_paginas = 10)
+        try:
+            func_descargar_paginas(func_pagina, n_total, path_csv,
+                                   n_pagina = n_pagina, n_hilos = n_hilos,
+                                   espera_inicial = 0.01)
+        except KeyboardInterrupt:
+            print(f"Interrupción después de {len(dict_conteo['paginas'])} "
+                  "páginas")
+        list_paginas_previas = dict_conteo['paginas']
+
+        func_pagina, dict_conteo = func_endpoint_simulado(
+            list_features, prob_error, semilla = 1)
+        func_descargar_paginas(func_pagina, n_total, path_csv,
+                               n_pagina = n_pagina, n_hilos = n_hilos,
+                               espera_inicial = 0.01)
+
+        assert not set(list_paginas_previas) & set(dict_conteo['paginas'])
+        assert (sorted(list_paginas_previas + dict_conteo['paginas']) ==
+                list(range(0, n_total, n_pagina)))
+        assert filecmp.cmp(path_csv, path_original, shallow = False)
+        assert not os.path.exists(f"{path_csv}.paginas")
+        print(f"Continuación: {len(dict_conteo['paginas'])} páginas, "
+              f"{dict_conteo['peticiones']} peticiones (con errores)")
+
+        # - - Tiempo con 1 y con `n_hilos` peticiones al mismo tiempo - - #
+        for n in sorted({1, n_hilos}):
+            func_pagina, _ = func_endpoint_simulado(list_features, 0)
+            tiempo_inicio = time.perf_counter()
+            func_descargar_paginas(func_pagina, n_total,
+                                   os.path.join(path_temporal, f"t{n}.csv"),
+                                   n_pagina = n_pagina, n_hilos = n)
+            print(f"{n} hilo(s): {time.perf_counter() - tiempo_inicio:.2f} s")
@@ -27,141 +27,266 @@ Lista de prioridades TODO:
   - En la documentacion realizar para un tipo de dato en específico (temperaturas)
 - Juntar todo en una función para simplemente iterar para actualizar
 
+Varias bandas en una sola extracción (`func_terraclimate`):
+
+* Cada banda tiene su escala y su variable de interés
+  (`dict_functions_scalling_var_int`) y su media (y desviación estándar)
+  histórica; las imágenes anuales (12 meses) de todas las bandas se juntan
+  en una sola imagen (`{metric}_{MM}`), por lo que hay una sola reducción
+  (`reduceRegions`) por año para todas las bandas.
+* El resultado es una sola tabla en formato largo: un renglón por
+  geometría, año y `metric` (columnas `01` a `12` o `mean`), igual a la
+  de una banda.
+
+Uso (desde Python):
+    func_exportar_terraclimate(["pr", "tmmx", "tmmn", "pdsi"], "ent", "month")
+
+Las columnas de cada `metric` (`func_columnas_metricas`) se revisan en
+`simulacion_columnas_terraclimate.py`.
+
 """
 
-import ee
-import geemap
-ee.Initialize()
-print("Earth Engine inicializado")
-print("Empieza a correr el código...")
+import os
+import sys
+
+try:
+    import ee
+except ImportError:
+    ee = None
+
+path2ee = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(path2ee, "herramientas"))
+from descarga_ee import func_descargar_fc
 
-# = = = = Valores variables = = = = = = 
-banda_interes = "pr"
+# = = = = Valores variables (ejecución como script) = = = = = = 
+list_bandas_interes = ["pr"]
 type_of_geometry = "ent"
 type_reducer_time = "month"
 temp_zscore = False
 str_folder = "gee_terraclimate"
-
-if temp_zscore == False:
-    str_var_interes = lambda banda: f"anomaly_{banda}_" if banda in ["pr","tmmx","tmmn"] else f"{banda}_"
-elif temp_zscore == True:
-    str_var_interes = lambda banda: f"zscore_{banda}_" if banda in ["tmmx","tmmn"] else f"eliminar-error_"
-
-str_description = "export_" + str_var_interes(banda_interes) + "mean_" + f"{type_of_geometry}_" + f"{type_reducer_time}_" + "terraclimate"
-str_fileNamePrefix = "ts_" + str_var_interes(banda_interes) + "mean_" + f"{type_of_geometry}_" + f"{type_reducer_time}_" + "terraclimate"
+# "drive" (exportar a Google Drive) o "directo" (descarga por páginas a `str_path_salida`)
+str_destino = "drive"
+str_path_salida = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
 
 
 # - - - - - - - - - - - - - - - - - - - - -
-# banda_interes
+# banda_interes: `var_int_func` recibe la imagen anual (12 meses), la media
+# y la desviación estándar históricas de cada mes
 dict_functions_scalling_var_int = {
     "pdsi": {
         "scalling_func" : lambda img: img.multiply(0.01).copyProperties(img, img.propertyNames()),
-        "var_int_func": lambda img: img.copyProperties(img, img.propertyNames()),
+        "var_int_func": lambda img, mean_base_months, std_base_months: img.copyProperties(img, img.propertyNames()),
     },
     "pr": {
         "scalling_func": lambda img: img.copyProperties(img, img.propertyNames()),
-        "var_int_func": lambda img: img.subtract(mean_base_months).divide(mean_base_months).copyProperties(img, img.propertyNames())
+        "var_int_func": lambda img, mean_base_months, std_base_months: img.subtract(mean_base_months).divide(mean_base_months).copyProperties(img, img.propertyNames())
     },
     "tmmx": {
         "scalling_func": lambda img: img.multiply(0.1).copyProperties(img, img.propertyNames()),
-        "var_int_func": lambda img: img.subtract(mean_base_months).copyProperties(img, img.propertyNames()),
-        "var_int_func_zscore": lambda img: img.subtract(mean_base_months).divide(std_base_months).copyProperties(img, img.propertyNames())
+        "var_int_func": lambda img, mean_base_months, std_base_months: img.subtract(mean_base_months).copyProperties(img, img.propertyNames()),
+        "var_int_func_zscore": lambda img, mean_base_months, std_base_months: img.subtract(mean_base_months).divide(std_base_months).copyProperties(img, img.propertyNames())
     },
     "tmmn": {
         "scalling_func": lambda img: img.multiply(0.1).copyProperties(img, img.propertyNames()),
-        "var_int_func": lambda img: img.subtract(mean_base_months).copyProperties(img, img.propertyNames()),
-        "var_int_func_zscore": lambda img: img.subtract(mean_base_months).divide(std_base_months).copyProperties(img, img.propertyNames())
+        "var_int_func": lambda img, mean_base_months, std_base_months: img.subtract(mean_base_months).copyProperties(img, img.propertyNames()),
+        "var_int_func_zscore": lambda img, mean_base_months, std_base_months: img.subtract(mean_base_months).divide(std_base_months).copyProperties(img, img.propertyNames())
     }
 }
 
-# type_of_geometry
-if type_of_geometry == "mun":
-    # Municipios
-    fc = ee.FeatureCollection("projects/ee-unisaacarroyov/assets/GEOM-MX/MX_MUN_2022")
-elif type_of_geometry == "ent":
-    # Estados
-    fc = ee.FeatureCollection("projects/ee-unisaacarroyov/assets/GEOM-MX/MX_ENT_2022")
-elif type_of_geometry == "nac":
-    # Nación
-    fc = ee.FeatureCollection("USDOS/LSIB/2017").filter(ee.Filter.eq("COUNTRY_NA","Mexico"))
-
-# TODO: mejorar
-if ((banda_interes == "tmmx" or banda_interes == "tmmn") and temp_zscore):
-    name_prop_metric = f"{banda_interes}_zscore"
-elif (banda_interes == "pr"):
-    name_prop_metric = "anomaly_pr_prop"
-else:
-    name_prop_metric = banda_interes
-
-# type_reducer_time
-dict_reducers = {
-    "month": lambda number: final_data_img_coll
-                            .filter(ee.Filter.eq("date_year", number))\
-                            .first()\
-                            .reduceRegions(reducer = ee.Reducer.mean(), collection = fc, scale = scale_img_coll)\
-                            .map(lambda feature: ee.Feature(feature).set({"date_year": number, "metric": name_prop_metric}).setGeometry(None)),
-    "year": lambda number: final_data_img_coll
-                           .filter(ee.Filter.eq("date_year", number))\
-                           .first()\
-                           .reduce(ee.Reducer.mean())\
-                           .reduceRegions(reducer = ee.Reducer.mean(), collection = fc, scale = scale_img_coll)\
-                           .map(lambda feature: ee.Feature(feature).set({"date_year": number, "metric": name_prop_metric}).setGeometry(None))
-}
-
 
 # = = = = Valores constantes = = = = = 
-img_coll = ee.ImageCollection("IDAHO_EPSCOR/TERRACLIMATE")
-geom_mex = ee.FeatureCollection("USDOS/LSIB/2017").filter(ee.Filter.eq("COUNTRY_NA","Mexico")).first().geometry()
 scale_img_coll = 4638.3
 start_date_base = "1960-01-01"
 end_date_base = "1989-12-31"
 img_coll_start_year = 1960
 img_coll_end_year = 2023
 n_max_features = 3000
+list_meses = ["01","02","03","04","05","06","07","08","09","10","11","12"]
 
 # = = = = Funciones escenciales = = = = = =
 
+# = = Autenticación e inicio de Earth Engine (retorna: vacío) = = #
+ee_iniciado = False
+
+def func_iniciar_ee():
+    global ee_iniciado
+
+    if not ee_iniciado:
+        ee.Initialize()
+        ee_iniciado = True
+        print("Earth Engine inicializado")
+
+    return None
+
 def tag_month_year(img):
     full_date = ee.Date(ee.Number(img.get("system:time_start")))
     date_year = ee.Number(full_date.get("year"))
     date_month = ee.Number(full_date.get("month"))
     return img.set({"date_month": date_month, "date_year": date_year})
 
-def func_base_mean(element):
-    return data_image_coll_tag_year_month.filterDate(start_date_base, end_date_base).filter(ee.Filter.eq("date_month", element)).mean().set({"date_month": element})
-
-def func_base_std(element):
-    return data_image_coll_tag_year_month.filterDate(start_date_base, end_date_base).filter(ee.Filter.eq("date_month", element)).reduce(ee.Reducer.stdDev()).set({"date_month": element})
+# = = Prefijo de la variable de interés (retorna: str) = = #
+def str_var_interes(banda, temp_zscore = False):
+    if temp_zscore == False:
+        return f"anomaly_{banda}_" if banda in ["pr","tmmx","tmmn"] else f"{banda}_"
+    return f"zscore_{banda}_" if banda in ["tmmx","tmmn"] else f"eliminar-error_"
+
+# = = Nombre de la columna `metric` de una banda (retorna: str) = = #
+def func_nombre_metrica(banda, temp_zscore = False):
+    # TODO: mejorar
+    if ((banda == "tmmx" or banda == "tmmn") and temp_zscore):
+        return f"{banda}_zscore"
+    elif (banda == "pr"):
+        return "anomaly_pr_prop"
+    return banda
+
+# = = Nombres de la exportación (retorna: tupla) = = #
+def func_nombres_exportacion(list_bandas, type_of_geometry, type_reducer_time, temp_zscore = False):
+    # Con una banda, los nombres de siempre; con varias, las bandas separadas por "-"
+    if len(list_bandas) == 1:
+        str_bandas = str_var_interes(list_bandas[0], temp_zscore)
+    else:
+        str_bandas = "-".join(list_bandas) + "_"
+    str_sufijo = str_bandas + "mean_" + f"{type_of_geometry}_" + f"{type_reducer_time}_" + "terraclimate"
+    return "export_" + str_sufijo, "ts_" + str_sufijo
+
+# = = Geometrías (retorna: ee.FeatureCollection) = = #
+def func_geometrias(type_of_geometry):
+    if type_of_geometry == "mun":
+        # Municipios
+        return ee.FeatureCollection("projects/ee-unisaacarroyov/assets/GEOM-MX/MX_MUN_2022")
+    elif type_of_geometry == "ent":
+        # Estados
+        return ee.FeatureCollection("projects/ee-unisaacarroyov/assets/GEOM-MX/MX_ENT_2022")
+    elif type_of_geometry == "nac":
+        # Nación
+        return ee.FeatureCollection("USDOS/LSIB/2017").filter(ee.Filter.eq("COUNTRY_NA","Mexico"))
+    raise ValueError(f"Tipo de geometría no soportado: {type_of_geometry}")
+
+# = = Imágenes anuales de la variable de interés de una banda (retorna: ee.ImageCollection) = = #
+def func_variable_interes(img_coll, geom_mex, banda, temp_zscore = False):
+    # Bandas de cada imagen anual: `{metric}_{MM}`
+    dict_funcs = dict_functions_scalling_var_int[banda]
+    if temp_zscore:
+        # Las bandas sin z-score (pr y pdsi) se quedan con su variable de interés
+        var_int_func = dict_funcs.get("var_int_func_zscore", dict_funcs["var_int_func"])
+    else:
+        var_int_func = dict_funcs["var_int_func"]
+    metrica = func_nombre_metrica(banda, temp_zscore)
+
+    data_image_coll_tag_year_month = img_coll.select(banda).filter(ee.Filter.bounds(geom_mex)).map(dict_funcs["scalling_func"]).map(tag_month_year)
+    data_image_coll_base = data_image_coll_tag_year_month.filterDate(start_date_base, end_date_base)
+
+    # Media historica
+    list_img_to_img_coll_base_mean_months = ee.List.sequence(1,12,1).map(lambda element: data_image_coll_base.filter(ee.Filter.eq("date_month", element)).mean().set({"date_month": element}))
+    mean_base_months = ee.ImageCollection.fromImages(list_img_to_img_coll_base_mean_months).toBands().rename(list_meses)
+
+    # std historica
+    list_img_to_img_coll_base_std_months = ee.List.sequence(1,12,1).map(lambda element: data_image_coll_base.filter(ee.Filter.eq("date_month", element)).reduce(ee.Reducer.stdDev()).set({"date_month": element}))
+    std_base_months = ee.ImageCollection.fromImages(list_img_to_img_coll_base_std_months).toBands().rename(list_meses)
+
+    list_new_collection_by_year = ee.List.sequence(img_coll_start_year, img_coll_end_year).map(lambda element: data_image_coll_tag_year_month.filter(ee.Filter.eq("date_year", element)).toBands().set({"date_year": element}).rename(list_meses))
+
+    return ee.ImageCollection.fromImages(list_new_collection_by_year)\
+             .map(lambda img: var_int_func(img, mean_base_months, std_base_months))\
+             .map(lambda img: img.rename([f"{metrica}_{mes}" for mes in list_meses]))
+
+# = = Renglones (uno por `metric`) de un feature reducido (retorna: ee.FeatureCollection) = = #
+def func_formato_largo(feature, dict_columnas, number):
+    # `dict_columnas`: {metric: {columna de la tabla: propiedad del feature}}
+    feature = ee.Feature(feature)
+    list_propiedades = [propiedad for dict_propiedades in dict_columnas.values()
+                        for propiedad in dict_propiedades.values()]
+    feature_base = feature.select(feature.propertyNames().removeAll(list_propiedades))\
+                          .set({"date_year": number})\
+                          .setGeometry(None)
+    # `feature.get` de una propiedad sin valor (geometría sin pixeles) es nulo
+    return ee.FeatureCollection([
+        feature_base.set(dict({columna: feature.get(propiedad) for columna, propiedad in dict_propiedades.items()},
+                              metric = metrica))
+        for metrica, dict_propiedades in dict_columnas.items()])
+
+# = = Columnas de la tabla por `metric` (retorna: dict) = = #
+def func_columnas_metricas(list_metricas, type_reducer_time):
+    # {metric: {columna de la tabla: propiedad del feature}}. Columnas `01` a
+    # `12` (month) o `mean` (year). `reduceRegions` con `ee.Reducer.mean()`
+    # nombra las propiedades como las bandas, excepto con una sola banda
+    # (year de una variable), que queda como `mean`
+    if type_reducer_time == "month":
+        return {metrica: {mes: f"{metrica}_{mes}" for mes in list_meses}
+                for metrica in list_metricas}
+    if len(list_metricas) == 1:
+        return {list_metricas[0]: {"mean": "mean"}}
+    return {metrica: {"mean": metrica} for metrica in list_metricas}
+
+# = = Extracción de varias bandas en una sola reducción (retorna: ee.FeatureCollection) = = #
+def func_terraclimate(list_bandas, type_of_geometry = "ent", type_reducer_time = "month", temp_zscore = False):
+    for banda in list_bandas:
+        if banda not in dict_functions_scalling_var_int:
+            raise ValueError(f"Banda no soportada: {banda}")
+    if type_reducer_time not in ["month", "year"]:
+        raise ValueError(f"Tipo de reducción no soportado: {type_reducer_time}")
+
+    img_coll = ee.ImageCollection("IDAHO_EPSCOR/TERRACLIMATE")
+    geom_mex = ee.FeatureCollection("USDOS/LSIB/2017").filter(ee.Filter.eq("COUNTRY_NA","Mexico")).first().geometry()
+    fc = func_geometrias(type_of_geometry)
+    list_metricas = [func_nombre_metrica(banda, temp_zscore) for banda in list_bandas]
+
+    # Todas las bandas en una imagen por año; la media y std históricas de
+    # cada banda se calculan una sola vez
+    list_img_coll_bandas = [func_variable_interes(img_coll, geom_mex, banda, temp_zscore)
+                            for banda in list_bandas]
+
+    def func_imagen_year(number):
+        list_img = [img_coll_banda.filter(ee.Filter.eq("date_year", number)).first()
+                    for img_coll_banda in list_img_coll_bandas]
+        img = ee.Image.cat(list_img)
+        if type_reducer_time == "year":
+            img = ee.Image.cat([img.select([f"{metrica}_{mes}" for mes in list_meses]).reduce(ee.Reducer.mean()).rename(metrica)
+                                for metrica in list_metricas])
+        return img
+
+    dict_columnas = func_columnas_metricas(list_metricas, type_reducer_time)
+
+    list_fc_from_img_coll = ee.List.sequence(img_coll_start_year, img_coll_end_year).map(
+        lambda number: func_imagen_year(number)
+                       .reduceRegions(reducer = ee.Reducer.mean(), collection = fc, scale = scale_img_coll)
+                       .map(lambda feature: func_formato_largo(feature, dict_columnas, number))
+                       .flatten())
+
+    list_features_from_img_coll = list_fc_from_img_coll.map(lambda fc: ee.FeatureCollection(fc).toList(n_max_features * len(list_metricas))).flatten()
+
+    return ee.FeatureCollection(list_features_from_img_coll)
+
+# = = Exportar o descargar la extracción de varias bandas (retorna: vacío) = = #
+def func_exportar_terraclimate(list_bandas,
+                               type_of_geometry = "ent",
+                               type_reducer_time = "month",
+                               temp_zscore = False,
+                               str_destino = str_destino,
+                               str_folder = str_folder,
+                               str_path_salida = str_path_salida):
+    func_iniciar_ee()
+    str_description, str_fileNamePrefix = func_nombres_exportacion(list_bandas, type_of_geometry, type_reducer_time, temp_zscore)
+    fc_final = func_terraclimate(list_bandas, type_of_geometry, type_reducer_time, temp_zscore)
+
+    # = = = =  Descargar como CSV directamente (sin Google Drive) = = = = =
+    if str_destino == "directo":
+        os.makedirs(str_path_salida, exist_ok = True)
+        func_descargar_fc(fc_final, os.path.join(str_path_salida, f"{str_fileNamePrefix}.csv"))
+
+    # = = = =  Exportar como CSV (a una carpeta de Google Drive) = = = = =
+    elif str_destino == "drive":
+        import geemap
+        geemap.ee_export_vector_to_drive(
+            collection = fc_final,
+            description= str_description,
+            fileNamePrefix = str_fileNamePrefix,
+            fileFormat = "CSV",
+            folder = str_folder)
+
+    return None
 
 # = = = =  INICIO DE CÓDIGO  = = = = = = = = 
-
-data_image_coll_tag_year_month = img_coll.select(banda_interes).filter(ee.Filter.bounds(geom_mex)).map(dict_functions_scalling_var_int[banda_interes]["scalling_func"]).map(tag_month_year)
-
-# Media historica
-list_img_to_img_coll_base_mean_months = ee.List.sequence(1,12,1).map(func_base_mean)
-mean_base_months = ee.ImageCollection.fromImages(list_img_to_img_coll_base_mean_months).toBands().rename(["01","02","03","04","05","06","07","08","09","10","11","12"])
-
-# std historica
-list_img_to_img_coll_base_std_months = ee.List.sequence(1,12,1).map(func_base_std)
-std_base_months = ee.ImageCollection.fromImages(list_img_to_img_coll_base_std_months).toBands().rename(["01","02","03","04","05","06","07","08","09","10","11","12"])
-
-list_new_collection_by_year = ee.List.sequence(img_coll_start_year, img_coll_end_year).map(lambda element: data_image_coll_tag_year_month.filter(ee.Filter.eq("date_year", element)).toBands().set({"date_year": element}).rename(["01","02","03","04","05","06","07","08","09","10","11","12"]))
-
-if temp_zscore == False:
-    final_data_img_coll = ee.ImageCollection.fromImages(list_new_collection_by_year).map(dict_functions_scalling_var_int[banda_interes]["var_int_func"])
-elif temp_zscore == True:
-    final_data_img_coll = ee.ImageCollection.fromImages(list_new_collection_by_year).map(dict_functions_scalling_var_int[banda_interes]["var_int_func_zscore"])
-
-list_fc_from_img_coll = ee.List.sequence(img_coll_start_year, img_coll_end_year).map(dict_reducers[type_reducer_time])
-
-list_features_from_img_coll = list_fc_from_img_coll.map(lambda fc: ee.FeatureCollection(fc).toList(n_max_features)).flatten()
-
-fc_final = ee.FeatureCollection(list_features_from_img_coll)
-
-# = = = =  Exportar como CSV (a una carpeta de Google Drive) = = = = =
-geemap.ee_export_vector_to_drive(
-    collection = fc_final,
-    description= str_description,
-    fileNamePrefix = str_fileNamePrefix,
-    fileFormat = "CSV",
-    folder = str_folder)
\ No newline at end of file
+if __name__ == "__main__":
+    print("Empieza a correr el código...")
+    func_exportar_terraclimate(list_bandas_interes, type_of_geometry, type_reducer_time, temp_zscore)
@@ -0,0 +1,67 @@
+"""
+Author: Isaac Arroyo
+Notes: Revisión de las columnas de la tabla en formato largo de
+       **`raster2table_terraclimate.py`** (`func_columnas_metricas`), sin
+       Earth Engine.
+
+`reduceRegions` con `ee.Reducer.mean()` nombra las propiedades como las
+bandas de la imagen, excepto cuando la imagen tiene una sola banda (`year`
+de una sola variable), que queda como `mean`. Se verifica, para `month` y
+`year` con una y varias bandas, que cada propiedad de la columna de una
+`metric` exista en el _feature_ reducido y que los renglones (como en
+`func_formato_largo`) tengan las columnas `01` a `12` o `mean`.
+
+Uso:
+    python simulacion_columnas_terraclimate.py
+"""
+
+# = = = Imports = = = #
+from raster2table_terraclimate import (func_columnas_metricas,
+                                       func_nombre_metrica, list_meses)
+
+# = = Propiedades del feature reducido (retorna: dict) = = #
+def func_propiedades_ee(list_metricas, type_reducer_time):
+    # Bandas de la imagen del año: `{metric}_{MM}` (month) o `{metric}` (year)
+    if type_reducer_time == "month":
+        list_bandas = [f"{metrica}_{mes}" for metrica in list_metricas
+                       for mes in list_meses]
+    else:
+        list_bandas = list(list_metricas)
+    if len(list_bandas) == 1:
+        list_bandas = ["mean"]
+    return {"CVEGEO": "01", **{banda: float(i) for i, banda in enumerate(list_bandas)}}
+
+# = = Renglones en formato largo (retorna: list) = = #
+def func_renglones(propiedades, dict_columnas):
+    # Igual que `func_formato_largo` con un `dict` en lugar de un `ee.Feature`
+    list_propiedades = [propiedad for dict_propiedades in dict_columnas.values()
+                        for propiedad in dict_propiedades.values()]
+    base = {llave: valor for llave, valor in propiedades.items()
+            if llave not in list_propiedades}
+    return [dict(base, metric = metrica,
+                 **{columna: propiedades.get(propiedad)
+                    for columna, propiedad in dict_propiedades.items()})
+            for metrica, dict_propiedades in dict_columnas.items()]
+
+if __name__ == "__main__":
+    for list_bandas in (["pr"], ["pr", "tmmx", "tmmn", "pdsi"]):
+        list_metricas = [func_nombre_metrica(banda) for banda in list_bandas]
+        for type_reducer_time in ("month", "year"):
+            dict_columnas = func_columnas_metricas(list_metricas, type_reducer_time)
+            propiedades = func_propiedades_ee(list_metricas, type_reducer_time)
+
+            # Todas las propiedades de las columnas existen (no hay nulos)
+            assert all(propiedad in propiedades
+                       for dict_propiedades in dict_columnas.values()
+                       for propiedad in dict_propiedades.values()), dict_columnas
+
+            renglones = func_renglones(propiedades, dict_columnas)
+            columnas = list_meses if type_reducer_time == "month" else ["mean"]
+            assert [renglon["metric"] for renglon in renglones] == list_metricas
+            assert all(sorted(renglon) == sorted(["CVEGEO", "metric"] + columnas)
+                       for renglon in renglones), renglones
+            # Cada valor aparece una sola vez
+            valores = [renglon[columna] for renglon in renglones for columna in columnas]
+            assert len(set(valores)) == len(valores)
+            print(f"{len(list_bandas)} banda(s), {type_reducer_time}: "
+                  f"{len(renglones)} renglón(es) con {len(columnas)} columna(s)")
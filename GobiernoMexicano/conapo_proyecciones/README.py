@@ -34,6 +34,7 @@ Población (CONAPO)**, tanto para nivel Nacional, Estatal y Municipal.
 #| label: load-libraries-paths
 import pandas as pd
 import os
+import sys
 
 # Cambiar al folder principal del repositorio
 os.chdir("../../")
@@ -43,6 +44,10 @@ path2main = os.getcwd()
 path2gobmex = path2main + "/GobiernoMexicano"
 path2conapo = path2gobmex + "/conapo_proyecciones"
 
+# Lectura de archivos XLSX con caché en formato Parquet
+sys.path.append(path2gobmex)
+from herramientas.cache_excel import func_leer_excel
+
 # %% [markdown]
 """
 ## Población a mitad e inicio de año de los estados de México (1950-2070)
@@ -84,10 +89,10 @@ De los cuales, para esta ocasión (y por ahora) se usarán 2:
 
 # %%
 #| label: load-df_pob_ent_inicio-mid_year
-df_pob_ent_inicio_year = pd.read_excel(
-    path2conapoent + "/0_Pob_Inicio_1950_2070.xlsx") 
-df_pob_ent_mid_year = pd.read_excel(
-    path2conapoent + "/0_Pob_Mitad_1950_2070.xlsx")
+df_pob_ent_inicio_year = func_leer_excel(
+    path_excel = path2conapoent + "/0_Pob_Inicio_1950_2070.xlsx") 
+df_pob_ent_mid_year = func_leer_excel(
+    path_excel = path2conapoent + "/0_Pob_Mitad_1950_2070.xlsx")
 
 # %% [markdown]
 """
@@ -0,0 +1,228 @@
+"""
+Author: Isaac Arroyo
+Notes: Lectura de archivos XLSX con una copia en formato Parquet (_sidecar_)
+       en caché. Es usada por **`msm/README.py`**,
+       **`msm/actualizacion_msm.py`** y **`conapo_proyecciones/README.py`**.
+
+`pd.read_excel` es el paso más lento de esos procesos y se repite cada vez
+que se ejecuta el documento. Con `func_leer_excel`:
+
+* La primera vez, la hoja se lee con `openpyxl` en modo de solo lectura
+  (fila por fila, sin cargar todo el libro en memoria), se convierte en
+  columnas de Arrow y se guarda como Parquet en la caché.
+* Las siguientes veces se lee el archivo Parquet y las celdas pasan por
+  el mismo lector que usa `pd.read_excel` (`TextParser`), por lo que el
+  resultado es el mismo (tipos, `dtype`, nombres de columnas y valores
+  vacíos). Cada celda se guarda con su tipo: las columnas con tipos
+  mezclados se guardan en una columna por tipo.
+
+La llave de la caché es el _hash_ (SHA-256) del contenido del archivo XLSX
+y el nombre de la hoja, por lo que si el archivo cambia se vuelve a
+convertir.
+
+Si `pyarrow` u `openpyxl` no están instalados, se usa `pd.read_excel`.
+"""
+
+# = = = Imports = = = #
+import hashlib
+import json
+import os
+from datetime import date, datetime, time
+
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+try:
+    import openpyxl
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    openpyxl = None
+    pa = None
+
+path_cache_default = os.path.join(
+    os.environ.get(
+        "DATOS_FACIL_ACCESO_CACHE",
+        os.path.join(os.path.expanduser("~"), ".cache", "datos_facil_acceso")),
+    "excel")
+
+# Cambiar si cambia la forma de convertir los archivos
+version_conversion = "2"
+
+# = = Hash del archivo (retorna: str) = = #
+def func_hash_archivo(path_archivo, chunk_size = 1 << 20):
+    hash_archivo = hashlib.sha256()
+    with open(path_archivo, "rb") as archivo:
+        for chunk in iter(lambda: archivo.read(chunk_size), b""):
+            hash_archivo.update(chunk)
+    return hash_archivo.hexdigest()
+
+# = = Valor de una celda como en pd.read_excel (retorna: valor) = = #
+def func_valor_celda(valor):
+    # Los números enteros guardados como decimales (1.0) se leen como
+    # enteros (igual que `pandas.io.excel._openpyxl`)
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    return valor
+
+# = = Columna de valores a columnas de Arrow (retorna: dict) = = #
+def func_lista2arrow(nombre, valores):
+    # Una columna con un solo tipo de valores (además de vacíos) se guarda
+    # como una columna de Arrow. Las columnas con tipos mezclados (p. ej.
+    # enteros y decimales, o números y el texto "ND") se guardan en una
+    # columna por tipo (`{nombre}__int`, `{nombre}__str`, ...), para
+    # recuperar cada valor con su tipo
+    tipos = sorted({type(valor).__name__ for valor in valores
+                    if valor is not None})
+    if len(tipos) <= 1:
+        return {nombre: pa.array(valores)}
+
+    return {f"{nombre}__{tipo}": pa.array(
+                [valor if type(valor).__name__ == tipo else None
+                 for valor in valores])
+            for tipo in tipos}
+
+# = = Columna de Arrow (o columnas por tipo) a lista (retorna: list) = = #
+def func_arrow2lista(tabla, nombre, tipos):
+    if not tipos:
+        return tabla.column(nombre).to_pylist()
+
+    valores = [None] * tabla.num_rows
+    for tipo in tipos:
+        for i, valor in enumerate(tabla.column(f"{nombre}__{tipo}").to_pylist()):
+            if valor is not None:
+                valores[i] = valor
+    return valores
+
+# = = Encabezado con sus tipos para los metadatos (retorna: list) = = #
+def func_codificar_encabezado(encabezado):
+    # Los encabezados pueden ser texto, números o fechas (como en el MSM)
+    return [[type(valor).__name__,
+             valor.isoformat() if hasattr(valor, "isoformat") else valor]
+            for valor in encabezado]
+
+# = = Encabezado de los metadatos (retorna: list) = = #
+def func_decodificar_encabezado(encabezado_codificado):
+    dict_tipos = dict(datetime = datetime.fromisoformat,
+                      date = date.fromisoformat,
+                      time = time.fromisoformat)
+    return [dict_tipos.get(tipo, lambda valor: valor)(valor)
+            for tipo, valor in encabezado_codificado]
+
+# = = Nombres (únicos) de las columnas del Parquet (retorna: list) = = #
+def func_nombres_columnas(encabezado):
+    nombres = list()
+    for i, nombre in enumerate(encabezado):
+        nombre = f"Unnamed: {i}" if nombre is None else str(nombre)
+        # Nombres repetidos: `nombre`, `nombre.1`, `nombre.2`, ...
+        nombre_base, n_repetido = nombre, 1
+        while nombre in nombres:
+            nombre = f"{nombre_base}.{n_repetido}"
+            n_repetido += 1
+        nombres.append(nombre)
+    return nombres
+
+# = = Conversión de XLSX a Parquet (retorna: vacío) = = #
+def func_excel2parquet(path_excel, path_parquet, sheet_name = 0):
+    libro = openpyxl.load_workbook(path_excel, read_only = True,
+                                   data_only = True)
+    hoja = (libro.worksheets[sheet_name] if isinstance(sheet_name, int)
+            else libro[sheet_name])
+
+    filas = hoja.iter_rows(values_only = True)
+    encabezado = [func_valor_celda(valor) for valor in next(filas)]
+    columnas = [list() for _ in encabezado]
+    n_filas = 0
+    n_filas_vacias = 0
+
+    # Se guardan los valores por columna (una sola copia de los datos)
+    for fila in filas:
+        if all(valor is None for valor in fila):
+            n_filas_vacias += 1
+            continue
+
+        # Filas vacías entre filas con datos se conservan
+        for _ in range(n_filas_vacias):
+            for columna in columnas:
+                columna.append(None)
+        n_filas += n_filas_vacias
+        n_filas_vacias = 0
+
+        # Columnas sin encabezado
+        while len(fila) > len(columnas):
+            encabezado.append(None)
+            columnas.append([None] * n_filas)
+
+        for i, columna in enumerate(columnas):
+            columna.append(func_valor_celda(fila[i]) if i < len(fila) else None)
+        n_filas += 1
+
+    libro.close()
+
+    # Se quitan las columnas vacías al final (sin encabezado ni valores)
+    while (columnas and encabezado[-1] is None and
+           all(valor is None for valor in columnas[-1])):
+        encabezado.pop()
+        columnas.pop()
+
+    # Cada columna se convierte a Arrow y se libera de memoria
+    nombres = func_nombres_columnas(encabezado)
+    arrays = dict()
+    columnas_mixtas = dict()
+    for i, nombre in enumerate(nombres):
+        arrays_columna = func_lista2arrow(nombre, columnas[i])
+        if nombre not in arrays_columna:
+            columnas_mixtas[nombre] = [llave[len(nombre) + 2:]
+                                       for llave in arrays_columna]
+        arrays.update(arrays_columna)
+        columnas[i] = None
+
+    # El orden de las columnas, el encabezado original y los tipos de las
+    # columnas mixtas se guardan en los metadatos del archivo
+    tabla = pa.table(arrays).replace_schema_metadata({
+        "columnas": json.dumps(nombres),
+        "encabezado": json.dumps(func_codificar_encabezado(encabezado)),
+        "columnas_mixtas": json.dumps(columnas_mixtas)})
+    path_temporal = path_parquet + ".tmp"
+    pq.write_table(tabla, path_temporal, compression = "zstd")
+    os.replace(path_temporal, path_parquet)
+
+    return None
+
+# = = Lectura de XLSX con caché (retorna: pd.DataFrame) = = #
+def func_leer_excel(path_excel, sheet_name = 0, dtype = None,
+                    path_cache = None):
+    if pa is None or openpyxl is None:
+        return pd.read_excel(io = path_excel, sheet_name = sheet_name,
+                             dtype = dtype)
+
+    path_cache = path_cache or path_cache_default
+    os.makedirs(path_cache, exist_ok = True)
+
+    llave = hashlib.sha256("|".join([
+        func_hash_archivo(path_excel),
+        str(sheet_name),
+        version_conversion]).encode("utf-8")).hexdigest()[:32]
+    path_parquet = os.path.join(path_cache, f"{llave}.parquet")
+
+    if not os.path.exists(path_parquet):
+        func_excel2parquet(path_excel, path_parquet, sheet_name = sheet_name)
+
+    tabla = pq.read_table(path_parquet)
+    metadatos = tabla.schema.metadata
+    nombres = json.loads(metadatos[b"columnas"])
+    encabezado = func_decodificar_encabezado(
+        json.loads(metadatos[b"encabezado"]))
+    columnas_mixtas = json.loads(metadatos[b"columnas_mixtas"])
+
+    # Las celdas (con su tipo) pasan por el mismo lector de pd.read_excel
+    # (`TextParser`), por lo que la inferencia de tipos, `dtype`, los
+    # nombres de las columnas y los valores vacíos son los mismos
+    columnas = [func_arrow2lista(tabla, nombre, columnas_mixtas.get(nombre))
+                for nombre in nombres]
+    del tabla
+    datos = [["" if valor is None else valor for valor in fila]
+             for fila in [encabezado] + list(zip(*columnas))]
+
+    return TextParser(datos, header = 0, dtype = dtype,
+                      skip_blank_lines = False).read()
@@ -0,0 +1,219 @@
+"""
+Author: Isaac Arroyo
+Notes: Descarga de archivos remotos (MSM, SESNSP en Google Drive, etc.) con
+       caché en disco. Es usada por **`msm/README.py`**,
+       **`msm/actualizacion_msm.py`** y **`sesnsp/README.R`**.
+
+* **Caché por URL**: Cada archivo se guarda en la carpeta de caché con el
+  _hash_ del URL como nombre, junto con un archivo `.json` con los
+  metadatos de la descarga (`ETag`, `Last-Modified`, tamaño).
+* **Revalidación**: Si el archivo ya está en caché, se hace una petición
+  condicional (`If-None-Match` / `If-Modified-Since`). Si el servidor
+  responde `304 Not Modified`, se usa el archivo en caché sin descargarlo.
+* **Descargas por partes**: La descarga se escribe en un archivo `.part`.
+  Si se interrumpe, la siguiente ejecución continúa desde donde se quedó
+  (`Range` + `If-Range`). Si el `.part` ya estaba completo (el proceso
+  terminó antes de moverlo a la caché), el servidor responde `416`: con el
+  tamaño de `Content-Range` se mueve a la caché o, si no coincide, se
+  borra y se descarga de nuevo.
+* **Sesión compartida**: Todas las descargas usan la misma
+  `requests.Session` (conexiones reutilizables y reintentos).
+
+La carpeta de caché es `~/.cache/datos_facil_acceso`, o la indicada en la
+variable de ambiente `DATOS_FACIL_ACCESO_CACHE`.
+
+La revalidación, la continuación de descargas y los reintentos se prueban
+con un servidor HTTP local en **`simulacion_descargas.py`**.
+
+Uso desde la terminal (o desde R con `system2`), imprime la ruta local de
+cada archivo:
+    python descargas.py URL [URL ...]
+"""
+
+# = = = Imports = = = #
+import hashlib
+import json
+import os
+import re
+import sys
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+path_cache_default = os.environ.get(
+    "DATOS_FACIL_ACCESO_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "datos_facil_acceso"))
+
+sesion_global = None
+
+# = = Sesión HTTP compartida (retorna: requests.Session) = = #
+def func_sesion():
+    global sesion_global
+
+    if sesion_global is None:
+        reintentos = Retry(total = 3,
+                           backoff_factor = 0.5,
+                           status_forcelist = [429, 500, 502, 503, 504])
+        adaptador = HTTPAdapter(pool_connections = 4,
+                                pool_maxsize = 8,
+                                max_retries = reintentos)
+        sesion_global = requests.Session()
+        sesion_global.mount("http://", adaptador)
+        sesion_global.mount("https://", adaptador)
+
+    return sesion_global
+
+# = = URL de descarga directa de Google Drive (retorna: str) = = #
+def func_url_drive(url):
+    # Acepta URLs del tipo `.../file/d/ID/view` o `...?id=ID`. Con
+    # `confirm=t` se evita la página de advertencia de archivos grandes
+    if "drive.google.com" not in url:
+        return url
+
+    id_archivo = re.search(r"(?<=/d/)[\w-]+|(?<=[?&]id=)[\w-]+", url)
+    if id_archivo is None:
+        return url
+
+    return ("https://drive.usercontent.google.com/download?export=download"
+            f"&confirm=t&id={id_archivo.group(0)}")
+
+# = = Rutas del archivo en caché (retorna: tupla) = = #
+def func_paths_cache(url, path_cache):
+    llave = hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+
+    # Se conserva el nombre del archivo (y su extensión) al final
+    nombre = re.sub(r"[^\w.-]", "_", url.split("?")[0].rstrip("/").split("/")[-1])
+    path_archivo = os.path.join(path_cache, f"{llave}_{nombre}")
+
+    return (path_archivo,
+            path_archivo + ".json",
+            path_archivo + ".part",
+            path_archivo + ".part.json")
+
+# = = Leer metadatos (retorna: dict o None) = = #
+def func_leer_meta(path_meta):
+    if not os.path.exists(path_meta):
+        return None
+    with open(path_meta) as archivo:
+        return json.load(archivo)
+
+# = = Guardar metadatos (retorna: vacío) = = #
+def func_guardar_meta(path_meta, meta):
+    with open(path_meta, "w") as archivo:
+        json.dump(meta, archivo, indent = 1)
+    return None
+
+# = = Escribir la respuesta en el `.part` (retorna: tupla) = = #
+def func_escribir_parte(respuesta, url, path_parcial, path_meta_parcial,
+                        chunk_size):
+    # Regresa los metadatos de la respuesta y el tamaño esperado del archivo
+    meta_nuevo = dict(url = url,
+                      etag = respuesta.headers.get("ETag"),
+                      last_modified = respuesta.headers.get("Last-Modified"))
+
+    # Si el servidor ignora el rango (200), se descarga desde el inicio
+    if respuesta.status_code == 206:
+        modo = "ab"
+        n_bytes_total = int(
+            respuesta.headers["Content-Range"].split("/")[-1])
+    else:
+        modo = "wb"
+        n_bytes_total = (int(respuesta.headers["Content-Length"])
+                         if "Content-Length" in respuesta.headers
+                         and "Content-Encoding" not in respuesta.headers
+                         else None)
+        func_guardar_meta(path_meta_parcial, meta_nuevo)
+
+    with open(path_parcial, modo) as archivo:
+        for chunk in respuesta.iter_content(chunk_size = chunk_size):
+            archivo.write(chunk)
+
+    return meta_nuevo, n_bytes_total
+
+# = = Descarga con caché (retorna: str, ruta local del archivo) = = #
+def func_descargar(url,
+                   path_cache = None,
+                   sesion = None,
+                   revalidar = True,
+                   chunk_size = 1 << 16,
+                   timeout = 60):
+    url = func_url_drive(url)
+    path_cache = path_cache or path_cache_default
+    sesion = sesion or func_sesion()
+    os.makedirs(path_cache, exist_ok = True)
+
+    (path_archivo,
+     path_meta,
+     path_parcial,
+     path_meta_parcial) = func_paths_cache(url, path_cache)
+
+    meta = func_leer_meta(path_meta) if os.path.exists(path_archivo) else None
+    if meta is not None and not revalidar:
+        return path_archivo
+
+    # - - Petición condicional - - #
+    headers = dict()
+    if meta is not None:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    # - - Continuar una descarga interrumpida - - #
+    meta_parcial = func_leer_meta(path_meta_parcial)
+    n_bytes_parcial = (os.path.getsize(path_parcial)
+                       if os.path.exists(path_parcial) else 0)
+    validador_parcial = (meta_parcial or dict()).get("etag") or \
+                        (meta_parcial or dict()).get("last_modified")
+    if n_bytes_parcial > 0 and validador_parcial:
+        headers["Range"] = f"bytes={n_bytes_parcial}-"
+        headers["If-Range"] = validador_parcial
+
+    with sesion.get(url, headers = headers, stream = True,
+                    timeout = timeout) as respuesta:
+        if respuesta.status_code == 304:
+            return path_archivo
+
+        # - - Rango fuera del archivo (`Content-Range: bytes */N`) - - #
+        if respuesta.status_code == 416 and "Range" in headers:
+            tamano = re.search(r"/(\d+)$", respuesta.headers.get("Content-Range", ""))
+            # `.part` completo: se mueve a la caché. Si no corresponde al
+            # archivo, se borra y se descarga desde el inicio
+            meta_nuevo = (dict(url = url)
+                          if tamano and int(tamano.group(1)) == n_bytes_parcial
+                          else None)
+            n_bytes_total = n_bytes_parcial
+        else:
+            respuesta.raise_for_status()
+            meta_nuevo, n_bytes_total = func_escribir_parte(respuesta, url,
+                                                            path_parcial,
+                                                            path_meta_parcial,
+                                                            chunk_size)
+
+    if meta_nuevo is None:
+        for path in (path_parcial, path_meta_parcial):
+            if os.path.exists(path):
+                os.remove(path)
+        return func_descargar(url, path_cache = path_cache, sesion = sesion,
+                              revalidar = revalidar, chunk_size = chunk_size,
+                              timeout = timeout)
+
+    # - - Verificar y mover a la caché - - #
+    n_bytes = os.path.getsize(path_parcial)
+    if n_bytes_total is not None and n_bytes != n_bytes_total:
+        raise IOError(f"Descarga incompleta de {url}: {n_bytes} de "
+                      f"{n_bytes_total} bytes (se continuará en la "
+                      "siguiente ejecución)")
+
+    os.replace(path_parcial, path_archivo)
+    meta_nuevo.update(func_leer_meta(path_meta_parcial) or dict())
+    meta_nuevo["n_bytes"] = n_bytes
+    func_guardar_meta(path_meta, meta_nuevo)
+    os.remove(path_meta_parcial)
+
+    return path_archivo
+
+if __name__ == "__main__":
+    for url in sys.argv[1:]:
+        print(func_descargar(url))
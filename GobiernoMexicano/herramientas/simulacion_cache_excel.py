@@ -0,0 +1,131 @@
+"""
+Author: Isaac Arroyo
+Notes: Comparación de **`cache_excel.py`** (`func_leer_excel`) con
+       `pd.read_excel` en un libro XLSX sintético con las columnas que dan
+       problemas al convertir tipos:
+
+* Claves como texto y como número en la misma columna (`'01001'`, `1003`)
+* Enteros, enteros con celdas vacías y enteros guardados como decimales
+* Enteros y decimales en la misma columna
+* Números y texto (`"ND"`) en la misma columna
+* Fechas, valores lógicos, encabezados repetidos, vacíos y de fecha (como
+  las columnas del MSM) y filas vacías entre los datos
+
+Para cada `dtype` (`None`, `'object'` y `str`) se verifica que ambos
+resultados sean iguales (valores, tipos de las columnas y tipo de cada
+valor), la primera vez (conversión) y con el archivo en caché. Al final se
+comparan los tiempos de lectura con un libro del tamaño del MSM.
+
+Uso:
+    python simulacion_cache_excel.py [n_filas] [n_columnas]
+"""
+
+# = = = Imports = = = #
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from cache_excel import func_leer_excel
+
+# = = Libro XLSX con columnas de tipos mezclados (retorna: vacío) = = #
+def func_libro_tipos(path_excel):
+    dict_columnas = {
+        "clave": ["01001", "01002", 1003, None, 5],
+        "entero": [1, 2, 3, 4, 5],
+        "entero_vacio": [1, None, 3, 4, 5],
+        "entero_decimal": [1.0, 2.0, 3.0, 4.0, 5.0],
+        "entero_y_decimal": [1, 1.5, 2, None, 3.0],
+        "numero_y_texto": [1, "ND", 2.5, None, 4.0],
+        "texto": ["D0", None, "D1", "D2", "Sin sequia"],
+        "fecha": [datetime(2020, 1, 1), None, datetime(2021, 5, 1),
+                  datetime(2022, 1, 1), datetime(2023, 1, 1)],
+        "logico": [True, False, None, True, False]}
+    encabezado = list(dict_columnas) + ["texto", None, datetime(2016, 7, 31)]
+    filas = [list(fila) + ["a", 1, "D3"] for fila in zip(*dict_columnas.values())]
+    # Fila vacía entre los datos
+    filas.insert(3, [None] * len(encabezado))
+
+    libro = openpyxl.Workbook()
+    hoja = libro.active
+    hoja.append(encabezado)
+    for fila in filas:
+        hoja.append(fila)
+    libro.save(path_excel)
+    return None
+
+# = = Libro XLSX del tamaño del MSM (retorna: vacío) = = #
+def func_libro_msm(path_excel, n_filas, n_columnas, semilla = 0):
+    aleatorio = np.random.default_rng(semilla)
+    categorias = np.array([None, "D0", "D1", "D2", "D3", "D4"], dtype = object)
+    valores = categorias[aleatorio.integers(0, 6, (n_filas, n_columnas))]
+
+    libro = openpyxl.Workbook(write_only = True)
+    hoja = libro.create_sheet()
+    hoja.append(["cve_concatenada", "cve_ent"] +
+                [datetime(2003, 1, 1) + pd.Timedelta(days = 15 * i)
+                 for i in range(n_columnas)])
+    for i, fila in enumerate(valores.tolist()):
+        hoja.append([f"{i:05d}", i // 100] + fila)
+    libro.save(path_excel)
+    return None
+
+# = = Diferencias entre dos pd.DataFrame (retorna: list) = = #
+def func_diferencias(datframe_excel, datframe_cache):
+    list_diferencias = list()
+    if list(datframe_excel.columns) != list(datframe_cache.columns):
+        return [("columnas", list(datframe_excel.columns),
+                 list(datframe_cache.columns))]
+
+    for col in datframe_excel.columns:
+        serie_excel, serie_cache = datframe_excel[col], datframe_cache[col]
+        iguales = (serie_excel.dtype == serie_cache.dtype and
+                   all(type(a) is type(b) and (a == b or (pd.isna(a) and pd.isna(b)))
+                       for a, b in zip(serie_excel, serie_cache)))
+        if not iguales:
+            list_diferencias.append((col, serie_excel.tolist(),
+                                     serie_cache.tolist()))
+    return list_diferencias
+
+if __name__ == "__main__":
+    n_filas = int(sys.argv[1]) if len(sys.argv) > 1 else 2_475
+    n_columnas = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+
+    with tempfile.TemporaryDirectory() as path_temporal:
+        # - - Tipos de columnas - - #
+        path_excel = os.path.join(path_temporal, "tipos.xlsx")
+        func_libro_tipos(path_excel)
+        for dtype in [None, "object", str]:
+            datframe_excel = pd.read_excel(path_excel, dtype = dtype)
+            # Conversión (primera vez) y lectura desde la caché
+            for _ in range(2):
+                datframe_cache = func_leer_excel(path_excel, dtype = dtype,
+                                                 path_cache = path_temporal)
+                list_diferencias = func_diferencias(datframe_excel,
+                                                    datframe_cache)
+                assert not list_diferencias, list_diferencias
+        print("Mismos valores y tipos que pd.read_excel (dtype None, "
+              "'object' y str)")
+
+        # - - Tiempos con un libro del tamaño del MSM - - #
+        path_excel = os.path.join(path_temporal, "msm.xlsx")
+        func_libro_msm(path_excel, n_filas, n_columnas)
+
+        tiempo_inicio = time.perf_counter()
+        datframe_excel = pd.read_excel(path_excel, dtype = "object")
+        tiempo_excel = time.perf_counter() - tiempo_inicio
+
+        func_leer_excel(path_excel, dtype = "object", path_cache = path_temporal)
+        tiempo_inicio = time.perf_counter()
+        datframe_cache = func_leer_excel(path_excel, dtype = "object",
+                                         path_cache = path_temporal)
+        tiempo_cache = time.perf_counter() - tiempo_inicio
+
+        assert not func_diferencias(datframe_excel, datframe_cache)
+        print(f"{n_filas} x {n_columnas + 2}: pd.read_excel "
+              f"{tiempo_excel:.2f} s, caché {tiempo_cache:.2f} s")
@@ -0,0 +1,232 @@
+"""
+Author: Isaac Arroyo
+Notes: Simulación de **`descargas.py`** con un servidor HTTP local
+       (`http.server` en `127.0.0.1`) en lugar de los servidores del MSM o
+       de Google Drive.
+
+El servidor responde con `ETag` y `Last-Modified`, atiende peticiones
+condicionales (`If-None-Match` / `If-Modified-Since`) y por partes
+(`Range` + `If-Range`), puede cortar una respuesta después de cierto
+número de bytes y puede responder `503` las primeras veces. Se verifica
+que:
+
+* La segunda descarga del mismo archivo sea un `304` (con `ETag` y
+  únicamente con `Last-Modified`), sin volver a enviar el archivo
+* Después de una descarga cortada, la siguiente ejecución pida únicamente
+  los bytes que faltan (`206`) y el archivo sea idéntico al del servidor
+* Si el archivo cambia entre la descarga cortada y la continuación (otro
+  `ETag`), la descarga empiece desde el inicio con el archivo nuevo
+* Los `503` se reintenten (`Retry` de la sesión compartida)
+* Un `.part` completo que no se movió a la caché (el proceso terminó antes)
+  reciba un `416` y se mueva a la caché sin descargarlo de nuevo, y un
+  `.part` de otro tamaño se borre y el archivo se descargue completo
+
+Cada petición se registra antes de enviar la respuesta, por lo que al
+regresar la descarga la última petición ya está en `list_peticiones`.
+
+Uso:
+    python simulacion_descargas.py [n_bytes]
+"""
+
+# = = = Imports = = = #
+import os
+import sys
+import tempfile
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from descargas import func_descargar, func_leer_meta, func_paths_cache
+
+# = = Servidor HTTP simulado (retorna: clase) = = #
+def func_servidor_simulado():
+    # El estado del servidor se comparte entre peticiones (atributos de la
+    # clase); `list_peticiones` guarda (encabezados, estatus, bytes enviados)
+    class ServidorSimulado(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        contenido = b""
+        etag = None
+        last_modified = None
+        cortar_en = None
+        n_errores = 0
+        list_peticiones = list()
+
+        # - - Cambiar el archivo del servidor - - #
+        @classmethod
+        def func_publicar(cls, contenido, version, con_etag = True):
+            cls.contenido = contenido
+            cls.etag = f'"v{version}"' if con_etag else None
+            cls.last_modified = formatdate(1_700_000_000 + version * 86_400,
+                                           usegmt = True)
+
+        def log_message(self, *args):
+            return None
+
+        def func_responder(self, estatus, cuerpo = b"", encabezados = None,
+                           n_content_length = None):
+            # Se registra antes de responder: el cliente puede revisar la
+            # petición en cuanto recibe la respuesta
+            type(self).list_peticiones.append(
+                (dict(self.headers), estatus, len(cuerpo)))
+            self.send_response(estatus)
+            for llave, valor in (encabezados or dict()).items():
+                self.send_header(llave, valor)
+            self.send_header("Content-Length", str(
+                len(cuerpo) if n_content_length is None else n_content_length))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def do_GET(self):
+            clase = type(self)
+            if clase.n_errores > 0:
+                clase.n_errores -= 1
+                return self.func_responder(503, encabezados = {"Retry-After": "0"})
+
+            validadores = {"Last-Modified": clase.last_modified}
+            if clase.etag:
+                validadores["ETag"] = clase.etag
+
+            # - - Petición condicional - - #
+            if ((clase.etag and self.headers.get("If-None-Match") == clase.etag) or
+                    (not clase.etag and self.headers.get("If-Modified-Since") ==
+                     clase.last_modified)):
+                return self.func_responder(304, encabezados = validadores)
+
+            # - - Petición por partes (si el validador sigue vigente) - - #
+            inicio = 0
+            rango = self.headers.get("Range")
+            if rango and self.headers.get("If-Range") in (clase.etag,
+                                                          clase.last_modified):
+                inicio = int(rango.split("=")[1].rstrip("-"))
+                if inicio >= len(clase.contenido):
+                    return self.func_responder(
+                        416, encabezados = {"Content-Range":
+                                            f"bytes */{len(clase.contenido)}"})
+
+            cuerpo = clase.contenido[inicio:]
+            encabezados = dict(validadores)
+            if inicio > 0:
+                encabezados["Content-Range"] = (
+                    f"bytes {inicio}-{len(clase.contenido) - 1}/"
+                    f"{len(clase.contenido)}")
+
+            # - - Respuesta cortada (se anuncia el tamaño completo) - - #
+            if clase.cortar_en is not None:
+                n_cortar, clase.cortar_en = clase.cortar_en, None
+                self.close_connection = True
+                return self.func_responder(206 if inicio > 0 else 200,
+                                           cuerpo[:n_cortar], encabezados,
+                                           n_content_length = len(cuerpo))
+
+            return self.func_responder(206 if inicio > 0 else 200,
+                                       cuerpo, encabezados)
+
+    return ServidorSimulado
+
+# = = Descarga que puede fallar (retorna: str o None) = = #
+def func_descargar_cortada(url, path_cache):
+    try:
+        return func_descargar(url, path_cache = path_cache)
+    except (IOError, requests.exceptions.RequestException):
+        return None
+
+if __name__ == "__main__":
+    n_bytes = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    list_versiones = [os.urandom(n_bytes) for _ in range(5)]
+
+    ServidorSimulado = func_servidor_simulado()
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), ServidorSimulado)
+    threading.Thread(target = servidor.serve_forever, daemon = True).start()
+    peticiones = ServidorSimulado.list_peticiones
+    url = f"http://127.0.0.1:{servidor.server_port}/MunicipiosSequia.xlsx"
+
+    with tempfile.TemporaryDirectory() as path_cache:
+        path_parcial = func_paths_cache(url, path_cache)[2]
+        func_leer = lambda path: open(path, "rb").read()
+
+        # - - Primera descarga y revalidación (ETag) - - #
+        ServidorSimulado.func_publicar(list_versiones[0], 0)
+        path_archivo = func_descargar(url, path_cache = path_cache)
+        assert func_leer(path_archivo) == list_versiones[0]
+
+        assert func_descargar(url, path_cache = path_cache) == path_archivo
+        encabezados, estatus, n_enviados = peticiones[-1]
+        assert estatus == 304 and n_enviados == 0
+        assert encabezados["If-None-Match"] == '"v0"'
+        print("Revalidación con ETag: 304, 0 bytes")
+
+        # - - Revalidación únicamente con Last-Modified - - #
+        ServidorSimulado.func_publicar(list_versiones[1], 1, con_etag = False)
+        assert func_leer(func_descargar(url, path_cache = path_cache)) == list_versiones[1]
+        func_descargar(url, path_cache = path_cache)
+        encabezados, estatus, n_enviados = peticiones[-1]
+        assert estatus == 304 and n_enviados == 0
+        assert encabezados["If-Modified-Since"] == ServidorSimulado.last_modified
+        print("Revalidación con Last-Modified: 304, 0 bytes")
+
+        # - - Descarga cortada y continuación - - #
+        ServidorSimulado.func_publicar(list_versiones[2], 2)
+        ServidorSimulado.cortar_en = n_cortar = n_bytes // 3
+        assert func_descargar_cortada(url, path_cache) is None
+        # Los bytes del último bloque incompleto pueden perderse
+        n_parcial = os.path.getsize(path_parcial)
+        assert 0 < n_parcial <= n_cortar
+        # La versión anterior se conserva mientras la nueva está incompleta
+        assert func_leer(path_archivo) == list_versiones[1]
+
+        func_descargar(url, path_cache = path_cache)
+        encabezados, estatus, n_enviados = peticiones[-1]
+        assert estatus == 206 and n_enviados == n_bytes - n_parcial
+        assert (encabezados["Range"], encabezados["If-Range"]) == \
+            (f"bytes={n_parcial}-", '"v2"')
+        assert func_leer(path_archivo) == list_versiones[2]
+        assert not os.path.exists(path_parcial)
+        assert func_leer_meta(path_archivo + ".json")["etag"] == '"v2"'
+        print(f"Continuación: 206, {n_enviados} de {n_bytes} bytes")
+
+        # - - El archivo cambia entre el corte y la continuación - - #
+        ServidorSimulado.func_publicar(list_versiones[3], 3)
+        ServidorSimulado.cortar_en = n_bytes // 2
+        assert func_descargar_cortada(url, path_cache) is None
+        ServidorSimulado.func_publicar(list_versiones[4], 4)
+
+        func_descargar(url, path_cache = path_cache)
+        encabezados, estatus, n_enviados = peticiones[-1]
+        assert encabezados["If-Range"] == '"v3"'
+        assert estatus == 200 and n_enviados == n_bytes
+        assert func_leer(path_archivo) == list_versiones[4]
+        assert func_leer_meta(path_archivo + ".json")["etag"] == '"v4"'
+        print("Validador distinto: 200, descarga completa del archivo nuevo")
+
+        # - - Reintentos - - #
+        ServidorSimulado.func_publicar(list_versiones[0], 5)
+        ServidorSimulado.n_errores = 2
+        n_peticiones = len(peticiones)
+        assert func_leer(func_descargar(url, path_cache = path_cache)) == list_versiones[0]
+        assert ([estatus for _, estatus, _ in peticiones[n_peticiones:]] ==
+                [503, 503, 200])
+        print("Reintentos: 503, 503, 200")
+
+        # - - `.part` completo que no se movió a la caché - - #
+        # (versión 6: completo; versión 7: 10 bytes de más)
+        path_meta_parcial = func_paths_cache(url, path_cache)[3]
+        for version, contenido, sobrante, list_esperados in [
+                (6, list_versiones[1], b"", [416]),
+                (7, list_versiones[2], b"x" * 10, [416, 200])]:
+            ServidorSimulado.func_publicar(contenido, version)
+            with open(path_parcial, "wb") as archivo:
+                archivo.write(contenido + sobrante)
+            with open(path_meta_parcial, "w") as archivo:
+                archivo.write(f'{{"etag": "\\"v{version}\\""}}')
+            n_peticiones = len(peticiones)
+            assert func_leer(func_descargar(url, path_cache = path_cache)) == contenido
+            assert not os.path.exists(path_parcial)
+            assert not os.path.exists(path_meta_parcial)
+            assert func_leer_meta(path_archivo + ".json")["etag"] == f'"v{version}"'
+            list_estatus = [estatus for _, estatus, _ in peticiones[n_peticiones:]]
+            assert list_estatus == list_esperados, list_estatus
+        print("Parte completa: 416 y a la caché; parte de otro tamaño: 416, 200")
+
+    servidor.shutdown()
@@ -55,11 +55,32 @@ Como primer paso es modificar la base de datos del MSM para que este en
 formato _tidy_, ya que originalmente las columnas son la fecha del registro.
 """
 
+# %% [markdown]
+"""
+El archivo XLSX se descarga con `func_descargar` (de 
+**`GobiernoMexicano/herramientas/descargas.py`**), que guarda el archivo 
+en caché y únicamente lo vuelve a descargar si el archivo cambió en el 
+servidor.
+
+La lectura del XLSX se hace con `func_leer_excel` (de 
+**`GobiernoMexicano/herramientas/cache_excel.py`**), que guarda una copia 
+de la hoja en formato Parquet. Mientras el archivo no cambie, las 
+siguientes ejecuciones leen la copia en lugar del XLSX.
+"""
+
 # %% 
 #| label: load_1st_transform-msm_og
-msm_og = pd.read_excel(
-   io = "".join(["https://smn.conagua.gob.mx/tools/RESOURCES/Monitor%20de",
-                 "%20Sequia%20en%20Mexico/MunicipiosSequia.xlsx"]),
+import os
+import sys
+
+sys.path.append(os.path.abspath(".."))
+from herramientas.descargas import func_descargar
+from herramientas.cache_excel import func_leer_excel
+
+msm_og = func_leer_excel(
+   path_excel = func_descargar(
+      url = "".join(["https://smn.conagua.gob.mx/tools/RESOURCES/Monitor%20de",
+                     "%20Sequia%20en%20Mexico/MunicipiosSequia.xlsx"])),
    dtype= 'object')
 
 msm_og = msm_og.clean_names(remove_special = True)
@@ -97,8 +118,20 @@ A partir de esta tabla, enlistan los cambios necesarios:
 ### Hacer el cambio de _wide format_ a _long format_
 """
 
+# %% [markdown]
+"""
+La columna `sequia` se codifica como una categoría ordenada 
+(`tipo_sequia`, de **`categorias_sequia.py`**): 
+`Sin sequia < D0 < D1 < D2 < D3 < D4`. Cada registro ocupa un `int8` en 
+lugar de un texto, la codificación se conserva en los intervalos, las 
+rachas y el registro diario, y comparaciones como "D2 o peor" son 
+comparaciones de enteros (`func_sequia_o_peor`).
+"""
+
 # %%
 #| label: trans_df-wide2long
+from categorias_sequia import func_sequia2categoria
+
 # Wide to Long
 msm_long = pd.melt(
     frame = msm_og,
@@ -106,8 +139,9 @@ msm_long = pd.melt(
     var_name = 'full_date',
     value_name = 'sequia')
 
-# Los espacios vacíos o NaN son en realidad registros Sin sequia
-msm_long['sequia'] = msm_long['sequia'].fillna("Sin sequia")
+# Los espacios vacíos o NaN son en realidad registros Sin sequia. La 
+# sequía se guarda como categoría ordenada (int8)
+msm_long['sequia'] = func_sequia2categoria(serie_sequia = msm_long['sequia'])
 
 # %%
 #| label: show-msm_long-sample
@@ -165,56 +199,36 @@ publicaciones quincenales es de los últimos 15 días.
 
 # %% [markdown]
 """
-### Función para completar días
-
-Esta función toma un grupo (un municipios) y completará la serie de tiempo 
-por día. Con los valores `NaN` de sequía, se llenarán con el registro 
-siguiente al que se tiene (que no sea `NaN`)
-"""
-# %%
-#| label: create-func_llenado_dias_sequia
-def func_llenado_dias_sequia(group):
-    
-    # La fecha inicia en Enero 01, 2003
-    min_date = "2003-01-01"
-    
-    # La fecha final es la última actualización disponible
-    max_date = group['full_date'].max().strftime("%Y-%m-%d")
-
-    # Rango con frecuencia de 1 día
-    date_range = pd.date_range(start=min_date, end=max_date, freq='D')
-
-    # Completar las fechas del grupo
-    complete_group = group.set_index('full_date').reindex(date_range)
+### Intervalos de sequía
 
-    # Llenado de NaNs
-    complete_group = complete_group.bfill()
+En lugar de completar la serie de tiempo por día de cada municipio, el 
+registro se guarda como intervalos: cada publicación representa la sequía 
+desde el día siguiente a la publicación anterior hasta la fecha de la 
+publicación. La primera publicación de cada municipio inicia en Enero 01, 
+2003.
 
-    # Reset index y renombralo como 'full_date'
-    complete_group = (complete_group
-                      .reset_index(drop = False)
-                      .rename(columns = {'index': 'full_date'}))
+El resultado es el mismo que completar los días y llenar los valores 
+`NaN` con el registro siguiente (`bfill`), pero con una fila por 
+publicación en lugar de una fila por día. El registro diario se crea 
+únicamente al momento de guardarlo y por partes.
 
-    return complete_group
-
-# %% [markdown]
-"""
-Se usarán únicamente las columnas de las claves de los municipios
+Las funciones se encuentran en el archivo **`intervalos_sequia.py`**
 """
+
 # %%
-#| label: create-msm_long_filled
+#| label: create-msm_intervalos
+from intervalos_sequia import (func_intervalos_sequia,
+                               func_iter_dias_sequia,
+                               func_mask_fechas_sin_msm)
 
-msm_long_filled = (msm_long[['full_date','cve_concatenada', 'sequia']]
-  .groupby(by = 'cve_concatenada')
-  .apply(lambda x: func_llenado_dias_sequia(group=x))
-  .reset_index(drop = True))
+msm_intervalos = func_intervalos_sequia(datframe = msm_long)
 
 # %%
-#| label: show-msm_long_filled
+#| label: show-msm_intervalos
 #| echo: false
 
 Markdown(
-   msm_long_filled
+   msm_intervalos
    .sample(n = 5, random_state= 11)
    .to_markdown(index = False))
 
@@ -222,115 +236,45 @@ Markdown(
 """
 ## Cálculo de rachas y rachas máximas
 
-A partir de los datos procesados (**`msm_long_filled`**) se irá iterando 
-por cada uno de los municipios para obtener sus rachas de sequía y a partir 
-de estas las de mayor duración.
+A partir de los intervalos (**`msm_intervalos`**) se obtienen las 
+rachas de sequía de todos los municipios y a partir de estas las de mayor 
+duración.
 """
 
 # %% [markdown]
 """
-### Función para conteo de rachas
+### Funciones para conteo de rachas y rachas máximas
 
-El resultado de esta función será necesaria para la función de 
-rachas máximas
-"""
+Las funciones se encuentran en el archivo **`rachas_sequia.py`**. En lugar 
+de iterar por cada uno de los municipios, las rachas de todos los 
+municipios se calculan en una sola pasada por columnas:
 
-# %%
-#| label: create-func_count_sequia_mun
-
-def func_count_sequia_mun(datframe, clave_mun):
-    # Aislar el pandas.DataFrame a los datos de un solo municipio
-    datframe_mun = datframe.query(f"cve_concatenada == '{clave_mun}'")
-
-    # Obtener los valores de sequia y las fechas en la que fueron tomadas
-    lista_sequias = datframe_mun['sequia'].values.tolist()
-    lista_fechas = datframe_mun['full_date'].values.tolist()
-
-    # Iniciar contador de rachas: Se inicia con uno porque se asume que ya va 
-    # un tiempo con un tipo de categoria hasta que haya un cambio
-    count = 1
-    lista_count = list()
-
-    # Iterar a partir del segundo elemento hasta el final
-    for i in range(1, len(lista_sequias)):
-        # Comparar si el elemento anterior es igual al que se tiene 
-        # en la iteracion
-        if lista_sequias[i] == lista_sequias[i-1]:
-          # De ser idéntico, se aumenta la racha
-          count += 1
-        else:
-          # De no ser idéntico, se guarda la fecha de inicio y fin, y el 
-          # conteo de la racha
-          lista_count.append(
-            (clave_mun,
-              lista_sequias[i-1],
-              count,
-              lista_fechas[i-count],
-              lista_fechas[i-1]))
-          
-          # Se reinicia el conteo de las rachas
-          count = 1
-
-    # Toda la información se guarda en una lista donde cada elemento es 
-    # una tupla
-    lista_count.append(
-      (clave_mun,
-        lista_sequias[-1],
-        count,
-        lista_fechas[-count],
-        lista_fechas[-1]))
-
-    # Se transforma la lista de tuplas en un pandas.DataFrame
-    datframe_rachas = pd.DataFrame(
-      data= lista_count,
-      columns = ['cve_concatenada',
-                  'sequia',
-                  'racha',
-                  'full_date_start_racha',
-                  'full_date_end_racha'])
-    # Los datos de las fechas estan en formato UNIX, por lo que se tienen 
-    # que transformar a np.datetime64
-    datframe_rachas['full_date_start_racha'] = pd.to_datetime(
-      arg = datframe_rachas['full_date_start_racha'])
-    datframe_rachas['full_date_end_racha'] = pd.to_datetime(
-      arg = datframe_rachas['full_date_end_racha'])
-
-    # Calcular la diferencia de dias entre las fechas (el resultado es 
-    # un string con el numero de días + la palabra 'days')
-    datframe_rachas['racha_dias'] = (
-       datframe_rachas['full_date_end_racha'] - 
-       datframe_rachas['full_date_start_racha'])
-    
-    # Eliminar la palabra 'days' y transformar a número
-    datframe_rachas['racha_dias'] = (datframe_rachas['racha_dias']
-                                     .astype(str)
-                                     .str.replace(" days", "")
-                                     .astype(int))
-    
-    return datframe_rachas
-
-# %% [markdown]
-"""
-### Función para aislar las rachas máximas
+1. Se ordenan los intervalos por municipio y fecha
+2. Se marca el inicio de una racha cuando cambia el municipio o cambia el 
+tipo de sequía con respecto al intervalo anterior
+3. Con las posiciones de inicio y fin de cada racha se obtiene la duración 
+(`racha`), las fechas de inicio y fin y la diferencia en días 
+(`racha_dias`)
+
+Para las rachas máximas se obtiene, por municipio y tipo de sequía, la 
+racha de mayor duración (la primera en aparecer en caso de empate).
+
+> [!NOTE]
+> 
+> El resultado es idéntico al de la versión original por municipio 
+> sobre el registro diario (`func_count_sequia_mun` y 
+> `func_get_max_rachas`), que se conserva en el mismo archivo. La comparación de tiempos se encuentra en 
+> **`benchmark_rachas.py`**
+>
+> Para registros más grandes (por ejemplo el registro diario), las rachas 
+> y rachas máximas se pueden calcular en paralelo por entidad con 
+> `func_rachas_sequia_paralelo` (**`rachas_paralelo.py`**), con el mismo 
+> resultado
 """
 
-# %% 
-#| label: create-func_get_max_rachas
-def func_get_max_rachas(datframe):
-    idx_max = (datframe
-               # Agrupar por tipo de sequia
-               .groupby("sequia")
-               # De la columna de racha_dias
-               ["racha_dias"]
-               # ... obtener el índice del valor máximo
-               .idxmax()
-               # Se obtienen los valores de los índices
-               .values
-               # Se transformar en lista (de índices)
-               .tolist())
-    # Con la lista de índices se crea un nuevo pandas.DataFrame
-    datframe_max_rachas = datframe.loc[idx_max]
-    return datframe_max_rachas
+# %%
+#| label: load-func_rachas_sequia-func_max_rachas_sequia
+from rachas_sequia import func_rachas_sequia_intervalos, func_max_rachas_sequia
 
 # %% [markdown]
 """
@@ -343,25 +287,9 @@ sequía junto con las rachas máximas de sequía
 # %%
 #| label: create-db_rachas_mun-db_rachas_max_mun
 
-lista_cve_concatenada = msm_long_filled['cve_concatenada'].unique().tolist()
-lista_dfs_rachas = list()
-lista_dfs_rachas_max = list()
-
-for i in range(len(lista_cve_concatenada)):
-    # Obtener rachas
-    df_rachas = func_count_sequia_mun(
-       datframe = msm_long_filled,
-       clave_mun = lista_cve_concatenada[i])
-    # Aislar rachas máximas
-    df_rachas_max = func_get_max_rachas(datframe = df_rachas)
-
-    # Guardar todos los `pandas.DataFrame`s en listas
-    lista_dfs_rachas.append(df_rachas)
-    lista_dfs_rachas_max.append(df_rachas_max)
-
-# Concatenar la lista de pandas.DataFrame
-db_rachas_mun = pd.concat(lista_dfs_rachas).reset_index(drop=True)
-db_rachas_max_mun = pd.concat(lista_dfs_rachas_max).reset_index(drop=True)
+db_rachas_mun = func_rachas_sequia_intervalos(
+   datframe_intervalos = msm_intervalos)
+db_rachas_max_mun = func_max_rachas_sequia(datframe_rachas = db_rachas_mun)
 
 # %% [markdown]
 """
@@ -395,7 +323,7 @@ Markdown(
 """
 ## Reasignar nombre de Estados, Municipios y Cuencas
 
-A partir de la creación de `msm_long_filled`, todos los conjuntos de datos 
+A partir de la creación de `msm_intervalos`, todos los conjuntos de datos 
 excluyen las claves y nombres de los Estados, Municipios (este únicamente 
 el nombre) y Cuencas. 
 
@@ -407,6 +335,7 @@ guardadas.
 #| label: load-paths
 
 import os
+import sys
 
 # Cambiar al folder principal del repositorio
 os.chdir("../../")
@@ -416,6 +345,10 @@ path2main = os.getcwd()
 path2gobmex = path2main + "/GobiernoMexicano"
 path2msm = path2gobmex + "/msm"
 
+# Los módulos de `msm` (`parquet_sequia`, `indice_sequia`, ...) se importan
+# después del cambio de carpeta, por lo que se agrega su ruta absoluta
+sys.path.insert(0, path2msm)
+
 # %% [markdown]
 """
 Claves y nombres de municipios y entidades
@@ -477,18 +410,6 @@ msm_long = (pd.merge(
     'org_cuenca', 'clv_oc', 'con_cuenca', 'cve_conc',
     'full_date', 'sequia']])
 
-msm_long_filled = (pd.merge(
-    left = msm_long_filled,
-    right = cve_nom_ent_mun_cuenca,
-    how = 'left',
-    left_on = 'cve_concatenada',
-    right_on = 'cve_geo')
-  .drop(columns = ['cve_concatenada'])
-  # Reordenamiento de las columnas
-  [['nombre_estado', 'cve_ent', 'nombre_municipio', 'cve_geo',
-    'org_cuenca', 'clv_oc', 'con_cuenca', 'cve_conc',
-    'full_date', 'sequia']])
-
 db_rachas_mun = (pd.merge(
     left = db_rachas_mun,                      
     right = cve_nom_ent_mun_cuenca,
@@ -527,38 +448,22 @@ db_rachas_max_mun = (pd.merge(
 Se crearán dos bases de datos a partir de este procesamiento de datos: 
 
 * **`msm_long`** : Datos de sequía de la CONAGUA en _long format_
-* **`msm_long_filled`** : Datos de sequía diarios en _long format_ (Modificado)
+* **`msm_intervalos`** : Datos de sequía diarios en _long format_ 
+(Modificado), creados a partir de los intervalos
 
 Para ambos casos se eliminarán las los registros de Agosto 2003 y 
 Febrero 2004. En el documento XLSX, en el apartado de Notas, se comunica que por 
 factores externos, el MSM no se elaboró en esas fechas.
 
-Por lo que se crean _máscaras_ para filtrar esas fechas
+Por lo que se crean _máscaras_ (`func_mask_fechas_sin_msm`) para filtrar 
+esas fechas
 """
 # %%
 #| label: remove-agosto_2003-febrero_2004
 
-# 1. Se crean las máscaras para los filtros
-#   1.1 Para los datos de sequía de la CONAGUA en long format
-mask_dates_nowork_msm_long = (
-    # Agosto 2003
-    ((msm_long['full_date'].dt.year == 2003) & 
-     (msm_long['full_date'].dt.month == 8))
-    |
-    # Febrero 2004
-    ((msm_long['full_date'].dt.year == 2004) & 
-     (msm_long['full_date'].dt.month == 2))
-)
-#   1.2 Para los datos de sequía diarios en long format (Modificado)
-mask_dates_nowork_msm_long_filled = (
-    # Agosto 2003
-    ((msm_long_filled['full_date'].dt.year == 2003) & 
-     (msm_long_filled['full_date'].dt.month == 8))
-    |
-    # Febrero 2004
-    ((msm_long_filled['full_date'].dt.year == 2004) & 
-     (msm_long_filled['full_date'].dt.month == 2))
-)
+# Máscara para los datos de sequía de la CONAGUA en long format
+mask_dates_nowork_msm_long = func_mask_fechas_sin_msm(
+    serie_fechas = msm_long['full_date'])
 
 # %% [markdown]
 """
@@ -571,14 +476,11 @@ Para negar las máscaras, se usa **`~`**
 """
 
 # %%
-#| label: create-db_msm_og-db_msm_mod
+#| label: create-db_msm_og
 
 # Datos de sequía de la CONAGUA en long format
 db_msm_og = msm_long[~mask_dates_nowork_msm_long]
 
-# Datos de sequía diarios en long format (Modificado)
-db_msm_mod = msm_long_filled[~mask_dates_nowork_msm_long_filled]
-
 # %% [markdown]
 """
 Como último paso se guardan ambas bases de datos
@@ -589,14 +491,34 @@ Como último paso se guardan ambas bases de datos
 Muestra del archivo **`sequia_municipios.csv.bz2`**
 """
 
+# %% [markdown]
+"""
+Además de los archivos `.csv.bz2`, con `guardar_parquet = True` ambas 
+bases de datos se guardan como _datasets_ Parquet (compresión zstd, 
+particionados por entidad, ordenados por `cve_geo` y `full_date`, con 
+fechas y categorías). Escribir y leer estos archivos es mucho más rápido 
+que con bz2 (ver **`parquet_sequia.py`** y **`benchmark_parquet.py`**)
+"""
+
 # %%
 #| label: save-db_msm_og
+from parquet_sequia import (func_iniciar_parquet_sequia,
+                            func_guardar_parquet_sequia,
+                            func_escribir_parte,
+                            func_tabla_sequia)
+
+guardar_parquet = True
 
 db_msm_og.to_csv(
    path_or_buf = path2msm + "/sequia_municipios.csv.bz2",
    compression = "bz2",
    index = False)
 
+if guardar_parquet:
+    func_guardar_parquet_sequia(
+       datframes = db_msm_og,
+       path_dataset = path2msm + "/sequia_municipios.parquet")
+
 # %%
 #| label: show-db_msm_og-sample
 #| echo: false
@@ -608,16 +530,62 @@ Markdown(
 
 # %% [markdown]
 """
-Muestra del archivo **`sequia_municipios_days.csv.bz2`**
+El registro diario (**`sequia_municipios_days.csv.bz2`**) es opcional, se 
+crea a partir de los intervalos por partes: a cada parte se le agregan los 
+nombres y claves, se le aplica la máscara de fechas y se escribe en el 
+archivo. En ningún momento se tiene el registro diario completo en memoria.
+
+Para omitir este archivo, cambiar `guardar_registro_diario` a `False`
 """
 
 # %%
 #| label: save-db_msm_mod
+import bz2
+
+guardar_registro_diario = True
+
+if guardar_registro_diario and guardar_parquet:
+    func_iniciar_parquet_sequia(
+       path_dataset = path2msm + "/sequia_municipios_days.parquet")
+
+if guardar_registro_diario:
+    with bz2.open(path2msm + "/sequia_municipios_days.csv.bz2",
+                  mode = "wt",
+                  encoding = "utf-8",
+                  newline = "") as archivo_days:
+        for i, db_msm_mod in enumerate(
+                func_iter_dias_sequia(datframe_intervalos = msm_intervalos)):
+            db_msm_mod = (pd.merge(
+                left = db_msm_mod,
+                right = cve_nom_ent_mun_cuenca,
+                how = 'left',
+                left_on = 'cve_concatenada',
+                right_on = 'cve_geo')
+              .drop(columns = ['cve_concatenada'])
+              # Reordenamiento de las columnas
+              [['nombre_estado', 'cve_ent', 'nombre_municipio', 'cve_geo',
+                'org_cuenca', 'clv_oc', 'con_cuenca', 'cve_conc',
+                'full_date', 'sequia']])
+
+            # Datos de sequía diarios en long format (Modificado)
+            db_msm_mod = db_msm_mod[
+                ~func_mask_fechas_sin_msm(serie_fechas = db_msm_mod['full_date'])]
+
+            db_msm_mod.to_csv(
+                path_or_buf = archivo_days,
+                header = i == 0,
+                index = False)
+
+            if guardar_parquet:
+                func_escribir_parte(
+                   tabla = func_tabla_sequia(datframe = db_msm_mod),
+                   path_dataset = path2msm + "/sequia_municipios_days.parquet",
+                   nombre_parte = f"parte-{i:05d}")
 
-db_msm_mod.to_csv(
-   path_or_buf = path2msm + "/sequia_municipios_days.csv.bz2",
-   compression = "bz2",
-   index = False)
+# %% [markdown]
+"""
+Muestra del archivo **`sequia_municipios_days.csv.bz2`** (última parte)
+"""
 
 # %%
 #| label: show-db_msm_mod-sample
@@ -656,6 +624,28 @@ Markdown(
    .sample(n = 5, random_state= 13)
    .to_markdown(index = False))
 
+# %% [markdown]
+"""
+#### Índice de consulta de sequía por fecha
+
+A partir de las rachas se crea un índice (carpeta **`indice_sequia`**) 
+para responder, sin leer el registro diario, preguntas como:
+
+* ¿Cuál era la categoría de sequía del municipio X en la fecha D?
+* ¿Qué municipios estaban en D3 o peor en la fecha D?
+
+Las funciones se encuentran en el archivo **`indice_sequia.py`**
+"""
+
+# %%
+#| label: save-indice_sequia
+from indice_sequia import (func_construir_indice_sequia,
+                           func_guardar_indice_sequia)
+
+func_guardar_indice_sequia(
+   indice = func_construir_indice_sequia(datframe_rachas = db_rachas_mun),
+   path_indice = path2msm + "/indice_sequia")
+
 # %% [markdown]
 """
 ### Base de datos de Máximas Rachas de Sequía en Municipios
@@ -683,6 +673,69 @@ Markdown(
    .sample(n = 5, random_state= 13)
    .to_markdown(index = False))
 
+# %% [markdown]
+"""
+### Cubo de sequía por entidad, organismo de cuenca y nacional
+
+Para no volver a agregar el registro diario cada vez que se necesita un 
+resumen, se guarda el número y la proporción de municipios en cada 
+categoría de sequía por fecha, a nivel nacional, por entidad y por 
+organismo de cuenca (**`cubo_sequia.parquet`**). 
+
+El cubo se calcula en una sola pasada sobre los intervalos (ver 
+**`cubo_sequia.py`**). Al igual que en el registro diario, se omiten 
+Agosto 2003 y Febrero 2004
+"""
+
+# %%
+#| label: save-db_cubo_sequia
+from cubo_sequia import func_cubo_sequia
+
+db_cubo_sequia = func_cubo_sequia(
+   datframe_intervalos = msm_intervalos,
+   cve_nom_ent_mun_cuenca = cve_nom_ent_mun_cuenca)
+
+db_cubo_sequia = db_cubo_sequia[
+   ~func_mask_fechas_sin_msm(serie_fechas = db_cubo_sequia['full_date'])]
+
+db_cubo_sequia.to_parquet(
+   path = path2msm + "/cubo_sequia.parquet",
+   compression = "zstd",
+   index = False)
+
+# %%
+#| label: show-db_cubo_sequia
+#| echo: false
+
+Markdown(
+   db_cubo_sequia
+   .query("nivel == 'org_cuenca'")
+   .sample(n = 5, random_state = 13)
+   .to_markdown(index = False))
+
+# %% [markdown]
+"""
+### Estado para la actualización incremental
+
+Como último paso se guarda el estado de esta ejecución 
+(**`estado_msm.json`**): la fecha de la última publicación y la última 
+racha (abierta) de cada municipio.
+
+Con este estado, las siguientes actualizaciones se pueden hacer con 
+**`actualizacion_msm.py`**, que únicamente procesa las fechas publicadas 
+después de la última actualización y extiende o cierra las rachas 
+abiertas, en lugar de volver a ejecutar este documento completo.
+"""
+
+# %%
+#| label: save-estado_msm
+from actualizacion_msm import func_guardar_estado_msm
+
+func_guardar_estado_msm(
+   db_rachas = db_rachas_mun,
+   fecha_ultima = msm_long['full_date'].max(),
+   path_estado = path2msm + "/estado_msm.json")
+
 # %% [markdown]
 """
 > [!NOTE]
@@ -0,0 +1,397 @@
+"""
+Author: Isaac Arroyo
+Notes: Actualización incremental de las bases de datos del Monitor de
+       Sequía de México (MSM). En lugar de volver a procesar todas las
+       fechas desde 2003 (**`README.py`**), únicamente se procesan las
+       fechas publicadas después de la última actualización.
+
+El estado de la última actualización se guarda en **`estado_msm.json`**:
+
+* `fecha_ultima`: Fecha de la última publicación procesada
+* `rachas_abiertas`: La última racha (aún abierta) de cada municipio
+* `tamanos_bz2`: Tamaño (bytes) de `sequia_municipios.csv.bz2` y
+  `sequia_municipios_days.csv.bz2` después de la última actualización
+
+Con las nuevas publicaciones se extienden o se cierran las rachas
+abiertas y únicamente se actualizan las partes afectadas:
+
+* Los registros nuevos se agregan (como un _stream_ bz2 más) a
+  `sequia_municipios.csv.bz2` y `sequia_municipios_days.csv.bz2`, y como
+  partes nuevas a los _datasets_ Parquet
+* En el índice de consulta (**`indice_sequia.py`**) se reemplaza la racha
+  abierta de cada municipio y se agregan los días nuevos. Las bases de
+  datos de rachas y rachas máximas se obtienen del índice, sin leer
+  `rachas_sequia_municipios.csv`
+* Al cubo de sequía únicamente se agregan las fechas nuevas
+
+Todos los archivos se escriben primero como temporales y después
+reemplazan a los anteriores (`os.replace`); el estado se guarda al final.
+Si la actualización se interrumpe, la siguiente ejecución repite las
+mismas fechas: los archivos bz2 se copian únicamente hasta `tamanos_bz2`,
+las rachas del índice y las fechas del cubo se reemplazan y las partes
+Parquet tienen el nombre de la fecha, por lo que no se duplican registros.
+
+El estado se crea al final de **`README.py`** (proceso completo). Si
+aparecen municipios que no están en el estado, se tiene que correr el
+proceso completo.
+
+Uso:
+    python actualizacion_msm.py
+"""
+
+# = = = Imports = = = #
+import bz2
+import json
+import os
+import sys
+
+import pandas as pd
+from janitor import clean_names
+
+from categorias_sequia import tipo_sequia, func_sequia2categoria
+from intervalos_sequia import (func_intervalos_sequia,
+                               func_iter_dias_sequia,
+                               func_mask_fechas_sin_msm)
+from rachas_sequia import func_rachas_sequia_intervalos, func_max_rachas_sequia
+from indice_sequia import (func_actualizar_indice_sequia,
+                           func_cargar_indice_sequia,
+                           func_construir_indice_sequia,
+                           func_guardar_indice_sequia,
+                           func_rachas_indice_sequia)
+from parquet_sequia import func_agregar_parquet_sequia
+from cubo_sequia import func_cubo_sequia
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from herramientas.descargas import func_descargar
+from herramientas.cache_excel import func_leer_excel
+
+url_msm = "".join(["https://smn.conagua.gob.mx/tools/RESOURCES/Monitor%20de",
+                   "%20Sequia%20en%20Mexico/MunicipiosSequia.xlsx"])
+
+path2msm = os.path.dirname(os.path.abspath(__file__))
+path2gobmex = os.path.dirname(path2msm)
+path_estado_msm = os.path.join(path2msm, "estado_msm.json")
+
+list_archivos_bz2 = ["sequia_municipios.csv.bz2",
+                     "sequia_municipios_days.csv.bz2"]
+
+list_cols_cve_nom = ['nombre_estado', 'cve_ent', 'nombre_municipio',
+                     'cve_geo', 'org_cuenca', 'clv_oc', 'con_cuenca',
+                     'cve_conc']
+
+list_cols_rachas = list_cols_cve_nom + ['sequia',
+                                        'full_date_start_racha',
+                                        'full_date_end_racha',
+                                        'racha_dias']
+
+# = = Columnas de fecha a fecha (retorna: pd.Series) = = #
+def func_col2fecha(serie_cols):
+    return pd.to_datetime(
+        arg = (pd.Series(serie_cols)
+               .str.replace("_00_00_00", "")
+               .str.replace("_", "-")),
+        errors = 'coerce')
+
+# = = Guardar estado (retorna: vacío) = = #
+def func_guardar_estado_msm(db_rachas, fecha_ultima,
+                            path_estado = path_estado_msm,
+                            tamanos_bz2 = None):
+    # La última racha de cada municipio es la racha abierta
+    rachas_abiertas = (db_rachas
+                       .sort_values(by = ['cve_geo', 'full_date_start_racha'],
+                                    kind = 'stable')
+                       .groupby('cve_geo')
+                       .tail(1)
+                       [['cve_geo', 'sequia',
+                         'full_date_start_racha', 'full_date_end_racha']])
+
+    for col in ['full_date_start_racha', 'full_date_end_racha']:
+        rachas_abiertas[col] = (pd.to_datetime(rachas_abiertas[col])
+                                .dt.strftime("%Y-%m-%d"))
+
+    # Sin `tamanos_bz2` (proceso completo) se usan los tamaños actuales
+    if tamanos_bz2 is None:
+        path_carpeta = os.path.dirname(os.path.abspath(path_estado))
+        tamanos_bz2 = {archivo: os.path.getsize(os.path.join(path_carpeta,
+                                                             archivo))
+                       for archivo in list_archivos_bz2
+                       if os.path.exists(os.path.join(path_carpeta, archivo))}
+
+    with open(path_estado + ".tmp", "w") as archivo:
+        json.dump(
+            dict(fecha_ultima = pd.Timestamp(fecha_ultima).strftime("%Y-%m-%d"),
+                 tamanos_bz2 = tamanos_bz2,
+                 rachas_abiertas = rachas_abiertas.to_dict(orient = 'records')),
+            archivo,
+            indent = 1)
+    os.replace(path_estado + ".tmp", path_estado)
+
+    return None
+
+# = = Cargar estado (retorna: tupla) = = #
+def func_cargar_estado_msm(path_estado = path_estado_msm):
+    with open(path_estado) as archivo:
+        estado = json.load(archivo)
+
+    rachas_abiertas = pd.DataFrame(estado['rachas_abiertas'])
+    rachas_abiertas['sequia'] = func_sequia2categoria(rachas_abiertas['sequia'])
+    for col in ['full_date_start_racha', 'full_date_end_racha']:
+        rachas_abiertas[col] = pd.to_datetime(rachas_abiertas[col])
+
+    return (pd.Timestamp(estado['fecha_ultima']),
+            rachas_abiertas,
+            estado.get('tamanos_bz2', dict()))
+
+# = = Copia de un archivo bz2 con registros agregados (retorna: int) = = #
+def func_agregar_bz2(path_bz2, path_temporal, tamano, datframes):
+    # Se copian los primeros `tamano` bytes (lo que había al terminar la
+    # última actualización) y los registros nuevos se agregan como un
+    # stream bz2 más (bz2 permite concatenar archivos)
+    if tamano is None:
+        tamano = os.path.getsize(path_bz2)
+
+    with open(path_bz2, "rb") as origen, open(path_temporal, "wb") as destino:
+        while tamano > 0:
+            bloque = origen.read(min(tamano, 16 * 1024 * 1024))
+            if not bloque:
+                break
+            destino.write(bloque)
+            tamano -= len(bloque)
+
+        with bz2.open(destino, mode = "wt",
+                      encoding = "utf-8", newline = "") as archivo:
+            for datframe in datframes:
+                datframe.to_csv(archivo, header = False, index = False)
+
+    return os.path.getsize(path_temporal)
+
+# = = Publicaciones nuevas en long format (retorna: pd.DataFrame) = = #
+def func_msm_long_nuevo(msm_og, fecha_ultima):
+    # Únicamente las columnas de fecha posteriores a la última actualización
+    cols_id = msm_og.columns.tolist()[:9]
+    cols_fecha = msm_og.columns[9:]
+    cols_nuevas = cols_fecha[
+        (func_col2fecha(cols_fecha) > fecha_ultima).to_numpy()].tolist()
+
+    msm_long_nuevo = pd.melt(
+        frame = msm_og[cols_id + cols_nuevas],
+        id_vars = cols_id,
+        var_name = 'full_date',
+        value_name = 'sequia')
+
+    # Los espacios vacíos o NaN son en realidad registros Sin sequia
+    msm_long_nuevo['sequia'] = func_sequia2categoria(msm_long_nuevo['sequia'])
+    msm_long_nuevo['full_date'] = func_col2fecha(
+        msm_long_nuevo['full_date']).to_numpy()
+
+    return msm_long_nuevo
+
+# = = Intervalos nuevos a partir de las rachas abiertas (retorna: pd.DataFrame) = = #
+def func_intervalos_nuevos(msm_long_nuevo, rachas_abiertas):
+    intervalos_nuevos = func_intervalos_sequia(datframe = msm_long_nuevo)
+
+    # El primer intervalo nuevo de cada municipio inicia un día después del
+    # fin de su racha abierta
+    mask_primero = ~intervalos_nuevos['cve_concatenada'].duplicated()
+    fin_racha_abierta = (intervalos_nuevos.loc[mask_primero, 'cve_concatenada']
+                         .map(rachas_abiertas
+                              .set_index('cve_geo')
+                              ['full_date_end_racha']))
+
+    if fin_racha_abierta.isna().any():
+        raise ValueError(
+            "Hay municipios que no están en el estado de la última "
+            "actualización, se tiene que correr el proceso completo "
+            "(README.py)")
+
+    intervalos_nuevos.loc[mask_primero, 'full_date_start'] = (
+        fin_racha_abierta + pd.Timedelta(days = 1))
+
+    return intervalos_nuevos
+
+# = = Extender o cerrar las rachas abiertas (retorna: pd.DataFrame) = = #
+def func_rachas_nuevas(rachas_abiertas, intervalos_nuevos):
+    # La racha abierta se trata como un intervalo más. Si el primer
+    # intervalo nuevo tiene la misma sequía, la racha se extiende, si no,
+    # se cierra y empieza una nueva. El resultado son las rachas de cada
+    # municipio a partir de su racha abierta
+    intervalos = pd.concat([
+        rachas_abiertas.rename(columns = {
+            'cve_geo': 'cve_concatenada',
+            'full_date_start_racha': 'full_date_start',
+            'full_date_end_racha': 'full_date_end'}),
+        intervalos_nuevos])
+
+    return (func_rachas_sequia_intervalos(datframe_intervalos = intervalos)
+            .rename(columns = {'cve_concatenada': 'cve_geo'})
+            .drop(columns = ['racha']))
+
+# = = Cubo de sequía con las fechas nuevas (retorna: pd.DataFrame) = = #
+def func_actualizar_cubo(path_cubo, rachas_nuevas, cve_nom_ent_mun_cuenca,
+                         fechas_nuevas):
+    db_cubo_nuevo = func_cubo_sequia(
+        datframe_intervalos = rachas_nuevas,
+        cve_nom_ent_mun_cuenca = cve_nom_ent_mun_cuenca,
+        col_cve = 'cve_geo',
+        col_inicio = 'full_date_start_racha',
+        col_fin = 'full_date_end_racha',
+        fechas = fechas_nuevas)
+    db_cubo_nuevo = db_cubo_nuevo[
+        ~func_mask_fechas_sin_msm(db_cubo_nuevo['full_date'])]
+
+    if not os.path.exists(path_cubo):
+        return db_cubo_nuevo
+
+    # Las fechas anteriores no cambian; si las fechas nuevas ya están (una
+    # actualización que no terminó) se reemplazan
+    db_cubo = pd.read_parquet(path_cubo)
+    db_cubo = db_cubo[~db_cubo['full_date'].isin(db_cubo_nuevo['full_date'])]
+    return pd.concat([db_cubo, db_cubo_nuevo], ignore_index = True)
+
+# = = Actualización incremental (retorna: vacío) = = #
+def func_actualizar_msm(msm_og = None, path_estado = path_estado_msm):
+    fecha_ultima, rachas_abiertas, tamanos_bz2 = func_cargar_estado_msm(
+        path_estado)
+
+    if msm_og is None:
+        msm_og = func_leer_excel(path_excel = func_descargar(url_msm),
+                                 dtype = 'object')
+        msm_og = msm_og.clean_names(remove_special = True)
+
+    msm_long_nuevo = func_msm_long_nuevo(msm_og, fecha_ultima)
+    if msm_long_nuevo.empty:
+        print(f"Sin publicaciones nuevas después de {fecha_ultima:%Y-%m-%d}")
+        return None
+    fecha_nueva = msm_long_nuevo['full_date'].max()
+
+    # Archivos temporales: {path final: path temporal}
+    dict_temporales = dict()
+    func_temporal = lambda path: dict_temporales.setdefault(path, path + ".tmp")
+
+    # - - Nombres y claves de municipios, entidades y cuencas - - #
+    cve_nom_mun = pd.read_csv(
+        filepath_or_buffer = os.path.join(path2gobmex, "cve_nom_municipios.csv"),
+        dtype = "object")
+    list_cols_cuenca = ['cve_concatenada', 'org_cuenca', 'clv_oc',
+                        'con_cuenca', 'cve_conc']
+    cve_nom_mun_cuenca = (msm_og[list_cols_cuenca + ['cve_mun']]
+                          .groupby(list_cols_cuenca)
+                          .nunique()
+                          .reset_index()
+                          [list_cols_cuenca])
+    cve_nom_ent_mun_cuenca = (pd.merge(
+        left = cve_nom_mun_cuenca,
+        right = cve_nom_mun,
+        how = 'left',
+        left_on = 'cve_concatenada',
+        right_on = 'cve_geo')
+      .drop(columns = ['cve_concatenada']))
+
+    func_unir_cve_nom = lambda df: (pd.merge(
+        left = df,
+        right = cve_nom_ent_mun_cuenca,
+        how = 'left',
+        left_on = 'cve_concatenada',
+        right_on = 'cve_geo')
+      [list_cols_cve_nom + ['full_date', 'sequia']])
+
+    # - - Registro de publicaciones - - #
+    db_msm_og_nuevo = func_unir_cve_nom(
+        msm_long_nuevo[['cve_concatenada', 'full_date', 'sequia']])
+    db_msm_og_nuevo = db_msm_og_nuevo[
+        ~func_mask_fechas_sin_msm(db_msm_og_nuevo['full_date'])]
+
+    path_og = os.path.join(path2msm, "sequia_municipios.csv.bz2")
+    tamanos_bz2[os.path.basename(path_og)] = func_agregar_bz2(
+        path_og, func_temporal(path_og),
+        tamanos_bz2.get(os.path.basename(path_og)), [db_msm_og_nuevo])
+
+    # - - Registro diario - - #
+    intervalos_nuevos = func_intervalos_nuevos(msm_long_nuevo, rachas_abiertas)
+
+    list_days_nuevos = list()
+    for db_msm_mod in func_iter_dias_sequia(intervalos_nuevos):
+        db_msm_mod = func_unir_cve_nom(db_msm_mod)
+        list_days_nuevos.append(db_msm_mod[
+            ~func_mask_fechas_sin_msm(db_msm_mod['full_date'])])
+
+    path_days = os.path.join(path2msm, "sequia_municipios_days.csv.bz2")
+    if os.path.exists(path_days):
+        tamanos_bz2[os.path.basename(path_days)] = func_agregar_bz2(
+            path_days, func_temporal(path_days),
+            tamanos_bz2.get(os.path.basename(path_days)), list_days_nuevos)
+
+    # - - Índice, rachas y rachas máximas - - #
+    rachas_nuevas = func_rachas_nuevas(rachas_abiertas, intervalos_nuevos)
+
+    # El índice tiene todas las rachas; si no existe se crea una sola vez a
+    # partir de `rachas_sequia_municipios.csv`
+    path_indice = os.path.join(path2msm, "indice_sequia")
+    if os.path.exists(path_indice):
+        indice = func_cargar_indice_sequia(path_indice)
+    else:
+        indice = func_construir_indice_sequia(datframe_rachas = pd.read_csv(
+            filepath_or_buffer = os.path.join(path2msm,
+                                              "rachas_sequia_municipios.csv"),
+            dtype = {**{col: "object" for col in list_cols_cve_nom},
+                     'sequia': tipo_sequia},
+            parse_dates = ['full_date_start_racha', 'full_date_end_racha']))
+    indice = func_actualizar_indice_sequia(indice, rachas_nuevas)
+
+    db_rachas_mun = pd.merge(
+        left = func_rachas_indice_sequia(indice),
+        right = cve_nom_ent_mun_cuenca,
+        how = 'left',
+        on = 'cve_geo')[list_cols_rachas]
+
+    db_rachas_max_mun = (func_max_rachas_sequia(
+                             datframe_rachas = db_rachas_mun.rename(
+                                 columns = {'cve_geo': 'cve_concatenada'}))
+                         .rename(columns = {'cve_concatenada': 'cve_geo'})
+                         [list_cols_rachas])
+
+    path_rachas = os.path.join(path2msm, "rachas_sequia_municipios.csv")
+    path_rachas_max = os.path.join(path2msm, "max_rachas_sequia_municipios.csv")
+    db_rachas_mun.to_csv(path_or_buf = func_temporal(path_rachas),
+                         index = False)
+    db_rachas_max_mun.to_csv(path_or_buf = func_temporal(path_rachas_max),
+                             index = False)
+
+    # - - Cubo de sequía (únicamente las fechas nuevas) - - #
+    path_cubo = os.path.join(path2msm, "cubo_sequia.parquet")
+    func_actualizar_cubo(
+        path_cubo, rachas_nuevas, cve_nom_ent_mun_cuenca,
+        fechas_nuevas = pd.date_range(fecha_ultima + pd.Timedelta(days = 1),
+                                      fecha_nueva)).to_parquet(
+        path = func_temporal(path_cubo),
+        compression = "zstd",
+        index = False)
+
+    # - - Reemplazar archivos - - #
+    for path_final, path_temporal in dict_temporales.items():
+        os.replace(path_temporal, path_final)
+    func_guardar_indice_sequia(indice = indice, path_indice = path_indice)
+
+    # Las partes Parquet tienen el nombre de la fecha, por lo que repetir
+    # la actualización las sobrescribe
+    nombre_parte = f"parte-{fecha_nueva:%Y%m%d}"
+    path_parquet = os.path.join(path2msm, "sequia_municipios.parquet")
+    if os.path.exists(path_parquet):
+        func_agregar_parquet_sequia(db_msm_og_nuevo, path_parquet,
+                                    nombre_parte = nombre_parte)
+    path_days_parquet = os.path.join(path2msm,
+                                     "sequia_municipios_days.parquet")
+    if list_days_nuevos and os.path.exists(path_days_parquet):
+        func_agregar_parquet_sequia(pd.concat(list_days_nuevos),
+                                    path_days_parquet,
+                                    nombre_parte = nombre_parte)
+
+    # - - Estado (al final) - - #
+    func_guardar_estado_msm(db_rachas_mun, fecha_nueva, path_estado,
+                            tamanos_bz2 = tamanos_bz2)
+
+    print(f"MSM actualizado: {fecha_ultima:%Y-%m-%d} -> {fecha_nueva:%Y-%m-%d}")
+    return None
+
+if __name__ == "__main__":
+    func_actualizar_msm()
@@ -0,0 +1,115 @@
+"""
+Author: Isaac Arroyo
+Notes: Comparación entre guardar el registro diario de sequía como CSV
+       comprimido con bz2 (`sequia_municipios_days.csv.bz2`) y como
+       _dataset_ Parquet con zstd (**`parquet_sequia.py`**).
+
+Para cada formato se reporta el tiempo de escritura, el tamaño en disco y
+el tiempo de lectura. Se usa un registro diario sintético con las mismas
+columnas que el registro real (nombres y claves de los municipios de
+`cve_nom_municipios.csv`). Antes de reportar se verifica que ambos
+formatos regresen los mismos datos.
+
+Uso:
+    python benchmark_parquet.py [n_municipios] [n_dias]
+"""
+
+# = = = Imports = = = #
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmark_rachas import func_msm_sintetico
+from categorias_sequia import tipo_sequia, func_sequia2categoria
+from parquet_sequia import func_guardar_parquet_sequia, func_leer_parquet_sequia
+
+path2msm = os.path.dirname(os.path.abspath(__file__))
+path2gobmex = os.path.dirname(path2msm)
+
+list_cols_days = ['nombre_estado', 'cve_ent', 'nombre_municipio', 'cve_geo',
+                  'full_date', 'sequia']
+
+# = = Registro diario sintético con nombres (retorna: pd.DataFrame) = = #
+def func_days_sintetico(n_municipios, n_dias):
+    cve_nom_mun = pd.read_csv(
+        filepath_or_buffer = os.path.join(path2gobmex, "cve_nom_municipios.csv"),
+        dtype = "object").head(n_municipios)
+
+    msm_days = func_msm_sintetico(len(cve_nom_mun), n_dias)
+    msm_days['cve_concatenada'] = cve_nom_mun['cve_geo'].to_numpy()[
+        msm_days['cve_concatenada'].astype(int) - 1]
+    msm_days['sequia'] = func_sequia2categoria(msm_days['sequia'])
+
+    return (pd.merge(left = msm_days,
+                     right = cve_nom_mun,
+                     how = 'left',
+                     left_on = 'cve_concatenada',
+                     right_on = 'cve_geo')
+            [list_cols_days])
+
+# = = Tamaño de un archivo o carpeta (retorna: int) = = #
+def func_tamanio(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(raiz, archivo))
+               for raiz, _, archivos in os.walk(path)
+               for archivo in archivos)
+
+# = = Medición de tiempo (retorna: tupla) = = #
+def func_medir(func, *args, **kwargs):
+    tiempo_inicio = time.perf_counter()
+    resultado = func(*args, **kwargs)
+    return resultado, time.perf_counter() - tiempo_inicio
+
+if __name__ == "__main__":
+    n_municipios = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    n_dias = int(sys.argv[2]) if len(sys.argv) > 2 else 8_000
+
+    msm_days = func_days_sintetico(n_municipios, n_dias)
+    print(f"Registro sintético: {msm_days['cve_geo'].nunique()} municipios x "
+          f"{n_dias} días ({len(msm_days):,} filas)")
+
+    with tempfile.TemporaryDirectory() as path_temporal:
+        path_csv = os.path.join(path_temporal, "sequia_municipios_days.csv.bz2")
+        path_parquet = os.path.join(path_temporal,
+                                    "sequia_municipios_days.parquet")
+
+        # - - CSV + bz2 - - #
+        _, t_escritura_csv = func_medir(
+            msm_days.to_csv, path_or_buf = path_csv, compression = "bz2",
+            index = False)
+        db_csv, t_lectura_csv = func_medir(
+            pd.read_csv, filepath_or_buffer = path_csv,
+            dtype = {'cve_ent': "object", 'cve_geo': "object",
+                     'sequia': tipo_sequia},
+            parse_dates = ['full_date'])
+
+        # - - Parquet + zstd - - #
+        _, t_escritura_parquet = func_medir(
+            func_guardar_parquet_sequia, msm_days, path_parquet)
+        db_parquet, t_lectura_parquet = func_medir(
+            func_leer_parquet_sequia, path_parquet)
+
+        # Ambos formatos tienen que regresar los mismos datos
+        pd.testing.assert_frame_equal(
+            db_csv.sort_values(by = ['cve_geo', 'full_date'], kind = 'stable')
+                  .reset_index(drop = True),
+            db_parquet[list_cols_days].astype({'nombre_estado': object,
+                                               'nombre_municipio': object,
+                                               'cve_geo': object}),
+            check_dtype = False)
+
+        tamanio_csv = func_tamanio(path_csv)
+        tamanio_parquet = func_tamanio(path_parquet)
+
+    print(f"{'':16}{'Escritura':>12}{'Tamaño':>14}{'Lectura':>12}")
+    print(f"{'CSV + bz2':16}{t_escritura_csv:10.2f} s"
+          f"{tamanio_csv / 2**20:11.1f} MB{t_lectura_csv:10.2f} s")
+    print(f"{'Parquet + zstd':16}{t_escritura_parquet:10.2f} s"
+          f"{tamanio_parquet / 2**20:11.1f} MB{t_lectura_parquet:10.2f} s")
+    print(f"{'Aceleración':16}{t_escritura_csv / t_escritura_parquet:10.1f} x"
+          f"{tamanio_csv / tamanio_parquet:11.1f} x"
+          f"{t_lectura_csv / t_lectura_parquet:10.1f} x")
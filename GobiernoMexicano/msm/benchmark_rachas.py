@@ -0,0 +1,95 @@
+"""
+Author: Isaac Arroyo
+Notes: Comparación de tiempos entre el cálculo de rachas por municipio
+       (`func_count_sequia_mun` + `func_get_max_rachas` dentro de un ciclo
+       `for`) y el cálculo en una sola pasada (`func_rachas_sequia` +
+       `func_max_rachas_sequia`).
+
+Se usa un registro diario sintético con la misma estructura que
+`msm_long_filled`. Antes de reportar los tiempos se verifica que ambos
+resultados sean idénticos.
+
+Uso:
+    python benchmark_rachas.py [n_municipios] [n_dias]
+"""
+
+# = = = Imports = = = #
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from rachas_sequia import (func_count_sequia_mun,
+                           func_get_max_rachas,
+                           func_rachas_sequia,
+                           func_max_rachas_sequia)
+
+list_categorias = ['Sin sequia', 'D0', 'D1', 'D2', 'D3', 'D4']
+
+# = = Registro diario sintético (retorna: pd.DataFrame) = = #
+def func_msm_sintetico(n_municipios, n_dias, semilla = 11):
+    rng = np.random.default_rng(semilla)
+    fechas = pd.date_range(start = "2003-01-01", periods = n_dias, freq = 'D')
+
+    # Cada 15 días se publica una categoría, como en el MSM quincenal
+    n_publicaciones = -(-n_dias // 15)
+    categorias = rng.integers(0, len(list_categorias),
+                              size = (n_municipios, n_publicaciones))
+    categorias = np.repeat(categorias, 15, axis = 1)[:, :n_dias]
+
+    return pd.DataFrame({
+        'full_date': np.tile(fechas.to_numpy(), n_municipios),
+        'cve_concatenada': np.repeat(
+            [f"{i:05d}" for i in range(1, n_municipios + 1)], n_dias),
+        'sequia': np.array(list_categorias, dtype = object)[
+            categorias.ravel()]})
+
+# = = Versión original (retorna: tupla de pd.DataFrame) = = #
+def func_rachas_por_municipio(datframe):
+    lista_cve_concatenada = datframe['cve_concatenada'].unique().tolist()
+    lista_dfs_rachas = list()
+    lista_dfs_rachas_max = list()
+
+    for clave_mun in lista_cve_concatenada:
+        df_rachas = func_count_sequia_mun(datframe = datframe,
+                                          clave_mun = clave_mun)
+        lista_dfs_rachas.append(df_rachas)
+        lista_dfs_rachas_max.append(func_get_max_rachas(datframe = df_rachas))
+
+    return (pd.concat(lista_dfs_rachas).reset_index(drop = True),
+            pd.concat(lista_dfs_rachas_max).reset_index(drop = True))
+
+# = = Versión en una sola pasada (retorna: tupla de pd.DataFrame) = = #
+def func_rachas_vectorizado(datframe):
+    db_rachas = func_rachas_sequia(datframe)
+    return db_rachas, func_max_rachas_sequia(db_rachas)
+
+# = = Medición de tiempo (retorna: tupla) = = #
+def func_medir(func, datframe):
+    tiempo_inicio = time.perf_counter()
+    resultado = func(datframe)
+    return resultado, time.perf_counter() - tiempo_inicio
+
+if __name__ == "__main__":
+    n_municipios = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    n_dias = int(sys.argv[2]) if len(sys.argv) > 2 else 8_000
+
+    msm_sintetico = func_msm_sintetico(n_municipios, n_dias)
+    print(f"Registro sintético: {n_municipios} municipios x {n_dias} días "
+          f"({len(msm_sintetico):,} filas)")
+
+    (db_rachas_og, db_max_og), t_og = func_medir(
+        func_rachas_por_municipio, msm_sintetico)
+    (db_rachas_vec, db_max_vec), t_vec = func_medir(
+        func_rachas_vectorizado, msm_sintetico)
+
+    # Los resultados tienen que ser idénticos
+    pd.testing.assert_frame_equal(db_rachas_og, db_rachas_vec,
+                                  check_dtype = False)
+    pd.testing.assert_frame_equal(db_max_og, db_max_vec,
+                                  check_dtype = False)
+
+    print(f"Por municipio : {t_og:10.3f} s")
+    print(f"Una pasada    : {t_vec:10.3f} s")
+    print(f"Aceleración   : {t_og / t_vec:10.1f} x")
@@ -0,0 +1,75 @@
+"""
+Author: Isaac Arroyo
+Notes: Comparación de tiempos del cálculo de rachas y rachas máximas en
+       serie (`func_rachas_sequia` + `func_max_rachas_sequia`) y en
+       paralelo (`func_rachas_sequia_paralelo`) con 1 a N procesos.
+
+Se usa un registro diario sintético con municipios de 32 entidades. Para
+cada número de procesos se verifica que el resultado sea idéntico (byte a
+byte, como CSV) al de la versión en serie.
+
+Uso:
+    python benchmark_rachas_paralelo.py [n_municipios] [n_dias] [n_procesos_max]
+"""
+
+# = = = Imports = = = #
+import os
+import sys
+import time
+
+from benchmark_rachas import func_msm_sintetico
+from categorias_sequia import func_sequia2categoria
+from rachas_paralelo import func_rachas_sequia_paralelo
+from rachas_sequia import func_rachas_sequia, func_max_rachas_sequia
+
+n_entidades = 32
+
+# = = Registro diario sintético con entidades (retorna: pd.DataFrame) = = #
+def func_msm_sintetico_entidades(n_municipios, n_dias):
+    msm_sintetico = func_msm_sintetico(n_municipios, n_dias)
+
+    # Los municipios se reparten entre las entidades
+    num_mun = msm_sintetico['cve_concatenada'].astype(int) - 1
+    msm_sintetico['cve_concatenada'] = (
+        (num_mun % n_entidades + 1).map("{:02d}".format) +
+        (num_mun // n_entidades + 1).map("{:03d}".format))
+    msm_sintetico['sequia'] = func_sequia2categoria(msm_sintetico['sequia'])
+
+    return msm_sintetico
+
+# = = Versión en serie (retorna: tupla de pd.DataFrame) = = #
+def func_rachas_serie(datframe):
+    db_rachas = func_rachas_sequia(datframe)
+    return db_rachas, func_max_rachas_sequia(db_rachas)
+
+# = = Medición de tiempo (retorna: tupla) = = #
+def func_medir(func, *args, **kwargs):
+    tiempo_inicio = time.perf_counter()
+    resultado = func(*args, **kwargs)
+    return resultado, time.perf_counter() - tiempo_inicio
+
+if __name__ == "__main__":
+    n_municipios = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000
+    n_dias = int(sys.argv[2]) if len(sys.argv) > 2 else 8_000
+    n_procesos_max = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+
+    msm_sintetico = func_msm_sintetico_entidades(n_municipios, n_dias)
+    print(f"Registro sintético: {n_municipios} municipios x {n_dias} días "
+          f"({len(msm_sintetico):,} filas), {os.cpu_count()} CPUs")
+
+    (db_rachas, db_max), t_serie = func_medir(func_rachas_serie, msm_sintetico)
+    csv_rachas = db_rachas.to_csv(index = False).encode("utf-8")
+    csv_max = db_max.to_csv(index = False).encode("utf-8")
+    print(f"{'Serie':12}{t_serie:10.3f} s")
+
+    for n_procesos in range(1, n_procesos_max + 1):
+        (db_rachas_par, db_max_par), t_paralelo = func_medir(
+            func_rachas_sequia_paralelo, msm_sintetico,
+            n_procesos = n_procesos)
+
+        # El resultado tiene que ser idéntico al de la versión en serie
+        assert db_rachas_par.to_csv(index = False).encode("utf-8") == csv_rachas
+        assert db_max_par.to_csv(index = False).encode("utf-8") == csv_max
+
+        print(f"{f'{n_procesos} procesos':12}{t_paralelo:10.3f} s"
+              f"{t_serie / t_paralelo:8.2f} x")
@@ -0,0 +1,84 @@
+"""
+Author: Isaac Arroyo
+Notes: Codificación de las categorías de sequía del Monitor de Sequía de
+       México (MSM). Es usada por **`README.py`**,
+       **`actualizacion_msm.py`**, **`rachas_sequia.py`**,
+       **`intervalos_sequia.py`** e **`indice_sequia.py`**.
+
+La columna `sequia` se guarda como `pandas.Categorical` ordenado (un
+`int8` por registro en lugar de un texto), con el orden de menor a mayor
+intensidad:
+
+    Sin sequia < D0 < D1 < D2 < D3 < D4
+
+El código de cada categoría (`serie.cat.codes`) es su posición en
+`list_categorias_sequia`, el mismo que se usa en el índice de consulta
+(`indice_sequia.py`). Con el orden, comparaciones como "D2 o peor" son
+comparaciones de enteros (`func_sequia_o_peor`).
+
+Los archivos CSV guardan las etiquetas (`D0`, `D1`, ...). Para leerlos con
+la misma codificación usar `dtype = {'sequia': tipo_sequia}`.
+"""
+
+# = = = Imports = = = #
+import numpy as np
+import pandas as pd
+
+# Orden de las categorías de sequía (de menor a mayor intensidad)
+list_categorias_sequia = ['Sin sequia', 'D0', 'D1', 'D2', 'D3', 'D4']
+
+tipo_sequia = pd.CategoricalDtype(categories = list_categorias_sequia,
+                                  ordered = True)
+
+# Nombres largos de las categorías (en minúsculas) que aparecen en algunas
+# publicaciones y documentos del MSM
+dict_alias_sequia = {
+    'sin sequia': 'Sin sequia',
+    'sin sequía': 'Sin sequia',
+    'anormalmente seco': 'D0',
+    'sequia moderada': 'D1',
+    'sequía moderada': 'D1',
+    'sequia severa': 'D2',
+    'sequía severa': 'D2',
+    'sequia extrema': 'D3',
+    'sequía extrema': 'D3',
+    'sequia excepcional': 'D4',
+    'sequía excepcional': 'D4'}
+
+# = = Texto a categoría de sequía (retorna: pd.Series) = = #
+def func_sequia2categoria(serie_sequia):
+    if isinstance(serie_sequia.dtype, pd.CategoricalDtype) and \
+       serie_sequia.dtype == tipo_sequia:
+        return serie_sequia
+
+    # Los valores vacíos o NaN son registros Sin sequia. Las etiquetas se
+    # convierten una sola vez por valor único
+    serie_sequia = serie_sequia.astype(object).fillna("Sin sequia")
+    valores = pd.unique(serie_sequia)
+    etiquetas = [dict_alias_sequia.get(str(valor).strip().lower(),
+                                       str(valor).strip())
+                 for valor in valores]
+
+    no_validos = [valor for valor, etiqueta in zip(valores, etiquetas)
+                  if etiqueta not in list_categorias_sequia]
+    if no_validos:
+        raise ValueError(f"Categorías de sequía no reconocidas: {no_validos}")
+
+    return serie_sequia.map(dict(zip(valores, etiquetas))).astype(tipo_sequia)
+
+# = = Código (int8) de una categoría (retorna: int) = = #
+def func_codigo_sequia(categoria):
+    return list_categorias_sequia.index(
+        dict_alias_sequia.get(categoria.strip().lower(), categoria.strip()))
+
+# = = Máscara de sequía de cierta categoría o peor (retorna: pd.Series) = = #
+def func_sequia_o_peor(serie_sequia, categoria_min = 'D2'):
+    return func_sequia2categoria(serie_sequia).cat.codes >= \
+        func_codigo_sequia(categoria_min)
+
+# = = Valores para comparar registros consecutivos (retorna: np.ndarray) = = #
+def func_valores_sequia(serie_sequia):
+    # Con categorías se comparan los códigos (enteros) en lugar de textos
+    if isinstance(serie_sequia.dtype, pd.CategoricalDtype):
+        return np.asarray(serie_sequia.cat.codes)
+    return serie_sequia.to_numpy()
@@ -0,0 +1,141 @@
+"""
+Author: Isaac Arroyo
+Notes: Cubo de sequía: número y proporción de municipios en cada categoría
+       de sequía por fecha, a nivel nacional, por entidad y por organismo
+       de cuenca. Es usado por **`README.py`**.
+
+El cubo se calcula en una sola pasada sobre los intervalos de sequía
+(`msm_intervalos`) o las rachas (`rachas_sequia_municipios.csv`), sin
+crear el registro diario:
+
+1. A cada intervalo se le asigna su grupo en cada nivel (nacional, entidad
+   y organismo de cuenca).
+2. En una matriz de diferencias (días x grupo x categoría) se suma 1 en el
+   día de inicio del intervalo y se resta 1 el día siguiente al fin.
+3. La suma acumulada por día es el número de municipios de cada grupo en
+   cada categoría.
+
+Columnas del cubo:
+* `nivel`: `nacional`, `estado` u `org_cuenca`
+* `cve_nivel`, `nombre_nivel`: Clave y nombre del grupo (`cve_ent` y
+  `nombre_estado`, `clv_oc` y `org_cuenca`, o `00` y `Nacional`)
+* `full_date`, `sequia`
+* `n_municipios`: Municipios del grupo en la categoría
+* `n_municipios_total`: Municipios del grupo con registro en la fecha
+* `prop_municipios`: `n_municipios / n_municipios_total`
+"""
+
+# = = = Imports = = = #
+import numpy as np
+import pandas as pd
+
+from categorias_sequia import (list_categorias_sequia,
+                               tipo_sequia,
+                               func_sequia2categoria)
+
+# Niveles de agregación: nombre del nivel, columna de clave y de nombre
+list_niveles_cubo = [('estado', 'cve_ent', 'nombre_estado'),
+                     ('org_cuenca', 'clv_oc', 'org_cuenca')]
+
+cve_nacional = '00'
+nombre_nacional = 'Nacional'
+
+# = = Grupos de cada municipio en cada nivel (retorna: tupla) = = #
+def func_grupos_cubo(cve_nom_ent_mun_cuenca, col_cve = 'cve_geo'):
+    # Grupo 0 es el nacional, después los grupos de cada nivel
+    catalogo = cve_nom_ent_mun_cuenca.drop_duplicates(col_cve).set_index(col_cve)
+    list_grupos = [('nacional', cve_nacional, nombre_nacional)]
+    dict_grupo_mun = dict()
+
+    for nivel, col_cve_nivel, col_nombre_nivel in list_niveles_cubo:
+        grupos = (catalogo[[col_cve_nivel, col_nombre_nivel]]
+                  .dropna(subset = [col_cve_nivel])
+                  .drop_duplicates(col_cve_nivel)
+                  .sort_values(col_cve_nivel))
+        posicion = pd.Series(np.arange(len(grupos)) + len(list_grupos),
+                             index = grupos[col_cve_nivel].to_numpy())
+        dict_grupo_mun[nivel] = catalogo[col_cve_nivel].map(posicion)
+        list_grupos += [(nivel, cve, nombre) for cve, nombre
+                        in grupos.itertuples(index = False)]
+
+    return (pd.DataFrame(list_grupos,
+                         columns = ['nivel', 'cve_nivel', 'nombre_nivel']),
+            dict_grupo_mun)
+
+# = = Cubo de sequía (retorna: pd.DataFrame) = = #
+def func_cubo_sequia(datframe_intervalos,
+                     cve_nom_ent_mun_cuenca,
+                     col_cve = 'cve_concatenada',
+                     col_inicio = 'full_date_start',
+                     col_fin = 'full_date_end',
+                     fechas = None):
+    n_cat = len(list_categorias_sequia)
+    datframe_grupos, dict_grupo_mun = func_grupos_cubo(cve_nom_ent_mun_cuenca)
+
+    array_inicio = (datframe_intervalos[col_inicio].to_numpy()
+                    .astype('datetime64[D]').astype(np.int64))
+    array_fin = (datframe_intervalos[col_fin].to_numpy()
+                 .astype('datetime64[D]').astype(np.int64))
+    array_cat = (func_sequia2categoria(datframe_intervalos['sequia'])
+                 .cat.codes.to_numpy().astype(np.int64))
+    dia_min = int(array_inicio.min())
+    n_dias = int(array_fin.max()) - dia_min + 1
+
+    # - - Grupo de cada intervalo en cada nivel - - #
+    serie_cve = datframe_intervalos[col_cve]
+    list_idx_grupo = [np.zeros(len(serie_cve), dtype = np.int64)]
+    for nivel, _, _ in list_niveles_cubo:
+        list_idx_grupo.append(serie_cve.map(dict_grupo_mun[nivel])
+                              .fillna(-1).to_numpy().astype(np.int64))
+    array_grupo = np.concatenate(list_idx_grupo)
+
+    # Municipios sin grupo (sin clave en el catálogo) no se cuentan en
+    # ese nivel
+    n_niveles = len(list_idx_grupo)
+    mask = array_grupo >= 0
+    columna = (array_grupo * n_cat + np.tile(array_cat, n_niveles))[mask]
+    renglon_inicio = np.tile(array_inicio - dia_min, n_niveles)[mask]
+    renglon_fin = np.tile(array_fin - dia_min + 1, n_niveles)[mask]
+
+    # - - Matriz de diferencias y suma acumulada - - #
+    n_cols = len(datframe_grupos) * n_cat
+    diferencias = np.zeros((n_dias + 1) * n_cols, dtype = np.int32)
+    diferencias += np.bincount(renglon_inicio * n_cols + columna,
+                               minlength = diferencias.size).astype(np.int32)
+    diferencias -= np.bincount(renglon_fin * n_cols + columna,
+                               minlength = diferencias.size).astype(np.int32)
+    conteos = np.cumsum(diferencias.reshape(n_dias + 1, n_cols),
+                        axis = 0)[:-1]
+
+    # - - Fechas de interés - - #
+    array_fechas = np.arange(dia_min, dia_min + n_dias).astype('datetime64[D]')
+    if fechas is not None:
+        array_fechas = (pd.to_datetime(pd.Series(fechas)).to_numpy()
+                        .astype('datetime64[D]'))
+        renglones = array_fechas.astype(np.int64) - dia_min
+        mask_fechas = (renglones >= 0) & (renglones < n_dias)
+        array_fechas = array_fechas[mask_fechas]
+        conteos = conteos[renglones[mask_fechas]]
+
+    conteos = conteos.reshape(len(array_fechas), len(datframe_grupos), n_cat)
+    totales = conteos.sum(axis = 2, keepdims = True)
+
+    # - - Formato long (fecha x grupo x categoría) - - #
+    n_grupos = len(datframe_grupos)
+    idx_grupo = np.tile(np.repeat(np.arange(n_grupos), n_cat),
+                        len(array_fechas))
+
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        proporcion = conteos / totales
+
+    datframe_cubo = datframe_grupos.iloc[idx_grupo].reset_index(drop = True)
+    datframe_cubo['full_date'] = np.repeat(array_fechas, n_grupos * n_cat
+                                           ).astype('datetime64[ns]')
+    datframe_cubo['sequia'] = pd.Categorical.from_codes(
+        np.tile(np.arange(n_cat), len(array_fechas) * n_grupos),
+        dtype = tipo_sequia)
+    datframe_cubo['n_municipios'] = conteos.ravel()
+    datframe_cubo['n_municipios_total'] = np.repeat(totales.ravel(), n_cat)
+    datframe_cubo['prop_municipios'] = proporcion.ravel()
+
+    return datframe_cubo
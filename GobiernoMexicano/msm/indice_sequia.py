@@ -0,0 +1,296 @@
+"""
+Author: Isaac Arroyo
+Notes: Índice para consultar la sequía de los municipios en una fecha sin
+       tener que leer (y descomprimir) el registro diario
+       `sequia_municipios_days.csv.bz2`.
+
+El índice se crea a partir de la base de datos de rachas
+(`rachas_sequia_municipios.csv`) y tiene dos partes:
+
+* **Intervalos por municipio**: Las rachas de cada municipio ordenadas por
+  fecha. La sequía de un municipio en una fecha se obtiene con búsqueda
+  binaria (`func_sequia_mun_fecha`).
+* **Mapas de bits por fecha**: Para cada fecha y cada categoría, un mapa
+  de bits de los municipios que tienen esa categoría _o peor_. Con estos se
+  obtiene la lista de municipios en, por ejemplo, D3 o peor
+  (`func_municipios_en_sequia`) o el registro de todo el país
+  (`func_snapshot_sequia`) en una fecha.
+
+El índice se guarda como una carpeta de archivos `.npy`, que se cargan
+como `numpy.memmap` (`func_cargar_indice_sequia`).
+
+Con publicaciones nuevas, el índice se actualiza sin volver a crearlo
+(`func_actualizar_indice_sequia`): se reemplaza la última racha de cada
+municipio y se agregan los días nuevos a los mapas de bits. Las rachas de
+todos los municipios se obtienen del índice (`func_rachas_indice_sequia`)
+sin leer `rachas_sequia_municipios.csv`.
+"""
+
+# = = = Imports = = = #
+import json
+import os
+import shutil
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from categorias_sequia import (list_categorias_sequia,
+                               tipo_sequia,
+                               func_codigo_sequia,
+                               func_sequia2categoria)
+
+# Los días se guardan como número de días a partir de esta fecha
+fecha_epoch = date(1970, 1, 1)
+
+list_arrays_indice = ['claves', 'offsets', 'inicio', 'fin', 'categoria',
+                      'bitmaps']
+
+# = = Fecha a número de días (retorna: int) = = #
+def func_fecha2dia(fecha):
+    if isinstance(fecha, str):
+        fecha = date.fromisoformat(fecha[:10])
+    elif isinstance(fecha, datetime):
+        fecha = fecha.date()
+    return (fecha - fecha_epoch).days
+
+# = = Inicio, fin y categoría de las rachas (retorna: tupla) = = #
+def func_arrays_rachas(datframe_rachas):
+    array_inicio = (pd.to_datetime(datframe_rachas['full_date_start_racha'])
+                    .to_numpy()
+                    .astype('datetime64[D]')
+                    .astype(np.int32))
+    array_fin = (pd.to_datetime(datframe_rachas['full_date_end_racha'])
+                 .to_numpy()
+                 .astype('datetime64[D]')
+                 .astype(np.int32))
+    array_categoria = (func_sequia2categoria(datframe_rachas['sequia'])
+                       .cat.codes
+                       .to_numpy()
+                       .astype(np.int8))
+    return array_inicio, array_fin, array_categoria
+
+# = = Mapas de bits de un rango de días (retorna: np.ndarray) = = #
+def func_bitmaps_rachas(array_col, array_inicio, array_fin, array_categoria,
+                        n_claves, dia_inicio, n_dias):
+    # Renglones de `dia_inicio` a `dia_inicio + n_dias - 1`. Las rachas
+    # fuera del rango no se toman en cuenta
+    matriz_categoria = np.full((n_dias, n_claves), -1, dtype = np.int8)
+    for col, inicio, fin, categoria in zip(array_col,
+                                           array_inicio - dia_inicio,
+                                           array_fin - dia_inicio,
+                                           array_categoria):
+        if fin >= 0 and inicio < n_dias:
+            matriz_categoria[max(inicio, 0):fin + 1, col] = categoria
+
+    # - - Mapas de bits (categoría k o peor) - - #
+    return np.stack([
+        np.packbits(matriz_categoria >= k, axis = 1)
+        for k in range(len(list_categorias_sequia))])
+
+# = = Creación del índice (retorna: dict) = = #
+def func_construir_indice_sequia(datframe_rachas, col_cve = 'cve_geo'):
+    datframe_rachas = datframe_rachas.sort_values(
+        by = [col_cve, 'full_date_start_racha'],
+        kind = 'stable')
+
+    # - - Intervalos por municipio - - #
+    array_cve = datframe_rachas[col_cve].to_numpy().astype(str)
+    array_inicio, array_fin, array_categoria = func_arrays_rachas(
+        datframe_rachas)
+
+    # Las rachas de un municipio van de offsets[i] a offsets[i + 1]
+    claves, idx_primera = np.unique(array_cve, return_index = True)
+    offsets = np.append(idx_primera, len(array_cve)).astype(np.int64)
+
+    # - - Categoría de cada municipio en cada día - - #
+    dia_min = int(array_inicio.min())
+    n_dias = int(array_fin.max()) - dia_min + 1
+    array_col = np.repeat(np.arange(len(claves)), np.diff(offsets))
+    bitmaps = func_bitmaps_rachas(array_col, array_inicio, array_fin,
+                                  array_categoria, len(claves),
+                                  dia_min, n_dias)
+
+    return dict(
+        claves = claves,
+        offsets = offsets,
+        inicio = array_inicio,
+        fin = array_fin,
+        categoria = array_categoria,
+        bitmaps = bitmaps,
+        dia_min = dia_min,
+        categorias = list_categorias_sequia,
+        posicion = {clave: i for i, clave in enumerate(claves.tolist())})
+
+# = = Actualizar el índice con rachas nuevas (retorna: dict) = = #
+def func_actualizar_indice_sequia(indice, datframe_rachas_nuevas,
+                                  col_cve = 'cve_geo'):
+    # `datframe_rachas_nuevas`: Rachas de cada municipio a partir de su
+    # última racha (abierta). Las rachas del índice que inician en o
+    # después de la primera racha nueva se reemplazan, por lo que repetir
+    # la misma actualización da el mismo índice. Los días anteriores no
+    # cambian: a los mapas de bits únicamente se agregan los días nuevos
+    claves = np.array(indice['claves'])
+    offsets = np.array(indice['offsets'])
+    n_claves = len(claves)
+
+    datframe_rachas_nuevas = datframe_rachas_nuevas.sort_values(
+        by = [col_cve, 'full_date_start_racha'],
+        kind = 'stable')
+    array_col_nuevo = pd.Index(claves).get_indexer(
+        datframe_rachas_nuevas[col_cve].to_numpy().astype(str))
+    if (array_col_nuevo < 0).any():
+        raise ValueError("Hay municipios que no están en el índice")
+    array_inicio_nuevo, array_fin_nuevo, array_categoria_nuevo = \
+        func_arrays_rachas(datframe_rachas_nuevas)
+
+    # - - Intervalos por municipio - - #
+    array_col = np.repeat(np.arange(n_claves), np.diff(offsets))
+    primer_inicio = np.full(n_claves, np.iinfo(np.int32).max, dtype = np.int64)
+    np.minimum.at(primer_inicio, array_col_nuevo, array_inicio_nuevo)
+    mask = np.asarray(indice['inicio']) < primer_inicio[array_col]
+
+    array_col_todo = np.concatenate([array_col[mask], array_col_nuevo])
+    array_inicio = np.concatenate([np.asarray(indice['inicio'])[mask],
+                                   array_inicio_nuevo])
+    orden = np.lexsort((array_inicio, array_col_todo))
+    array_fin = np.concatenate([np.asarray(indice['fin'])[mask],
+                                array_fin_nuevo])[orden]
+    array_categoria = np.concatenate([np.asarray(indice['categoria'])[mask],
+                                      array_categoria_nuevo])[orden]
+    array_inicio = array_inicio[orden]
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(
+        array_col_todo, minlength = n_claves))]).astype(np.int64)
+
+    # - - Mapas de bits de los días nuevos - - #
+    dia_min = int(indice['dia_min'])
+    n_dias_anterior = indice['bitmaps'].shape[1]
+    n_dias_nuevos = max(int(array_fin.max()) - dia_min + 1 - n_dias_anterior, 0)
+    bitmaps = np.concatenate([
+        np.asarray(indice['bitmaps']),
+        func_bitmaps_rachas(array_col_nuevo, array_inicio_nuevo,
+                            array_fin_nuevo, array_categoria_nuevo,
+                            n_claves, dia_min + n_dias_anterior,
+                            n_dias_nuevos)], axis = 1)
+
+    return dict(
+        claves = claves,
+        offsets = offsets,
+        inicio = array_inicio,
+        fin = array_fin,
+        categoria = array_categoria,
+        bitmaps = bitmaps,
+        dia_min = dia_min,
+        categorias = list_categorias_sequia,
+        posicion = {clave: i for i, clave in enumerate(claves.tolist())})
+
+# = = Rachas del índice (retorna: pd.DataFrame) = = #
+def func_rachas_indice_sequia(indice, col_cve = 'cve_geo'):
+    dia_min = np.datetime64(fecha_epoch, 'D')
+    datframe_rachas = pd.DataFrame({
+        col_cve: np.repeat(np.asarray(indice['claves']),
+                           np.diff(indice['offsets'])),
+        'sequia': pd.Categorical.from_codes(np.asarray(indice['categoria']),
+                                            dtype = tipo_sequia),
+        'full_date_start_racha': (dia_min + np.asarray(indice['inicio'])
+                                  ).astype('datetime64[ns]'),
+        'full_date_end_racha': (dia_min + np.asarray(indice['fin'])
+                                ).astype('datetime64[ns]')})
+    datframe_rachas['racha_dias'] = (np.asarray(indice['fin']) -
+                                     np.asarray(indice['inicio'])).astype(int)
+    return datframe_rachas
+
+# = = Guardar índice (retorna: vacío) = = #
+def func_guardar_indice_sequia(indice, path_indice):
+    # Se escribe en una carpeta temporal que después reemplaza a la
+    # anterior, por lo que nunca queda un índice a medias
+    path_temporal = path_indice + ".tmp"
+    if os.path.exists(path_temporal):
+        shutil.rmtree(path_temporal)
+    os.makedirs(path_temporal)
+
+    for nombre in list_arrays_indice:
+        np.save(os.path.join(path_temporal, f"{nombre}.npy"), indice[nombre])
+
+    with open(os.path.join(path_temporal, "meta.json"), "w") as archivo:
+        json.dump(dict(dia_min = indice['dia_min'],
+                       categorias = indice['categorias']),
+                  archivo)
+
+    if os.path.exists(path_indice):
+        os.replace(path_indice, path_temporal + ".anterior")
+    os.replace(path_temporal, path_indice)
+    if os.path.exists(path_temporal + ".anterior"):
+        shutil.rmtree(path_temporal + ".anterior")
+
+    return None
+
+# = = Cargar índice (retorna: dict) = = #
+def func_cargar_indice_sequia(path_indice):
+    with open(os.path.join(path_indice, "meta.json")) as archivo:
+        indice = json.load(archivo)
+
+    for nombre in list_arrays_indice:
+        indice[nombre] = np.load(os.path.join(path_indice, f"{nombre}.npy"),
+                                 mmap_mode = 'r')
+
+    indice['posicion'] = {clave: i for i, clave
+                          in enumerate(indice['claves'].tolist())}
+    return indice
+
+# = = Sequía de un municipio en una fecha (retorna: str o None) = = #
+def func_sequia_mun_fecha(indice, cve_geo, fecha):
+    posicion = indice['posicion'].get(cve_geo)
+    if posicion is None:
+        return None
+
+    dia = func_fecha2dia(fecha)
+    inicio = indice['offsets'][posicion]
+    fin = indice['offsets'][posicion + 1]
+
+    # Búsqueda binaria de la última racha que inicia antes (o en) la fecha
+    j = inicio + np.searchsorted(indice['inicio'][inicio:fin],
+                                 dia,
+                                 side = 'right') - 1
+    if j < inicio or dia > indice['fin'][j]:
+        return None
+    return indice['categorias'][indice['categoria'][j]]
+
+# = = Renglón de los mapas de bits de una fecha (retorna: int o None) = = #
+def func_renglon_fecha(indice, fecha):
+    renglon = func_fecha2dia(fecha) - indice['dia_min']
+    if renglon < 0 or renglon >= indice['bitmaps'].shape[1]:
+        return None
+    return renglon
+
+# = = Municipios con sequía de cierta categoría o peor (retorna: list) = = #
+def func_municipios_en_sequia(indice, fecha, categoria_min = 'D3'):
+    renglon = func_renglon_fecha(indice, fecha)
+    if renglon is None:
+        return []
+
+    k = func_codigo_sequia(categoria_min)
+    mask = np.unpackbits(indice['bitmaps'][k, renglon],
+                         count = len(indice['claves'])).astype(bool)
+    return indice['claves'][mask].tolist()
+
+# = = Sequía de todos los municipios en una fecha (retorna: pd.DataFrame) = = #
+def func_snapshot_sequia(indice, fecha):
+    renglon = func_renglon_fecha(indice, fecha)
+    if renglon is None:
+        return pd.DataFrame({'cve_geo': pd.Series(dtype = str),
+                             'sequia': pd.Series(dtype = tipo_sequia)})
+
+    # La categoría es el número de mapas de bits en los que aparece el
+    # municipio (menos uno, -1 indica que no hay registro)
+    codigos = (np.unpackbits(indice['bitmaps'][:, renglon],
+                             axis = 1,
+                             count = len(indice['claves']))
+               .sum(axis = 0)
+               .astype(np.int8) - 1)
+
+    mask = codigos >= 0
+    return pd.DataFrame({
+        'cve_geo': indice['claves'][mask],
+        'sequia': pd.Categorical.from_codes(codigos[mask],
+                                            dtype = tipo_sequia)})
@@ -0,0 +1,104 @@
+"""
+Author: Isaac Arroyo
+Notes: Funciones para representar el registro de sequía de los municipios
+       como intervalos (municipio, sequía, fecha de inicio, fecha de fin)
+       en lugar de un registro diario. Son usadas en **`README.py`**.
+
+Cada publicación del MSM representa la sequía de los días desde la
+publicación anterior (sin incluirla) hasta la fecha de la publicación. La
+primera publicación de cada municipio cubre desde el Enero 01, 2003. Esto
+es lo mismo que completar los días con `bfill`, pero sin crear las decenas
+de millones de filas del registro diario.
+
+El registro diario se crea únicamente cuando se necesita y por partes
+(`func_iter_dias_sequia`), sin tener todo el registro en memoria.
+"""
+
+# = = = Imports = = = #
+import numpy as np
+import pandas as pd
+
+# La fecha inicia en Enero 01, 2003
+fecha_inicio_msm = "2003-01-01"
+
+# = = Intervalos a partir de las publicaciones (retorna: pd.DataFrame) = = #
+def func_intervalos_sequia(datframe, fecha_inicio = fecha_inicio_msm):
+    # Únicamente las columnas necesarias. Se eliminan las fechas que no se
+    # pudieron transformar y las que son previas al inicio del registro
+    datframe = datframe[['cve_concatenada', 'full_date', 'sequia']]
+    datframe = (datframe[datframe['full_date'] >= pd.Timestamp(fecha_inicio)]
+                .sort_values(by = ['cve_concatenada', 'full_date'],
+                             kind = 'stable')
+                .reset_index(drop = True))
+
+    # El intervalo inicia un día después de la publicación anterior del
+    # mismo municipio. La primera publicación inicia en `fecha_inicio`
+    fecha_anterior = (datframe
+                      .groupby('cve_concatenada', sort = False)
+                      ['full_date']
+                      .shift(1))
+    full_date_start = (fecha_anterior + pd.Timedelta(days = 1)).fillna(
+        pd.Timestamp(fecha_inicio))
+
+    return pd.DataFrame({
+        'cve_concatenada': datframe['cve_concatenada'],
+        'sequia': datframe['sequia'],
+        'full_date_start': full_date_start.astype(
+            datframe['full_date'].dtype),
+        'full_date_end': datframe['full_date']})
+
+# = = Registro diario por partes (retorna: generador de pd.DataFrame) = = #
+def func_iter_dias_sequia(datframe_intervalos,
+                          n_filas_chunk = 2_000_000,
+                          col_inicio = 'full_date_start',
+                          col_fin = 'full_date_end'):
+    # Número de días de cada intervalo
+    array_inicio = (datframe_intervalos[col_inicio]
+                    .to_numpy()
+                    .astype('datetime64[D]'))
+    array_fin = (datframe_intervalos[col_fin]
+                 .to_numpy()
+                 .astype('datetime64[D]'))
+    array_n_dias = (array_fin - array_inicio).astype(np.int64) + 1
+
+    # Se agrupan intervalos completos hasta llegar (aproximadamente) a
+    # `n_filas_chunk` filas por parte
+    array_cumsum = np.cumsum(array_n_dias)
+    array_cortes = np.searchsorted(
+        array_cumsum,
+        np.arange(n_filas_chunk, array_cumsum[-1] if len(array_cumsum) else 0,
+                  n_filas_chunk),
+        side = 'right')
+    array_cortes = np.unique(np.concatenate(
+        [[0], array_cortes, [len(array_n_dias)]]))
+
+    # `.array` conserva la codificación de la sequía (ver
+    # `categorias_sequia.py`)
+    array_cve = datframe_intervalos['cve_concatenada'].to_numpy()
+    array_sequia = datframe_intervalos['sequia'].array
+
+    for i_inicio, i_fin in zip(array_cortes[:-1], array_cortes[1:]):
+        n_dias = array_n_dias[i_inicio:i_fin]
+
+        # Para cada fila, la posición del día dentro de su intervalo
+        idx_intervalo = np.repeat(np.arange(i_inicio, i_fin), n_dias)
+        offset = (np.arange(n_dias.sum()) -
+                  np.repeat(np.cumsum(n_dias) - n_dias, n_dias))
+
+        yield pd.DataFrame({
+            'full_date': (array_inicio[idx_intervalo] +
+                          offset.astype('timedelta64[D]')).astype(
+                              'datetime64[ns]'),
+            'cve_concatenada': array_cve[idx_intervalo],
+            'sequia': array_sequia[idx_intervalo]})
+
+# = = Máscara de fechas sin publicación del MSM (retorna: pd.Series) = = #
+def func_mask_fechas_sin_msm(serie_fechas):
+    # En el documento XLSX, en el apartado de Notas, se comunica que por
+    # factores externos, el MSM no se elaboró en Agosto 2003 y Febrero 2004
+    return (
+        # Agosto 2003
+        ((serie_fechas.dt.year == 2003) & (serie_fechas.dt.month == 8))
+        |
+        # Febrero 2004
+        ((serie_fechas.dt.year == 2004) & (serie_fechas.dt.month == 2)))
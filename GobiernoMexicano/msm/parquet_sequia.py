@@ -0,0 +1,175 @@
+"""
+Author: Isaac Arroyo
+Notes: Formato de salida Parquet (compresión zstd) para las bases de datos
+       de sequía de los municipios (`sequia_municipios` y
+       `sequia_municipios_days`). Es usado por **`README.py`** y
+       **`actualizacion_msm.py`**, además de los archivos `.csv.bz2`.
+
+Cada base de datos se guarda como una carpeta (_dataset_) particionada por
+entidad (`cve_ent=01/`, `cve_ent=02/`, ...):
+
+* Las filas de cada parte están ordenadas por `cve_geo` y `full_date`.
+  Las actualizaciones (`func_agregar_parquet_sequia`) agregan una parte
+  por entidad; `func_compactar_parquet_sequia` las junta en una sola parte
+  ordenada.
+* Las fechas se guardan como fechas (`date32`), no como texto.
+* La sequía se guarda con la codificación de `tipo_sequia` (ver
+  **`categorias_sequia.py`**) y los nombres y claves como categorías
+  (diccionarios), por lo que cada valor se guarda una sola vez por parte.
+
+A diferencia de bz2 (un solo hilo), zstd comprime y descomprime en varios
+hilos y es mucho más rápido, y al leer no hace falta interpretar texto. La
+comparación de tiempos y tamaños se encuentra en
+**`benchmark_parquet.py`**.
+
+Lectura de un _dataset_ (por ejemplo únicamente una entidad):
+    func_leer_parquet_sequia(path_dataset, filtros = [('cve_ent', '=', '01')])
+
+Compactación (aparte de la actualización, por ejemplo una vez al mes):
+    func_compactar_parquet_sequia(path_dataset)
+"""
+
+# = = = Imports = = = #
+import os
+import shutil
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from categorias_sequia import tipo_sequia, func_sequia2categoria
+
+col_particion = 'cve_ent'
+
+list_cols_orden = ['cve_geo', 'full_date']
+
+# Columnas con pocos valores distintos que se guardan como categorías
+list_cols_categoricas = ['nombre_estado', 'nombre_municipio', 'cve_geo',
+                         'org_cuenca', 'clv_oc', 'con_cuenca', 'cve_conc']
+
+list_cols_fechas = ['full_date', 'full_date_start_racha',
+                    'full_date_end_racha']
+
+# = = pd.DataFrame a tabla de Arrow (retorna: pa.Table) = = #
+def func_tabla_sequia(datframe):
+    datframe = datframe.sort_values(
+        by = [col for col in list_cols_orden if col in datframe.columns],
+        kind = 'stable')
+
+    datframe = datframe.assign(
+        **{col: datframe[col].astype('category')
+           for col in list_cols_categoricas if col in datframe.columns},
+        **{col: pd.to_datetime(datframe[col])
+           for col in list_cols_fechas if col in datframe.columns})
+    if 'sequia' in datframe.columns:
+        datframe['sequia'] = func_sequia2categoria(datframe['sequia'])
+
+    tabla = pa.Table.from_pandas(datframe, preserve_index = False)
+
+    for col in list_cols_fechas:
+        if col in tabla.column_names:
+            tabla = tabla.set_column(
+                tabla.schema.get_field_index(col),
+                col,
+                tabla[col].cast(pa.timestamp('ms')).cast(pa.date32()))
+
+    return tabla
+
+# = = Escribir una parte del dataset (retorna: vacío) = = #
+def func_escribir_parte(tabla, path_dataset, nombre_parte):
+    pq.write_to_dataset(
+        tabla,
+        root_path = path_dataset,
+        partition_cols = [col_particion],
+        basename_template = nombre_parte + "-{i}.parquet",
+        existing_data_behavior = 'overwrite_or_ignore',
+        compression = 'zstd')
+    return None
+
+# = = Eliminar el dataset anterior (retorna: vacío) = = #
+def func_iniciar_parquet_sequia(path_dataset):
+    if os.path.exists(path_dataset):
+        shutil.rmtree(path_dataset)
+    return None
+
+# = = Guardar dataset (retorna: vacío) = = #
+def func_guardar_parquet_sequia(datframes, path_dataset):
+    # `datframes` puede ser un pd.DataFrame o un iterable de partes (como
+    # las de `func_iter_dias_sequia`). Cada parte se ordena y se escribe
+    # como un archivo por entidad, por lo que las partes tienen que estar
+    # en orden de `cve_geo`
+    if isinstance(datframes, pd.DataFrame):
+        datframes = [datframes]
+
+    func_iniciar_parquet_sequia(path_dataset)
+    for i, datframe in enumerate(datframes):
+        func_escribir_parte(func_tabla_sequia(datframe),
+                            path_dataset,
+                            nombre_parte = f"parte-{i:05d}")
+
+    return None
+
+# = = Agregar registros nuevos al dataset (retorna: vacío) = = #
+def func_agregar_parquet_sequia(datframe_nuevo, path_dataset,
+                                nombre_parte = None):
+    # Los registros nuevos se escriben como una parte más de cada entidad
+    # (`parte-{timestamp}-0.parquet`), sin volver a leer ni escribir los
+    # registros anteriores. Con el mismo `nombre_parte` la parte se
+    # sobrescribe, por lo que repetir una actualización no duplica registros
+    if nombre_parte is None:
+        nombre_parte = f"parte-{datetime.now():%Y%m%d%H%M%S%f}"
+
+    func_escribir_parte(func_tabla_sequia(datframe_nuevo),
+                        path_dataset,
+                        nombre_parte = nombre_parte)
+    return None
+
+# = = Compactar las partes de cada entidad (retorna: vacío) = = #
+def func_compactar_parquet_sequia(path_dataset, list_valores = None):
+    # Cada entidad con más de una parte se escribe como una sola parte
+    # ordenada por `cve_geo` y `full_date`. La parte nueva se escribe en una
+    # carpeta temporal que después reemplaza a la de la entidad
+    for particion in sorted(os.listdir(path_dataset)):
+        valor = particion.split("=", 1)[-1]
+        path_particion = os.path.join(path_dataset, particion)
+        if (not particion.startswith(f"{col_particion}=") or
+                (list_valores is not None and valor not in list_valores) or
+                len(os.listdir(path_particion)) <= 1):
+            continue
+
+        tabla = func_tabla_sequia(
+            func_leer_parquet_sequia(path_particion).assign(
+                **{col_particion: valor}))
+
+        path_temporal = path_dataset + ".compactar"
+        func_iniciar_parquet_sequia(path_temporal)
+        func_escribir_parte(tabla, path_temporal, nombre_parte = "parte-00000")
+
+        os.replace(path_particion,
+                   os.path.join(path_temporal, particion + ".anterior"))
+        os.replace(os.path.join(path_temporal, particion), path_particion)
+        shutil.rmtree(path_temporal)
+
+    return None
+
+# = = Leer dataset (retorna: pd.DataFrame) = = #
+def func_leer_parquet_sequia(path_dataset, filtros = None, columnas = None):
+    # La clave de la entidad se lee como texto ('01' y no 1)
+    particion = ds.partitioning(pa.schema([(col_particion, pa.string())]),
+                                flavor = 'hive')
+    tabla = ds.dataset(path_dataset,
+                       format = 'parquet',
+                       partitioning = particion).to_table(
+        columns = columnas,
+        filter = (pq.filters_to_expression(filtros)
+                  if filtros is not None else None))
+
+    # Fechas como `datetime64` (y no como objetos `datetime.date`)
+    datframe = tabla.to_pandas(date_as_object = False)
+
+    if 'sequia' in datframe.columns:
+        datframe['sequia'] = datframe['sequia'].astype(tipo_sequia)
+
+    return datframe
@@ -0,0 +1,191 @@
+"""
+Author: Isaac Arroyo
+Notes: Cálculo de rachas y rachas máximas de sequía en paralelo, con los
+       municipios divididos por entidad (`cve_ent`, los dos primeros
+       caracteres de `cve_concatenada`). Es una alternativa a
+       `func_rachas_sequia` + `func_max_rachas_sequia`
+       (**`rachas_sequia.py`**) para registros grandes.
+
+* **Memoria compartida**: Las columnas necesarias (claves, sequía y fechas)
+  se convierten a arreglos de números y se copian una sola vez a
+  `multiprocessing.shared_memory`. Los procesos leen los arreglos sin
+  copiarlos.
+* **Memoria acotada**: Cada tarea es un rango continuo de filas de una
+  entidad de a lo más `n_filas_max` filas (las entidades grandes se dividen
+  entre municipios), y cada proceso se reinicia después de
+  `n_tareas_proceso` tareas.
+* **Orden determinista**: Las tareas regresan únicamente posiciones (de
+  inicio y fin de cada racha y de las rachas máximas) y se unen en el
+  orden de las entidades, sin importar cuál termina primero.
+
+Las tablas finales se construyen con las mismas funciones que la versión
+en serie (`func_datframe_rachas`, `func_datframe_rachas_intervalos`), por
+lo que el resultado es idéntico. La comparación de tiempos con distinto
+número de procesos se encuentra en **`benchmark_rachas_paralelo.py`**.
+"""
+
+# = = = Imports = = = #
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from categorias_sequia import func_valores_sequia
+from rachas_sequia import (list_cols_rachas,
+                           func_limites_rachas,
+                           func_datframe_rachas,
+                           func_datframe_rachas_intervalos)
+
+ns_por_dia = 86_400_000_000_000
+
+# Arreglos de la memoria compartida en cada proceso
+dict_arrays_proceso = dict()
+
+# = = Copiar arreglos a memoria compartida (retorna: tupla) = = #
+def func_crear_memoria_compartida(dict_arrays):
+    list_memorias = list()
+    dict_specs = dict()
+
+    for nombre, array in dict_arrays.items():
+        memoria = shared_memory.SharedMemory(create = True,
+                                             size = max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype = array.dtype,
+                   buffer = memoria.buf)[:] = array
+        list_memorias.append(memoria)
+        dict_specs[nombre] = (memoria.name, array.shape, array.dtype.str)
+
+    return list_memorias, dict_specs
+
+# = = Inicializar proceso (retorna: vacío) = = #
+def func_iniciar_proceso(dict_specs):
+    for nombre, (nombre_memoria, forma, tipo) in dict_specs.items():
+        memoria = shared_memory.SharedMemory(name = nombre_memoria)
+        # Se guarda la referencia a la memoria para que no se cierre
+        dict_arrays_proceso[nombre] = (
+            memoria,
+            np.ndarray(forma, dtype = np.dtype(tipo), buffer = memoria.buf))
+    return None
+
+# = = Rachas de un rango de filas (retorna: tupla de np.ndarray) = = #
+def func_rachas_rango(rango):
+    inicio, fin = rango
+    array_cve = dict_arrays_proceso['cve'][1][inicio:fin]
+    array_sequia = dict_arrays_proceso['sequia'][1][inicio:fin]
+    array_fecha_inicio = dict_arrays_proceso['fecha_inicio'][1][inicio:fin]
+    array_fecha_fin = dict_arrays_proceso['fecha_fin'][1][inicio:fin]
+
+    idx_inicio, idx_fin = func_limites_rachas(array_cve, array_sequia)
+
+    # Racha máxima por municipio y tipo de sequía: orden por clave,
+    # sequía, duración (de mayor a menor) y posición, y se toma la primera
+    # de cada grupo (igual que `idxmax`)
+    cve_racha = array_cve[idx_inicio]
+    sequia_racha = array_sequia[idx_inicio]
+    dias_racha = ((array_fecha_fin[idx_fin] - array_fecha_inicio[idx_inicio])
+                  // ns_por_dia)
+    orden = np.lexsort((np.arange(len(idx_inicio)),
+                        -dias_racha,
+                        sequia_racha,
+                        cve_racha))
+    mask_primera = np.ones(len(orden), dtype = bool)
+    mask_primera[1:] = ((cve_racha[orden][1:] != cve_racha[orden][:-1]) |
+                        (sequia_racha[orden][1:] != sequia_racha[orden][:-1]))
+
+    return idx_inicio + inicio, idx_fin + inicio, orden[mask_primera]
+
+# = = Rangos de filas por entidad (retorna: list de tuplas) = = #
+def func_rangos_entidad(array_cve, claves, n_filas_max):
+    # `array_cve` son los códigos (ordenados) de `claves`
+    n_filas = len(array_cve)
+    array_ent = pd.factorize(pd.Series(claves).str[:2])[0][array_cve]
+    cortes_ent = np.flatnonzero(array_ent[1:] != array_ent[:-1]) + 1
+    cortes_mun = np.flatnonzero(array_cve[1:] != array_cve[:-1]) + 1
+
+    list_rangos = list()
+    for inicio, fin in zip(np.append(0, cortes_ent),
+                           np.append(cortes_ent, n_filas)):
+        # Entidades con más de `n_filas_max` filas se dividen en el cambio
+        # de municipio más cercano (los municipios no se dividen)
+        cortes = cortes_mun[(cortes_mun > inicio) & (cortes_mun < fin)]
+        while fin - inicio > n_filas_max and len(cortes) > 0:
+            j = max(np.searchsorted(cortes, inicio + n_filas_max,
+                                    side = 'right') - 1, 0)
+            list_rangos.append((int(inicio), int(cortes[j])))
+            inicio = cortes[j]
+            cortes = cortes[j + 1:]
+        list_rangos.append((int(inicio), int(fin)))
+
+    return list_rangos
+
+# = = Rachas y rachas máximas en paralelo (retorna: tupla de pd.DataFrame) = = #
+def func_rachas_sequia_paralelo(datframe,
+                                n_procesos = None,
+                                intervalos = False,
+                                n_filas_max = 5_000_000,
+                                n_tareas_proceso = 8):
+    # `intervalos = True` para los intervalos de `intervalos_sequia.py`
+    # (como `func_rachas_sequia_intervalos`), si no, el registro diario
+    # (como `func_rachas_sequia`)
+    col_inicio, col_fin = (('full_date_start', 'full_date_end') if intervalos
+                           else ('full_date', 'full_date'))
+    datframe = datframe.sort_values(by = ['cve_concatenada', col_inicio],
+                                    kind = 'stable')
+
+    if len(datframe) == 0:
+        datframe_vacio = pd.DataFrame(
+            columns = list_cols_rachas + ['racha_dias'])
+        return datframe_vacio, datframe_vacio.copy()
+
+    # - - Columnas como arreglos de números - - #
+    # Los códigos respetan el orden de `groupby` (claves ordenadas y
+    # categorías en su orden, o en orden alfabético si son texto)
+    array_cve, claves = datframe['cve_concatenada'].factorize(sort = True)
+    array_cve = array_cve.astype(np.int32)
+    array_sequia = func_valores_sequia(datframe['sequia'])
+    if not np.issubdtype(array_sequia.dtype, np.integer):
+        array_sequia = pd.factorize(array_sequia, sort = True)[0]
+    dict_arrays = dict(
+        cve = array_cve,
+        sequia = array_sequia.astype(np.int16),
+        fecha_inicio = (datframe[col_inicio].to_numpy()
+                        .astype('datetime64[ns]').view(np.int64)),
+        fecha_fin = (datframe[col_fin].to_numpy()
+                     .astype('datetime64[ns]').view(np.int64)))
+
+    list_rangos = func_rangos_entidad(array_cve, claves, n_filas_max)
+    n_procesos = min(n_procesos or os.cpu_count(), len(list_rangos))
+
+    # - - Cálculo por rango en paralelo - - #
+    list_memorias, dict_specs = func_crear_memoria_compartida(dict_arrays)
+    del dict_arrays
+    try:
+        with multiprocessing.Pool(processes = n_procesos,
+                                  initializer = func_iniciar_proceso,
+                                  initargs = (dict_specs,),
+                                  maxtasksperchild = n_tareas_proceso) as pool:
+            # `map` regresa los resultados en el orden de los rangos
+            list_resultados = pool.map(func_rachas_rango, list_rangos,
+                                       chunksize = 1)
+    finally:
+        for memoria in list_memorias:
+            memoria.close()
+            memoria.unlink()
+
+    # - - Unir resultados - - #
+    idx_inicio = np.concatenate([resultado[0] for resultado in list_resultados])
+    idx_fin = np.concatenate([resultado[1] for resultado in list_resultados])
+    offsets = np.cumsum([0] + [len(resultado[0])
+                               for resultado in list_resultados[:-1]])
+    idx_max = np.concatenate([resultado[2] + offset for resultado, offset
+                              in zip(list_resultados, offsets)])
+
+    if intervalos:
+        datframe_rachas = func_datframe_rachas_intervalos(datframe,
+                                                          idx_inicio, idx_fin)
+    else:
+        datframe_rachas = func_datframe_rachas(datframe, idx_inicio, idx_fin)
+
+    return (datframe_rachas,
+            datframe_rachas.loc[idx_max].reset_index(drop = True))
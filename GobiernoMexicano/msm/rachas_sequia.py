@@ -0,0 +1,231 @@
+"""
+Author: Isaac Arroyo
+Notes: Funciones para el cálculo de rachas y rachas máximas de sequía en los
+       municipios a partir del registro diario del Monitor de Sequía de
+       México (MSM). Son usadas en **`README.py`**.
+
+El cálculo de rachas se hace en una sola pasada por columnas (_run-length
+encoding_) sobre todos los municipios al mismo tiempo. Se conserva la
+función original por municipio (`func_count_sequia_mun`) como referencia y
+para comparar resultados y tiempos (ver **`benchmark_rachas.py`**).
+
+Las rachas también se pueden obtener directamente de los intervalos de
+sequía (`func_rachas_sequia_intervalos`), sin crear el registro diario.
+
+Columnas necesarias en el `pandas.DataFrame` de entrada:
+* `cve_concatenada`: Clave del municipio
+* `full_date`: Fecha del registro (diario)
+* `sequia`: Categoría de sequía (texto o `tipo_sequia`, ver
+  **`categorias_sequia.py`**). Con `tipo_sequia` las comparaciones se hacen
+  sobre los códigos y el resultado conserva la codificación
+"""
+
+# = = = Imports = = = #
+import numpy as np
+import pandas as pd
+
+from categorias_sequia import func_valores_sequia
+
+list_cols_rachas = ['cve_concatenada',
+                    'sequia',
+                    'racha',
+                    'full_date_start_racha',
+                    'full_date_end_racha']
+
+# = = Posiciones de inicio y fin de cada racha (retorna: tupla) = = #
+def func_limites_rachas(array_cve, array_sequia):
+    # Una racha empieza cuando cambia el municipio o cambia la categoría
+    # de sequía con respecto al registro anterior
+    mask_inicio = np.ones(len(array_cve), dtype = bool)
+    mask_inicio[1:] = ((array_cve[1:] != array_cve[:-1]) |
+                       (array_sequia[1:] != array_sequia[:-1]))
+
+    idx_inicio = np.flatnonzero(mask_inicio)
+    idx_fin = np.append(idx_inicio[1:] - 1, len(array_cve) - 1)
+    return idx_inicio, idx_fin
+
+# = = Rachas a partir de sus posiciones en el registro diario (retorna: pd.DataFrame) = = #
+def func_datframe_rachas(datframe, idx_inicio, idx_fin):
+    # `datframe` ordenado por municipio y fecha
+    array_fechas = datframe['full_date'].to_numpy()
+
+    datframe_rachas = pd.DataFrame({
+        'cve_concatenada': datframe['cve_concatenada'].to_numpy()[idx_inicio],
+        'sequia': datframe['sequia'].array[idx_inicio],
+        'racha': idx_fin - idx_inicio + 1,
+        'full_date_start_racha': pd.to_datetime(array_fechas[idx_inicio]),
+        'full_date_end_racha': pd.to_datetime(array_fechas[idx_fin])})
+
+    # Diferencia de días entre las fechas de inicio y fin
+    datframe_rachas['racha_dias'] = (
+        (datframe_rachas['full_date_end_racha'] -
+         datframe_rachas['full_date_start_racha'])
+        .dt.days
+        .astype(int))
+
+    return datframe_rachas
+
+# = = Rachas a partir de sus posiciones en los intervalos (retorna: pd.DataFrame) = = #
+def func_datframe_rachas_intervalos(datframe_intervalos, idx_inicio, idx_fin):
+    # `datframe_intervalos` ordenado por municipio y fecha de inicio
+    datframe_rachas = pd.DataFrame({
+        'cve_concatenada': (datframe_intervalos['cve_concatenada']
+                            .to_numpy()[idx_inicio]),
+        'sequia': datframe_intervalos['sequia'].array[idx_inicio],
+        'full_date_start_racha': pd.to_datetime(
+            datframe_intervalos['full_date_start'].to_numpy()[idx_inicio]),
+        'full_date_end_racha': pd.to_datetime(
+            datframe_intervalos['full_date_end'].to_numpy()[idx_fin])})
+
+    datframe_rachas['racha_dias'] = (
+        (datframe_rachas['full_date_end_racha'] -
+         datframe_rachas['full_date_start_racha'])
+        .dt.days
+        .astype(int))
+
+    # La racha cuenta días (incluyendo el de inicio y el de fin)
+    datframe_rachas.insert(loc = 2,
+                           column = 'racha',
+                           value = datframe_rachas['racha_dias'] + 1)
+
+    return datframe_rachas
+
+# = = Conteo de rachas de todos los municipios (retorna: pd.DataFrame) = = #
+def func_rachas_sequia(datframe):
+    # Ordenar por municipio y fecha. El orden es el mismo que se tenía al
+    # iterar por municipio (claves ordenadas, fechas crecientes)
+    datframe = datframe.sort_values(by = ['cve_concatenada', 'full_date'],
+                                    kind = 'stable')
+
+    if len(datframe) == 0:
+        return pd.DataFrame(
+            columns = list_cols_rachas + ['racha_dias'])
+
+    idx_inicio, idx_fin = func_limites_rachas(
+        datframe['cve_concatenada'].to_numpy(),
+        func_valores_sequia(datframe['sequia']))
+
+    return func_datframe_rachas(datframe, idx_inicio, idx_fin)
+
+# = = Conteo de rachas a partir de intervalos (retorna: pd.DataFrame) = = #
+def func_rachas_sequia_intervalos(datframe_intervalos):
+    # Los intervalos (ver `intervalos_sequia.py`) de un municipio son
+    # continuos, por lo que una racha es la unión de intervalos seguidos
+    # con el mismo tipo de sequía. El resultado es el mismo que el de
+    # `func_rachas_sequia` sobre el registro diario
+    datframe_intervalos = datframe_intervalos.sort_values(
+        by = ['cve_concatenada', 'full_date_start'],
+        kind = 'stable')
+
+    if len(datframe_intervalos) == 0:
+        return pd.DataFrame(
+            columns = list_cols_rachas + ['racha_dias'])
+
+    idx_inicio, idx_fin = func_limites_rachas(
+        datframe_intervalos['cve_concatenada'].to_numpy(),
+        func_valores_sequia(datframe_intervalos['sequia']))
+
+    return func_datframe_rachas_intervalos(datframe_intervalos,
+                                           idx_inicio, idx_fin)
+
+# = = Rachas máximas de todos los municipios (retorna: pd.DataFrame) = = #
+def func_max_rachas_sequia(datframe_rachas):
+    # Por municipio y tipo de sequía, el índice de la racha más larga.
+    # `idxmax` regresa la primera aparición, igual que en la versión por
+    # municipio. Con `tipo_sequia` las categorías se ordenan de menor a
+    # mayor intensidad y únicamente las que aparecen (`observed`)
+    idx_max = (datframe_rachas
+               .groupby(['cve_concatenada', 'sequia'], sort = True,
+                        observed = True)
+               ['racha_dias']
+               .idxmax()
+               .values)
+
+    return datframe_rachas.loc[idx_max].reset_index(drop = True)
+
+# = = = Versión original (por municipio) = = = #
+
+# - - Conteo de rachas de un municipio (retorna: pd.DataFrame) - - #
+def func_count_sequia_mun(datframe, clave_mun):
+    # Aislar el pandas.DataFrame a los datos de un solo municipio
+    datframe_mun = datframe.query(f"cve_concatenada == '{clave_mun}'")
+
+    # Obtener los valores de sequia y las fechas en la que fueron tomadas
+    lista_sequias = datframe_mun['sequia'].values.tolist()
+    lista_fechas = datframe_mun['full_date'].values.tolist()
+
+    # Iniciar contador de rachas: Se inicia con uno porque se asume que ya va
+    # un tiempo con un tipo de categoria hasta que haya un cambio
+    count = 1
+    lista_count = list()
+
+    # Iterar a partir del segundo elemento hasta el final
+    for i in range(1, len(lista_sequias)):
+        # Comparar si el elemento anterior es igual al que se tiene
+        # en la iteracion
+        if lista_sequias[i] == lista_sequias[i-1]:
+          # De ser idéntico, se aumenta la racha
+          count += 1
+        else:
+          # De no ser idéntico, se guarda la fecha de inicio y fin, y el
+          # conteo de la racha
+          lista_count.append(
+            (clave_mun,
+              lista_sequias[i-1],
+              count,
+              lista_fechas[i-count],
+              lista_fechas[i-1]))
+
+          # Se reinicia el conteo de las rachas
+          count = 1
+
+    # Toda la información se guarda en una lista donde cada elemento es
+    # una tupla
+    lista_count.append(
+      (clave_mun,
+        lista_sequias[-1],
+        count,
+        lista_fechas[-count],
+        lista_fechas[-1]))
+
+    # Se transforma la lista de tuplas en un pandas.DataFrame
+    datframe_rachas = pd.DataFrame(
+      data= lista_count,
+      columns = list_cols_rachas)
+    # Los datos de las fechas estan en formato UNIX, por lo que se tienen
+    # que transformar a np.datetime64
+    datframe_rachas['full_date_start_racha'] = pd.to_datetime(
+      arg = datframe_rachas['full_date_start_racha'])
+    datframe_rachas['full_date_end_racha'] = pd.to_datetime(
+      arg = datframe_rachas['full_date_end_racha'])
+
+    # Calcular la diferencia de dias entre las fechas (el resultado es
+    # un string con el numero de días + la palabra 'days')
+    datframe_rachas['racha_dias'] = (
+       datframe_rachas['full_date_end_racha'] -
+       datframe_rachas['full_date_start_racha'])
+
+    # Eliminar la palabra 'days' y transformar a número
+    datframe_rachas['racha_dias'] = (datframe_rachas['racha_dias']
+                                     .astype(str)
+                                     .str.replace(" days", "")
+                                     .astype(int))
+
+    return datframe_rachas
+
+# - - Rachas máximas de un municipio (retorna: pd.DataFrame) - - #
+def func_get_max_rachas(datframe):
+    idx_max = (datframe
+               # Agrupar por tipo de sequia
+               .groupby("sequia")
+               # De la columna de racha_dias
+               ["racha_dias"]
+               # ... obtener el índice del valor máximo
+               .idxmax()
+               # Se obtienen los valores de los índices
+               .values
+               # Se transformar en lista (de índices)
+               .tolist())
+    # Con la lista de índices se crea un nuevo pandas.DataFrame
+    datframe_max_rachas = datframe.loc[idx_max]
+    return datframe_max_rachas